@@ -54,6 +54,8 @@ from app.models.saved_query_model import SavedQuery
 from app.models.user_model import User
 from app.models.virtual_database_model import VirtualDatabase
 from app.models.query_template_model import QueryTemplate
+from app.models.admin_job_model import AdminJob
+from app.models.database_server_model import DatabaseServer
 
 # Set the target_metadata to your Base's metadata
 target_metadata = Base.metadata
@@ -0,0 +1,50 @@
+"""admin jobs and soft delete
+
+Revision ID: 4b8d2e6f1a37
+Revises: e91b5a3c6d20
+Create Date: 2026-10-19 16:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '4b8d2e6f1a37'
+down_revision: Union[str, None] = 'e91b5a3c6d20'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('fastdb_admin_jobs',
+    sa.Column('id', sa.String(length=32), nullable=False),
+    sa.Column('user_id', sa.String(length=32), nullable=False),
+    sa.Column('virtual_database_id', sa.String(length=32), nullable=True),
+    sa.Column('kind', sa.String(length=50), nullable=False),
+    sa.Column('payload', sa.JSON(), nullable=False),
+    sa.Column('status', sa.String(length=20), nullable=False),
+    sa.Column('attempts', sa.Integer(), nullable=False),
+    sa.Column('last_error', sa.Text(), nullable=True),
+    sa.Column('run_after', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+    sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['fastdb_users.user_id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_fastdb_admin_jobs_user_id'), 'fastdb_admin_jobs', ['user_id'], unique=False)
+    op.create_index('ix_admin_jobs_status_run_after', 'fastdb_admin_jobs', ['status', 'run_after'], unique=False)
+    op.add_column('fastdb_virtual_databases', sa.Column('deleted_at', sa.DateTime(timezone=True), nullable=True))
+    op.create_index(op.f('ix_fastdb_virtual_databases_deleted_at'), 'fastdb_virtual_databases', ['deleted_at'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_fastdb_virtual_databases_deleted_at'), table_name='fastdb_virtual_databases')
+    op.drop_column('fastdb_virtual_databases', 'deleted_at')
+    op.drop_index('ix_admin_jobs_status_run_after', table_name='fastdb_admin_jobs')
+    op.drop_index(op.f('ix_fastdb_admin_jobs_user_id'), table_name='fastdb_admin_jobs')
+    op.drop_table('fastdb_admin_jobs')
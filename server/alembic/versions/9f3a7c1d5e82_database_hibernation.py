@@ -0,0 +1,34 @@
+"""database hibernation
+
+Revision ID: 9f3a7c1d5e82
+Revises: 4b8d2e6f1a37
+Create Date: 2026-10-19 18:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9f3a7c1d5e82'
+down_revision: Union[str, None] = '4b8d2e6f1a37'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('fastdb_virtual_databases', sa.Column('storage_state', sa.String(length=20), server_default=sa.text("'active'"), nullable=False))
+    op.add_column('fastdb_virtual_databases', sa.Column('storage_state_since', sa.DateTime(timezone=True), nullable=True))
+    op.add_column('fastdb_virtual_databases', sa.Column('archive_path', sa.String(length=1024), nullable=True))
+    op.add_column('fastdb_virtual_databases', sa.Column('last_accessed_at', sa.DateTime(timezone=True), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('fastdb_virtual_databases', 'last_accessed_at')
+    op.drop_column('fastdb_virtual_databases', 'archive_path')
+    op.drop_column('fastdb_virtual_databases', 'storage_state_since')
+    op.drop_column('fastdb_virtual_databases', 'storage_state')
@@ -0,0 +1,80 @@
+"""hash-keyed history lookups
+
+Adds command_hash / sql_hash to fastdb_query_history, backfills them,
+removes rows that now collide on (user, database, sql_hash) and creates
+the lookup and upsert indexes.
+
+Revision ID: a3c1f9e27b54
+Revises: 
+Create Date: 2026-10-19 10:00:00.000000
+
+"""
+import hashlib
+import re
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a3c1f9e27b54'
+down_revision: Union[str, None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+BACKFILL_BATCH_SIZE = 5000
+
+# Frozen copy of app.utils.caching_utils.lookup_hash, so the migration keeps its meaning if the app changes.
+_WHITESPACE_OUTSIDE_LITERALS = re.compile(r"('(?:[^']|'')*')|\s+")
+
+def _lookup_hash(text):
+    if text is None:
+        return None
+    normalized = _WHITESPACE_OUTSIDE_LITERALS.sub(lambda m: m.group(1) or " ", text.strip())
+    return hashlib.sha256(normalized.encode()).hexdigest()
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('fastdb_query_history', sa.Column('command_hash', sa.String(length=64), nullable=True))
+    op.add_column('fastdb_query_history', sa.Column('sql_hash', sa.String(length=64), nullable=True))
+
+    bind = op.get_bind()
+    last_id = 0
+    while True:
+        rows = bind.execute(sa.text(
+            "SELECT id, command_text, generated_sql FROM fastdb_query_history "
+            "WHERE id > :last_id ORDER BY id LIMIT :limit"
+        ), {"last_id": last_id, "limit": BACKFILL_BATCH_SIZE}).fetchall()
+        if not rows:
+            break
+        bind.execute(
+            sa.text("UPDATE fastdb_query_history SET command_hash = :command_hash, sql_hash = :sql_hash WHERE id = :id"),
+            [{"id": r.id, "command_hash": _lookup_hash(r.command_text), "sql_hash": _lookup_hash(r.generated_sql)} for r in rows]
+        )
+        last_id = rows[-1].id
+
+    # Whitespace-only variants of the same SQL now share a hash; keep the newest of each.
+    op.execute("""
+        DELETE FROM fastdb_query_history older
+        USING fastdb_query_history newer
+        WHERE older.user_id = newer.user_id
+          AND older.virtual_database_id = newer.virtual_database_id
+          AND older.sql_hash = newer.sql_hash
+          AND (older.executed_at, older.id) < (newer.executed_at, newer.id)
+    """)
+
+    op.alter_column('fastdb_query_history', 'sql_hash', nullable=False)
+    op.create_index('ix_query_history_command_lookup', 'fastdb_query_history',
+                    ['user_id', 'virtual_database_id', 'command_hash', 'executed_at'], unique=False)
+    op.create_index('uq_query_history_user_db_sql', 'fastdb_query_history',
+                    ['user_id', 'virtual_database_id', 'sql_hash'], unique=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('uq_query_history_user_db_sql', table_name='fastdb_query_history')
+    op.drop_index('ix_query_history_command_lookup', table_name='fastdb_query_history')
+    op.drop_column('fastdb_query_history', 'sql_hash')
+    op.drop_column('fastdb_query_history', 'command_hash')
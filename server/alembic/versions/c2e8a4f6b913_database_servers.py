@@ -0,0 +1,42 @@
+"""database servers and placement
+
+Revision ID: c2e8a4f6b913
+Revises: 9f3a7c1d5e82
+Create Date: 2026-10-19 20:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c2e8a4f6b913'
+down_revision: Union[str, None] = '9f3a7c1d5e82'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('fastdb_database_servers',
+    sa.Column('id', sa.String(length=64), nullable=False),
+    sa.Column('host', sa.String(length=255), nullable=False),
+    sa.Column('port', sa.Integer(), nullable=False),
+    sa.Column('status', sa.String(length=20), server_default=sa.text("'active'"), nullable=False),
+    sa.Column('max_databases', sa.Integer(), nullable=True),
+    sa.Column('weight', sa.Integer(), server_default=sa.text('1'), nullable=False),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    # Existing databases all live on the server from Settings, registered as "default" at startup.
+    op.add_column('fastdb_virtual_databases', sa.Column('server_id', sa.String(length=64), server_default=sa.text("'default'"), nullable=False))
+    op.create_index(op.f('ix_fastdb_virtual_databases_server_id'), 'fastdb_virtual_databases', ['server_id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_fastdb_virtual_databases_server_id'), table_name='fastdb_virtual_databases')
+    op.drop_column('fastdb_virtual_databases', 'server_id')
+    op.drop_table('fastdb_database_servers')
@@ -0,0 +1,29 @@
+"""query template verified flag
+
+Revision ID: c7e24d81f0a9
+Revises: a3c1f9e27b54
+Create Date: 2026-10-19 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c7e24d81f0a9'
+down_revision: Union[str, None] = 'a3c1f9e27b54'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Existing templates were all built from explicit params, so they count as verified.
+    op.add_column('fastdb_query_templates', sa.Column('verified', sa.Boolean(), server_default=sa.text('true'), nullable=False))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('fastdb_query_templates', 'verified')
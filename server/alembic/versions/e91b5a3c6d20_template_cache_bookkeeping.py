@@ -0,0 +1,40 @@
+"""template cache bookkeeping
+
+Revision ID: e91b5a3c6d20
+Revises: c7e24d81f0a9
+Create Date: 2026-10-19 14:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e91b5a3c6d20'
+down_revision: Union[str, None] = 'c7e24d81f0a9'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('fastdb_query_templates', sa.Column('referenced_tables', sa.JSON(), nullable=True))
+    op.add_column('fastdb_query_templates', sa.Column('schema_fingerprint', sa.String(length=64), nullable=True))
+    op.add_column('fastdb_query_templates', sa.Column('hit_count', sa.Integer(), server_default=sa.text('0'), nullable=False))
+    op.add_column('fastdb_query_templates', sa.Column('failure_count', sa.Integer(), server_default=sa.text('0'), nullable=False))
+    op.add_column('fastdb_query_templates', sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True))
+    op.add_column('fastdb_query_templates', sa.Column('last_used_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True))
+    op.create_index('ix_query_templates_user_last_used', 'fastdb_query_templates', ['user_id', 'last_used_at'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_query_templates_user_last_used', table_name='fastdb_query_templates')
+    op.drop_column('fastdb_query_templates', 'last_used_at')
+    op.drop_column('fastdb_query_templates', 'created_at')
+    op.drop_column('fastdb_query_templates', 'failure_count')
+    op.drop_column('fastdb_query_templates', 'hit_count')
+    op.drop_column('fastdb_query_templates', 'schema_fingerprint')
+    op.drop_column('fastdb_query_templates', 'referenced_tables')
@@ -1,5 +1,5 @@
 from fastapi import APIRouter, Depends
-from .routes import query, schema, data, history, virtual_database, transaction , users as users_router, collaboration
+from .routes import query, schema, data, history, virtual_database, transaction , users as users_router, collaboration, jobs
 from app.core.security import get_current_user
 
 api_router = APIRouter(dependencies=[Depends(get_current_user)])
@@ -11,4 +11,5 @@ api_router.include_router(history.router, prefix="/history")
 api_router.include_router(transaction.router, prefix="/transaction", tags=["Transaction"])
 api_router.include_router(virtual_database.router, prefix="/databases", tags=["Database Management"])
 api_router.include_router(users_router.router, prefix="/users")
-api_router.include_router(collaboration.router, prefix="/databases")
\ No newline at end of file
+api_router.include_router(collaboration.router, prefix="/databases")
+api_router.include_router(jobs.router, prefix="/jobs", tags=["Jobs"])
\ No newline at end of file
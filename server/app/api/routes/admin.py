@@ -0,0 +1,40 @@
+# app/api/routes/admin.py
+"""Operator endpoints, guarded by ADMIN_API_KEY rather than a user login."""
+import uuid
+
+from fastapi import APIRouter, Depends, HTTPException, status
+from sqlalchemy.orm import Session
+
+from app.db.session import get_db_session
+from app.models.admin_job_model import AdminJob
+from app.models.virtual_database_model import VirtualDatabase
+from app.schemas.admin_job_schema import AdminJobDetail
+from app.schemas.migration_schema import MigrationCreate
+from app.services import migration_service
+
+router = APIRouter()
+
+@router.post("/databases/{database_id}/migrate", response_model=AdminJobDetail, status_code=status.HTTP_202_ACCEPTED)
+def migrate_database(
+    database_id: uuid.UUID,
+    migration_in: MigrationCreate,
+    db: Session = Depends(get_db_session)
+):
+    """Moves a database to another server in the background. Follow it with GET /admin/jobs/{job_id}."""
+    virtual_db = db.get(VirtualDatabase, database_id.hex)
+    if virtual_db is None:
+        raise HTTPException(status_code=404, detail="Database not found.")
+    try:
+        return migration_service.start_migration(
+            db, virtual_db=virtual_db, target_server_id=migration_in.target_server_id, method=migration_in.method
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+@router.get("/jobs/{job_id}", response_model=AdminJobDetail)
+def get_job(job_id: str, db: Session = Depends(get_db_session)):
+    """Any admin job, with its payload (e.g. a migration's phase, replication lag and cutover time)."""
+    job = db.get(AdminJob, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found.")
+    return job
@@ -1,73 +1,31 @@
 # app/api/routes/data.py
 from fastapi import APIRouter, Depends, HTTPException, Path, Query, Header
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy import text, insert, Table, MetaData
+from sqlalchemy.engine import Connection, Engine
 from typing import Dict, Tuple
+import asyncio
 
 from app.schemas.table_schema import InsertDataRequest, UpdateDataRequest, DeleteDataRequest, StatusResponse
 from app.schemas.query_schema import QueryResponse, QueryResultData
-from app.schemas.data_schema import StructuredQueryRequest, InsertRequest
+from app.schemas.data_schema import StructuredQueryRequest, InsertRequest, BatchQueryRequest, BatchQueryResponse
+from app.core.config import settings
+from app.core.request_timing import stage, current_timings
+from app.core.sql_executor import execute_sql
 from app.core.security import get_current_user
 from app.models.user_model import User
 from app.db.session import get_db_session
 from app.db.engine import get_engine_for_user_db
-from app.services import virtual_database_service as vdb_service
 from sqlalchemy.orm import Session
 
-from app.core.authorization import get_user_role_for_db, user_has_at_least_role
+from app.core.authorization import resolve_tenant_access, user_has_at_least_role
 from app.models.database_collab_model import DBRole
 
 from app.services import sql_builder
+from app.services.sql_builder import build_safe_sql
 
 router = APIRouter()
 
-def build_safe_sql(query: StructuredQueryRequest) -> Tuple[str, Dict]:
-    """
-    Builds a parameterized SQL query from the structured request.
-    This version quotes identifiers for safety against reserved words.
-    """
-    if not query.table.isidentifier():
-        raise ValueError("Invalid table name")
-
-    params = {}
-    param_count = 1
-    
-    # Quote column names for safety
-    columns = ", ".join(f'"{c}"' for c in query.select) if query.select else "*"
-    # Quote table name
-    sql = f'SELECT {columns} FROM "{query.table}"'
-
-    if query.where:
-        where_clauses = []
-        for col, op, val in query.where:
-            if not col.isidentifier(): raise ValueError(f"Invalid column name: {col}")
-            # Basic validation for operator to prevent injection
-            if op.upper() not in ['=', '!=', '>', '<', '>=', '<=', 'IN', 'LIKE', 'NOT LIKE', 'IS', 'IS NOT']:
-                raise ValueError(f"Invalid operator: {op}")
-
-            param_name = f"p{param_count}"
-            param_count += 1
-            where_clauses.append(f'"{col}" {op} :{param_name}')
-            params[param_name] = val
-        sql += " WHERE " + " AND ".join(where_clauses)
-    
-    if query.order_by:
-        order_clauses = []
-        for col, direction in query.order_by:
-            if not col.isidentifier(): raise ValueError(f"Invalid column name: {col}")
-            if direction.lower() not in ['asc', 'desc']: raise ValueError(f"Invalid order direction: {direction}")
-            order_clauses.append(f'"{col}" {direction.upper()}')
-        sql += " ORDER BY " + ", ".join(order_clauses)
-
-    if query.limit is not None:
-        sql += " LIMIT :limit"
-        params["limit"] = query.limit
-    if query.offset is not None:
-        sql += " OFFSET :offset"
-        params["offset"] = query.offset
-        
-    return sql, params
-
-
 @router.post("/query", response_model=QueryResponse, tags=["Data (Fluent Builder)"])
 async def execute_structured_query(
     request: StructuredQueryRequest,
@@ -78,28 +36,107 @@ async def execute_structured_query(
     """
     Securely executes a structured query from the fluent builder.
     """
-    virtual_db = vdb_service.get_accessible_database(db_session, user=current_user, virtual_name=x_target_database)
-    if not virtual_db:
+    access = resolve_tenant_access(db_session, user=current_user, virtual_name=x_target_database)
+    if not access:
         raise HTTPException(status_code=404, detail=f"Database '{x_target_database}' not found.")
     
-    engine = get_engine_for_user_db(virtual_db.physical_name)
+    engine = get_engine_for_user_db(access.physical_name, access.server_id)
     
     try:
-        sql_command, params = build_safe_sql(request)
+        with stage("compile"):
+            sql_command, params = build_safe_sql(request, engine)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
 
-    with engine.connect() as connection:
+    with stage("execute"), engine.connect() as connection:
         result = connection.execute(text(sql_command), params)
         columns = [str(key) for key in result.keys()]
-        data = [dict(zip(columns, row)) for row in result.fetchall()]
-        
-    # Correctly structure the response to match QueryResponse and QueryResultData
-    query_result = QueryResultData(columns=columns, data=data)
+        rows = result.fetchall()
+
+    with stage("serialize"):
+        data = [dict(zip(columns, row)) for row in rows]
+        # Correctly structure the response to match QueryResponse and QueryResultData
+        query_result = QueryResultData(columns=columns, data=data)
+    return QueryResponse(
+        success=True,
+        message="Query executed successfully.",
+        result=query_result,
+        timings=current_timings()
+    )
+
+def _run_compiled_query(connection: Connection, sql: str, params: Dict) -> QueryResponse:
+    """Runs one compiled structured query and reports failures instead of raising."""
+    result_dict = execute_sql(connection, sql, params)
+    if not result_dict.get("success"):
+        # Clear the aborted transaction so the rest of the batch can reuse the connection.
+        connection.rollback()
+        return QueryResponse(success=False, message=result_dict.get("message", "Query failed."))
+
+    columns = [str(key) for key in result_dict["data"]["columns"]]
+    data = [dict(zip(columns, row)) for row in result_dict["data"]["rows"]]
     return QueryResponse(
         success=True,
         message="Query executed successfully.",
-        result=query_result
+        result=QueryResultData(columns=columns, data=data)
+    )
+
+def _run_on_own_connection(engine: Engine, sql: str, params: Dict) -> QueryResponse:
+    with engine.connect() as connection:
+        return _run_compiled_query(connection, sql, params)
+
+@router.post("/batch", response_model=BatchQueryResponse, tags=["Data (Fluent Builder)"])
+async def execute_structured_query_batch(
+    request: BatchQueryRequest,
+    x_target_database: str = Header(..., alias="X-Target-Database"),
+    db_session: Session = Depends(get_db_session),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Executes several structured queries against one database in a single request.
+    The tenant is resolved once and, by default, all queries share one connection.
+    Results are keyed by the caller's query IDs; a failing query does not fail the batch.
+    """
+    if len(request.queries) > settings.DATA_BATCH_MAX_QUERIES:
+        raise HTTPException(status_code=400, detail=f"A batch may contain at most {settings.DATA_BATCH_MAX_QUERIES} queries.")
+    query_ids = [item.id for item in request.queries]
+    if len(set(query_ids)) != len(query_ids):
+        raise HTTPException(status_code=400, detail="Query IDs in a batch must be unique.")
+
+    access = resolve_tenant_access(db_session, user=current_user, virtual_name=x_target_database)
+    if not access:
+        raise HTTPException(status_code=404, detail=f"Database '{x_target_database}' not found.")
+
+    engine = get_engine_for_user_db(access.physical_name, access.server_id)
+
+    results: Dict[str, QueryResponse] = {}
+    compiled: Dict[str, Tuple[str, Dict]] = {}
+    with stage("compile"):
+        for item in request.queries:
+            try:
+                compiled[item.id] = build_safe_sql(item.query, engine)
+            except ValueError as e:
+                results[item.id] = QueryResponse(success=False, message=str(e))
+
+    if request.concurrent and len(compiled) > 1:
+        # Never ask for more connections than the tenant pool holds.
+        semaphore = asyncio.Semaphore(max(1, engine.pool.size()))
+
+        async def run(sql: str, params: Dict) -> QueryResponse:
+            async with semaphore:
+                return await run_in_threadpool(_run_on_own_connection, engine, sql, params)
+
+        with stage("execute"):
+            responses = await asyncio.gather(*(run(sql, params) for sql, params in compiled.values()))
+        results.update(zip(compiled.keys(), responses))
+    elif compiled:
+        with stage("execute"), engine.connect() as connection:
+            for query_id, (sql, params) in compiled.items():
+                results[query_id] = _run_compiled_query(connection, sql, params)
+
+    ordered_results = {query_id: results[query_id] for query_id in query_ids}
+    return BatchQueryResponse(
+        success=all(r.success for r in ordered_results.values()),
+        results=ordered_results
     )
 
 @router.post("/{table_name}/insert", response_model=QueryResponse, tags=["Data (Fluent Builder)"])
@@ -118,15 +155,14 @@ async def insert_data_into_table(
     if not request.data:
         return QueryResponse(success=True, message="No data provided to insert.", result={"rows_affected": 0})
 
-    virtual_db = vdb_service.get_accessible_database(db_session, user=current_user, virtual_name=x_target_database)
-    if not virtual_db:
+    access = resolve_tenant_access(db_session, user=current_user, virtual_name=x_target_database)
+    if not access:
         raise HTTPException(status_code=404, detail=f"Database '{x_target_database}' not found.")
     
-    user_role = get_user_role_for_db(db_session, user=current_user, virtual_db=virtual_db)
-    if not user_has_at_least_role(user_role, DBRole.editor):
+    if not user_has_at_least_role(access.role, DBRole.editor):
         raise HTTPException(status_code=403, detail="Permission denied: 'Editor' role required.")
     
-    engine = get_engine_for_user_db(virtual_db.physical_name)
+    engine = get_engine_for_user_db(access.physical_name, access.server_id)
     
     # Use SQLAlchemy Core for safe, efficient bulk inserts
     from sqlalchemy import table, column
@@ -136,7 +172,7 @@ async def insert_data_into_table(
         columns = [column(c) for c in request.data[0].keys()]
         target_table = table(table_name, *columns)
         
-        with engine.connect() as connection:
+        with stage("execute"), engine.connect() as connection:
             with connection.begin():
                 result = connection.execute(target_table.insert(), request.data)
             
@@ -144,7 +180,8 @@ async def insert_data_into_table(
             return QueryResponse(
                 success=True,
                 message=f"Successfully inserted {result.rowcount} row(s) into '{table_name}'.",
-                result={"rows_affected": result.rowcount}
+                result={"rows_affected": result.rowcount},
+                timings=current_timings()
             )
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Failed to insert data: {e}")
@@ -164,28 +201,31 @@ async def get_table_data(
     if not table_name.isidentifier():
         raise HTTPException(status_code=400, detail="Invalid table name.")
 
-    virtual_db = vdb_service.get_accessible_database(db_session, user=current_user, virtual_name=x_target_database)
-    if not virtual_db:
+    access = resolve_tenant_access(db_session, user=current_user, virtual_name=x_target_database)
+    if not access:
         raise HTTPException(status_code=404, detail=f"Database '{x_target_database}' not found.")
     
-    engine = get_engine_for_user_db(virtual_db.physical_name)
+    engine = get_engine_for_user_db(access.physical_name, access.server_id)
     
     with engine.connect() as connection:
         # Check for table existence
-        inspector = connection.connection.connection.cursor().connection.info.backend_interface.get_inspector(connection)
-        if not inspector.has_table(table_name):
-             raise HTTPException(status_code=404, detail=f"Table '{table_name}' not found.")
+        with stage("schema"):
+            inspector = connection.connection.connection.cursor().connection.info.backend_interface.get_inspector(connection)
+            if not inspector.has_table(table_name):
+                 raise HTTPException(status_code=404, detail=f"Table '{table_name}' not found.")
 
         # Safely build and execute the query
         safe_table_name = f'"{table_name}"' # Simple quoting for identifiers
         sql = text(f'SELECT * FROM {safe_table_name} LIMIT :limit OFFSET :offset')
-        result = connection.execute(sql, {"limit": limit, "offset": offset})
-        
-        columns = [str(key) for key in result.keys()]
-        data = [dict(zip(columns, row)) for row in result.fetchall()]
-        
-    query_result = QueryResultData(columns=columns, data=data)
-    return QueryResponse(success=True, message="Data retrieved successfully.", result=query_result)
+        with stage("execute"):
+            result = connection.execute(sql, {"limit": limit, "offset": offset})
+            columns = [str(key) for key in result.keys()]
+            rows = result.fetchall()
+
+    with stage("serialize"):
+        data = [dict(zip(columns, row)) for row in rows]
+        query_result = QueryResultData(columns=columns, data=data)
+    return QueryResponse(success=True, message="Data retrieved successfully.", result=query_result, timings=current_timings())
 
 @router.put("/update", response_model=StatusResponse, tags=["Data (Client App)"])
 async def update_data(
@@ -195,19 +235,18 @@ async def update_data(
     current_user: User = Depends(get_current_user)
 ):
     """Securely updates data in a table based on conditions."""
-    virtual_db = vdb_service.get_accessible_database(db_session, user=current_user, virtual_name=x_target_database)
-    if not virtual_db:
+    access = resolve_tenant_access(db_session, user=current_user, virtual_name=x_target_database)
+    if not access:
         raise HTTPException(status_code=404, detail=f"Database '{x_target_database}' not found.")
     
-    user_role = get_user_role_for_db(db_session, user=current_user, virtual_db=virtual_db)
-    if not user_has_at_least_role(user_role, DBRole.editor):
+    if not user_has_at_least_role(access.role, DBRole.editor):
         raise HTTPException(status_code=403, detail="Permission denied: 'Editor' role required.")
     
-    engine = get_engine_for_user_db(virtual_db.physical_name)
+    engine = get_engine_for_user_db(access.physical_name, access.server_id)
     
     try:
         sql, params = sql_builder.build_update_sql(request.table_name, request.data, request.conditions, engine)
-        with engine.connect() as connection:
+        with stage("execute"), engine.connect() as connection:
             with connection.begin():
                 result = connection.execute(text(sql), params)
         message = f"Successfully updated {result.rowcount} row(s)."
@@ -226,19 +265,18 @@ async def delete_data(
     current_user: User = Depends(get_current_user)
 ):
     """Securely deletes data from a table based on conditions."""
-    virtual_db = vdb_service.get_accessible_database(db_session, user=current_user, virtual_name=x_target_database)
-    if not virtual_db:
+    access = resolve_tenant_access(db_session, user=current_user, virtual_name=x_target_database)
+    if not access:
         raise HTTPException(status_code=404, detail=f"Database '{x_target_database}' not found.")
     
-    user_role = get_user_role_for_db(db_session, user=current_user, virtual_db=virtual_db)
-    if not user_has_at_least_role(user_role, DBRole.editor):
+    if not user_has_at_least_role(access.role, DBRole.editor):
         raise HTTPException(status_code=403, detail="Permission denied: 'Editor' role required.")
     
-    engine = get_engine_for_user_db(virtual_db.physical_name)
+    engine = get_engine_for_user_db(access.physical_name, access.server_id)
     
     try:
         sql, params = sql_builder.build_delete_sql(request.table_name, request.conditions, engine)
-        with engine.connect() as connection:
+        with stage("execute"), engine.connect() as connection:
             with connection.begin():
                 result = connection.execute(text(sql), params)
         message = f"Successfully deleted {result.rowcount} row(s)."
@@ -1,8 +1,64 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import PlainTextResponse
+from sqlalchemy.orm import Session
+from app.core.config import settings
+from app.core.metrics import render_metrics
+from app.db.session import get_db_session
 from app.schemas.table_schema import StatusResponse
+from app.utils.ttl_cache import get_all_cache_stats
+from app.core import transaction_router
+from app.services import admin_job_service, hibernation_service, history_writer, migration_service, placement_service, provisioning_service
 
 router = APIRouter()
 
 @router.get("/health", response_model=StatusResponse, tags=["Health"])
 async def health_check():
-    return {"message": "API is running"}
\ No newline at end of file
+    return {"message": "API is running"}
+
+@router.get("/metrics", response_class=PlainTextResponse, tags=["Health"])
+def metrics():
+    """Prometheus metrics of this process: request latency, cache tiers, LLM calls, pools, transactions and the history queue."""
+    if not settings.METRICS_ENABLED:
+        raise HTTPException(status_code=404, detail="Metrics are disabled.")
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@router.get("/health/caches", tags=["Health"])
+async def cache_stats():
+    """Reports size, hit ratio and eviction counters for every in-process cache."""
+    return get_all_cache_stats()
+
+@router.get("/health/transactions", tags=["Health"])
+async def transaction_stats():
+    """Reports open, committed, rolled back and reaped transaction counts."""
+    return transaction_router.get_stats()
+
+@router.get("/health/history-writer", tags=["Health"])
+async def history_writer_stats():
+    """Reports the write-behind history queue depth and how many entries were written, sampled out or dropped."""
+    return history_writer.get_writer_stats()
+
+
+@router.get("/health/provisioning", tags=["Health"])
+def provisioning_stats():
+    """Reports warm pool depth, claims versus fallbacks to CREATE DATABASE, and claim latency."""
+    return provisioning_service.get_pool_stats()
+
+@router.get("/health/placement", tags=["Health"])
+def placement_stats(db: Session = Depends(get_db_session)):
+    """Reports the placement policy and each database server's status and live database count."""
+    return placement_service.get_placement_stats(db)
+
+@router.get("/health/migrations", tags=["Health"])
+def migration_stats(db: Session = Depends(get_db_session)):
+    """Reports migrations in flight with their progress, plus cutover times of those this process completed."""
+    return migration_service.get_migration_stats(db)
+
+@router.get("/health/admin-jobs", tags=["Health"])
+def admin_job_stats(db: Session = Depends(get_db_session)):
+    """Reports admin jobs by status, plus what this process's worker has run."""
+    return admin_job_service.get_job_stats(db)
+
+@router.get("/health/hibernation", tags=["Health"])
+def hibernation_stats():
+    """Reports databases by storage state and this process's hibernate / wake counters."""
+    return hibernation_service.get_hibernation_stats()
\ No newline at end of file
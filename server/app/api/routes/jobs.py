@@ -0,0 +1,23 @@
+# app/api/routes/jobs.py
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.orm import Session
+
+from app.db.session import get_db_session
+from app.models.user_model import User
+from app.core.security import get_current_user
+from app.schemas.admin_job_schema import AdminJobRead
+from app.services import admin_job_service
+
+router = APIRouter()
+
+@router.get("/{job_id}", response_model=AdminJobRead)
+def get_job_status(
+    job_id: str,
+    db: Session = Depends(get_db_session),
+    current_user: User = Depends(get_current_user)
+):
+    """Status of a background job started by one of your requests (e.g. dropping or renaming a database)."""
+    job = admin_job_service.get_job(db, user=current_user, job_id=job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found.")
+    return job
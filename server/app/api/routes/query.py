@@ -1,9 +1,10 @@
 #api/routes/query.py
+import logging
 from fastapi import APIRouter, Depends, HTTPException, Header
 from sqlalchemy.engine import Engine
 from sqlalchemy.orm import Session
 from sqlalchemy import text
-from typing import Dict, Any, Optional, List
+from typing import Dict, Any, Optional, List, Tuple
 import re
 
 from app.schemas.query_schema import NLRequest, NLResponse, ExecuteRequest, QueryResponse, QueryCommand
@@ -19,12 +20,16 @@ from app.schemas.virtual_database_schema import VirtualDatabaseCreate
 
 from app.services import history_service, template_cache_service
 from app.core.nlp_engine import convert_nl_to_sql
-from app.core import transaction_manager
-from app.core.authorization import get_user_role_for_db, user_has_at_least_role
+from app.core import transaction_router
+from app.core.request_timing import stage, set_cache_tier, current_timings
+from app.core.authorization import resolve_tenant_access, user_has_at_least_role
 from app.models.database_collab_model import DBRole
+from app.models.query_template_model import QueryTemplate
 from app.models.virtual_database_model import VirtualDatabase
 
-from app.utils.caching_utils import deconstruct_sql, normalize_prompt_template
+from app.utils.caching_utils import deconstruct_sql, normalize_prompt_template, extract_literals, template_binds_all_params
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
@@ -87,6 +92,12 @@ def is_likely_sql(command: str, threshold: float = 0.5) -> bool:
 
     return True
 
+def _is_write_operation(sql_commands: List[str]) -> bool:
+    return any(
+        any(cmd.strip().upper().startswith(keyword) for keyword in ['INSERT', 'UPDATE', 'DELETE', 'CREATE TABLE', 'DROP TABLE', 'ALTER TABLE', 'TRUNCATE'])
+        for cmd in sql_commands
+    )
+
 def substitute_params(prompt: str, params: Dict[str, Any]) -> str:
     
     if not params:
@@ -97,6 +108,80 @@ def substitute_params(prompt: str, params: Dict[str, Any]) -> str:
         prompt = prompt.replace(f'{{{key}}}', escaped_value)
     return prompt
 
+async def _generate_sql_commands(
+    db_session: Session,
+    *,
+    user: User,
+    access,
+    database_name: str,
+    final_prompt: str,
+    params: Dict[str, Any],
+    template_prompt: str,
+    template_params: Dict[str, Any],
+    unverified_template=None
+) -> Tuple[List[str], Optional[QueryTemplate]]:
+    """
+    Asks the NLP engine for SQL and stores the resulting template when the prompt has parameters.
+    Returns the commands and the template saved for them, if any.
+    """
+    saved_template = None
+    engine = get_engine_for_user_db(access.physical_name, access.server_id)
+    with stage("schema"):
+        schema_context = generate_schema_as_mermaid(engine)
+    with stage("llm"):
+        nl_response = await convert_nl_to_sql(database_name, final_prompt, schema_context)
+    
+    if nl_response.get("query_type") == "ERROR":
+        raise HTTPException(status_code=400, detail=f"NLP Error: {nl_response.get('explanation', 'Unknown error')}")
+    
+    sql_from_llm = nl_response.get("sql")
+    
+    if params:
+        _, original_param_names_in_order = normalize_prompt_template(template_prompt)
+        sql_template, param_map = deconstruct_sql(nl_response, params, original_param_names_in_order)
+        with stage("template_cache"):
+            saved_template = template_cache_service.save_template_to_cache(
+                db_session, user=user, prompt_template=template_prompt,
+                sql_template=sql_template, param_map=param_map,
+                engine=engine, virtual_database_id=access.virtual_db.id
+            )
+
+    sql_commands: List[str] = []
+    if isinstance(sql_from_llm, str):
+        sql_commands = [cmd.strip() for cmd in sql_from_llm.split(';') if cmd.strip()]
+    elif isinstance(sql_from_llm, list):
+        sql_commands = [cmd.strip() for cmd in sql_from_llm if cmd.strip()]
+
+    if template_params and not params and len(sql_commands) == 1:
+        _, original_param_names_in_order = normalize_prompt_template(template_prompt)
+        sql_template, param_map = deconstruct_sql({"sql": sql_commands[0]}, template_params, original_param_names_in_order)
+        # Only keep templates where every extracted value became a bind parameter.
+        if template_binds_all_params(sql_template, len(param_map)):
+            verified = unverified_template is not None and unverified_template.sql_template == sql_template
+            with stage("template_cache"):
+                saved_template = template_cache_service.save_template_to_cache(
+                    db_session, user=user, prompt_template=template_prompt,
+                    sql_template=sql_template, param_map=param_map, verified=verified,
+                    engine=engine, virtual_database_id=access.virtual_db.id
+                )
+    return sql_commands, saved_template
+
+def _execute_in_own_transaction(engine: Engine, sql_commands: List[str], execution_params: Dict[str, Any]) -> dict:
+    """Runs the commands in one transaction; rolls back and returns the failing result if any fails."""
+    last_result_dict = {}
+    with engine.connect() as connection:
+        with connection.begin() as transaction:
+            if execution_params:
+                last_result_dict = execute_sql(connection, sql_commands[0], params=execution_params)
+            else:
+                for command in sql_commands:
+                    last_result_dict = execute_sql(connection, command)
+                    if not last_result_dict.get("success"):
+                        break
+            if not last_result_dict.get("success"):
+                transaction.rollback()
+    return last_result_dict
+
 @router.post("/", response_model=QueryResponse, tags=["SDK"])
 async def run_nlp_command(
     request: QueryCommand,
@@ -112,73 +197,94 @@ async def run_nlp_command(
     execution_params: Dict[str, Any] = {}
     is_from_cache = False
     should_log_success = True
+    template_hit = None
+    # The template whose SQL runs, whether cached or just built; its failures are cleared if it works.
+    template_used = None
 
     final_prompt = substitute_params(prompt_template, params)
 
+    # Resolved once; every later lookup of the target database reuses it.
+    target_access = resolve_tenant_access(db_session, user=current_user, virtual_name=x_target_database)
+
     if is_likely_sql(prompt_template):
         sql_commands = [cmd.strip() for cmd in substitute_params(prompt_template, params).split(';') if cmd.strip()]
-        virtual_db_for_sql = vdb_service.get_accessible_database(db_session, user=current_user, virtual_name=x_target_database)
-        cached_history_sql = history_service.find_in_history_sql(db_session, owner=current_user, sql_command=prompt_template, virtual_db=virtual_db_for_sql)
+        if not target_access:
+            raise HTTPException(status_code=404, detail=f"Database '{x_target_database}' not found.")
+        set_cache_tier("sql")
+        with stage("history_cache"):
+            cached_history_sql = history_service.find_in_history_sql(db_session, owner=current_user, sql_command=prompt_template, virtual_db=target_access.virtual_db)
         if cached_history_sql: should_log_success = False
     else:
-        if params:
+        # Prompts without explicit params get their literals lifted out automatically, so
+        # "orders over 100" and "orders over 250" share one template.
+        template_prompt, template_params = prompt_template, params
+        if not params:
+            template_prompt, template_params = extract_literals(prompt_template)
+        # An auto-extracted template that has not yet been confirmed by a second LLM answer.
+        unverified_template = None
+
+        if template_params and target_access:
             # --- TIER 1: TEMPLATE CACHE (for parameterized queries) ---
-            cached_template, original_param_names = template_cache_service.find_template_in_cache(
-                db_session, user=current_user, prompt_template=prompt_template
-            )
-            if cached_template:
-                print(f"INFO: Normalized Template Cache HIT for user '{current_user.email}'.")
+            with stage("template_cache"):
+                cached_template, original_param_names = template_cache_service.find_template_in_cache(
+                    db_session, user=current_user, virtual_database_id=target_access.virtual_db.id, prompt_template=template_prompt
+                )
+                template_is_stale = bool(
+                    cached_template and cached_template.verified
+                    and template_cache_service.is_template_stale(
+                        cached_template, engine=get_engine_for_user_db(target_access.physical_name, target_access.server_id),
+                        virtual_database_id=target_access.virtual_db.id
+                    )
+                )
+            if cached_template and not cached_template.verified:
+                # First reuse: ask the LLM once more and keep the template only if it templatizes the same way.
+                logger.info("Unverified template; validating it against the NLP engine.")
+                unverified_template = cached_template
+            elif template_is_stale:
+                # The tables it reads changed shape since it was built; rebuild it from the NLP engine.
+                logger.info("Stale template; regenerating.")
+                template_cache_service.record_template_regeneration()
+            elif cached_template:
+                logger.debug("Template cache hit.")
                 is_from_cache = True
+                set_cache_tier("template")
+                template_hit = template_used = cached_template
+                template_cache_service.record_template_hit(cached_template)
                 sql_template = cached_template.sql_template
                 try:
                     execution_params = {
-                        f"param_{i}": params[original_name] 
+                        f"param_{i}": template_params[original_name] 
                         for i, original_name in enumerate(original_param_names)
                     }
                     sql_commands = [sql_template]
                 except KeyError as e:
                     raise HTTPException(status_code=400, detail=f"Cache error: Missing required parameter '{e}' in your request.")
-        else:
+
+        if not params and not is_from_cache:
             # --- TIER 2: HISTORY CACHE (for static, non-parameterized queries) ---
-            virtual_db_for_cache = vdb_service.get_accessible_database(db_session, user=current_user, virtual_name=x_target_database)
-            if not virtual_db_for_cache:
+            if not target_access:
                 raise HTTPException(status_code=404, detail=f"Database '{x_target_database}' not found.")
 
-            cached_history = history_service.find_in_history(db_session, owner=current_user, command=prompt_template, virtual_db=virtual_db_for_cache)
+            with stage("history_cache"):
+                cached_history = history_service.find_in_history(db_session, owner=current_user, command=prompt_template, virtual_db=target_access.virtual_db)
             if cached_history:
-                print(f"INFO: Static History Cache HIT for user '{current_user.email}'.")
+                logger.debug("History cache hit.")
                 is_from_cache = True
+                set_cache_tier("history")
                 sql_from_cache = cached_history.generated_sql
                 sql_commands = [cmd.strip() for cmd in sql_from_cache.split(';') if cmd.strip()]
         
         if not is_from_cache:
             # --- CACHE MISS ---
-            print(f"INFO: Cache MISS for user '{current_user.user_id}'. Routing to NLP engine.")
-            virtual_db = vdb_service.get_accessible_database(db_session, user=current_user, virtual_name=x_target_database)
-            if not virtual_db:
+            logger.debug("Cache miss; routing to the NLP engine.")
+            set_cache_tier("miss")
+            if not target_access:
                  raise HTTPException(status_code=404, detail=f"Database '{x_target_database}' not found.")
-            
-            engine = get_engine_for_user_db(virtual_db.physical_name)
-            schema_context = generate_schema_as_mermaid(engine)
-            nl_response = await convert_nl_to_sql(x_target_database, final_prompt, schema_context)
-            
-            if nl_response.get("query_type") == "ERROR":
-                raise HTTPException(status_code=400, detail=f"NLP Error: {nl_response.get('explanation', 'Unknown error')}")
-            
-            sql_from_llm = nl_response.get("sql")
-            
-            if params:
-                _, original_param_names_in_order = normalize_prompt_template(prompt_template)
-                sql_template, param_map = deconstruct_sql(nl_response, params, original_param_names_in_order)
-                template_cache_service.save_template_to_cache(
-                    db_session, user=current_user, prompt_template=prompt_template,
-                    sql_template=sql_template, param_map=param_map
-                )
-
-            if isinstance(sql_from_llm, str):
-                sql_commands = [cmd.strip() for cmd in sql_from_llm.split(';') if cmd.strip()]
-            elif isinstance(sql_from_llm, list):
-                sql_commands = [cmd.strip() for cmd in sql_from_llm if cmd.strip()]
+            sql_commands, template_used = await _generate_sql_commands(
+                db_session, user=current_user, access=target_access, database_name=x_target_database,
+                final_prompt=final_prompt, params=params, template_prompt=template_prompt,
+                template_params=template_params, unverified_template=unverified_template
+            )
             
     if not sql_commands:
         raise HTTPException(status_code=400, detail="No SQL command to execute.")
@@ -194,7 +300,7 @@ async def run_nlp_command(
             create_db_command = sql_commands.pop(0) 
             new_virtual_name = create_db_command.split()[2].strip(';"')
             
-            print(f"INFO: Executing CREATE DATABASE for '{new_virtual_name}'.")
+            logger.info("Executing CREATE DATABASE for '%s'.", new_virtual_name)
             if vdb_service.get_accessible_database(db_session, user=current_user, virtual_name=new_virtual_name):
                 raise HTTPException(status_code=409, detail=f"You already have a database named '{new_virtual_name}'.")
             try:
@@ -205,10 +311,10 @@ async def run_nlp_command(
             new_virtual_db = vdb_service.create_virtual_database(db_session, owner=current_user, db_in=db_in)
             
             if sql_commands:
-                print(f"INFO: Populating newly created database '{new_virtual_name}'.")
-                engine = get_engine_for_user_db(new_virtual_db.physical_name)
+                logger.info("Populating newly created database '%s'.", new_virtual_name)
+                engine = get_engine_for_user_db(new_virtual_db.physical_name, new_virtual_db.server_id)
                 last_result_dict = {}
-                with engine.connect() as connection:
+                with stage("execute"), engine.connect() as connection:
                     with connection.begin(): 
                         for command in sql_commands:
                             last_result_dict = execute_sql(connection, command)
@@ -228,19 +334,23 @@ async def run_nlp_command(
             upper_sql = single_command.strip().upper()
 
             if upper_sql.startswith('DROP DATABASE'):
-                print("INFO: DROP DATABASE command detected. Using superuser engine.")
+                logger.info("DROP DATABASE command detected.")
                 virtual_name_to_drop = single_command.split()[2].strip(';"')
                 db_to_drop = vdb_service.get_accessible_database(db_session, user=current_user, virtual_name=virtual_name_to_drop)
                 if not db_to_drop: raise HTTPException(status_code=404, detail=f"Database '{virtual_name_to_drop}' not found.")
                 if db_to_drop.user_id != current_user.user_id: raise HTTPException(status_code=403, detail="Permission denied: Only the database owner can drop a database.")
                 db_context_for_log = db_to_drop
-                vdb_service.delete_virtual_database(db_session, db_to_drop=db_to_drop)
-                result_dict = {"success": True, "message": f"Database '{virtual_name_to_drop}' dropped successfully."}
+                job = vdb_service.delete_virtual_database(db_session, db_to_drop=db_to_drop)
+                result_dict = {
+                    "success": True,
+                    "message": f"Database '{virtual_name_to_drop}' dropped successfully. Its storage is reclaimed in the background.",
+                    "result": {"job_id": job.id}
+                }
                 should_log_success = False
                 
             elif upper_sql.startswith('ALTER DATABASE'):
                 # ... (ALTER DATABASE logic is unchanged)
-                print("INFO: ALTER DATABASE command detected. Handling rename.")
+                logger.info("ALTER DATABASE command detected. Handling rename.")
                 match = re.search(r'ALTER DATABASE\s+([\w_]+)\s+RENAME TO\s+([\w_]+);?', single_command.strip(), re.IGNORECASE)
                 if not match: raise HTTPException(status_code=400, detail="Could not parse RENAME DATABASE command.")
                 old_name, new_name = match.groups()
@@ -248,82 +358,116 @@ async def run_nlp_command(
                 if not db_to_rename: raise HTTPException(status_code=404, detail=f"Database '{old_name}' not found for your account.")
                 db_context_for_log=db_to_rename
                 try:
-                    vdb_service.rename_virtual_database(db_session, owner=current_user, old_virtual_name=old_name, new_virtual_name=new_name)
-                    result_dict = {"success": True, "message": f"Database '{old_name}' renamed to '{new_name}' successfully."}
+                    _, job = vdb_service.rename_virtual_database(db_session, owner=current_user, old_virtual_name=old_name, new_virtual_name=new_name)
+                    result_dict = {
+                        "success": True,
+                        "message": f"Database '{old_name}' renamed to '{new_name}' successfully.",
+                        "result": {"job_id": job.id}
+                    }
                 except (PermissionError, ValueError) as e:
                     raise HTTPException(status_code=400, detail=str(e))
         else:
             if not sql_commands:
                  raise HTTPException(status_code=400, detail="No SQL command to execute.")
 
-            virtual_db = vdb_service.get_accessible_database(db_session, user=current_user, virtual_name=x_target_database)
-            if not virtual_db:
+            if not target_access:
                 raise HTTPException(status_code=404, detail=f"Database '{x_target_database}' not found for your account.")
+            virtual_db = target_access.virtual_db
             
-            user_role = get_user_role_for_db(db_session, user=current_user, virtual_db=virtual_db)
-            is_write_operation = any(
-                any(cmd.strip().upper().startswith(keyword) for keyword in ['INSERT', 'UPDATE', 'DELETE', 'CREATE TABLE', 'DROP TABLE', 'ALTER TABLE', 'TRUNCATE'])
-                for cmd in sql_commands
-            )
-            if is_write_operation and not user_has_at_least_role(user_role, DBRole.editor):
+            if _is_write_operation(sql_commands) and not user_has_at_least_role(target_access.role, DBRole.editor):
                 raise HTTPException(status_code=403, detail="Permission denied: You need 'Editor' or 'Owner' role to modify this database.")
 
             last_result_dict = {}
             if x_transaction_id:
-                connection = transaction_manager.get_transaction_connection(x_transaction_id)
-                if not connection: raise HTTPException(status_code=404, detail=f"Transaction '{x_transaction_id}' not found or has expired.")
-                
-                if is_from_cache and params:
-                    last_result_dict = execute_sql(connection, sql_commands[0], params=execution_params)
+                if is_from_cache and execution_params:
+                    statements = [(sql_commands[0], execution_params)]
                 else:
-                    for command in sql_commands:
-                        last_result_dict = execute_sql(connection, command)
+                    statements = [(command, None) for command in sql_commands]
+                try:
+                    with stage("execute"):
+                        tx_results = transaction_router.execute(x_transaction_id, statements, user_id=current_user.user_id, tenant=target_access.physical_name)
+                except transaction_router.TransactionBrokerUnavailable as e:
+                    raise HTTPException(status_code=503, detail=str(e))
+                if tx_results is None: raise HTTPException(status_code=404, detail=f"Transaction '{x_transaction_id}' not found or has expired.")
+                last_result_dict = tx_results[-1] if tx_results else {}
+                if (not last_result_dict.get("success") and template_hit is not None
+                        and template_cache_service.is_schema_drift_error(last_result_dict)):
+                    # The transaction is aborted now, so there is no retry; just make sure the template gets rebuilt.
+                    template_cache_service.record_template_failure(db_session, template_hit)
                 if not last_result_dict.get("success"): raise Exception(last_result_dict.get("message", "A command in the transaction failed."))
                 result_dict = last_result_dict
             else:
-                engine = get_engine_for_user_db(virtual_db.physical_name)
-                with engine.connect() as connection:
-                    with connection.begin():
-                        if is_from_cache and params:
-                            last_result_dict = execute_sql(connection, sql_commands[0], params=execution_params)
-                        else:
-                            for command in sql_commands:
-                                last_result_dict = execute_sql(connection, command)
-                        if not last_result_dict.get("success"): raise Exception(last_result_dict.get("message", "A command in the sequence failed."))
+                engine = get_engine_for_user_db(target_access.physical_name, target_access.server_id)
+                with stage("execute"):
+                    last_result_dict = _execute_in_own_transaction(engine, sql_commands, execution_params if is_from_cache else {})
+                if (not last_result_dict.get("success") and template_hit is not None
+                        and template_cache_service.is_schema_drift_error(last_result_dict)):
+                    # A cached template no longer fits the schema; rebuild it and try once more.
+                    # Other failures (constraint violations, bad values) are returned as they are.
+                    logger.warning("Cached template failed: %s. Regenerating.", last_result_dict.get('message'))
+                    template_cache_service.record_template_failure(db_session, template_hit)
+                    template_cache_service.record_template_regeneration()
+                    set_cache_tier("miss")
+                    sql_commands, template_used = await _generate_sql_commands(
+                        db_session, user=current_user, access=target_access, database_name=x_target_database,
+                        final_prompt=final_prompt, params=params, template_prompt=template_prompt,
+                        template_params=template_params
+                    )
+                    if not sql_commands:
+                        raise HTTPException(status_code=400, detail="No SQL command to execute.")
+                    if _is_write_operation(sql_commands) and not user_has_at_least_role(target_access.role, DBRole.editor):
+                        raise HTTPException(status_code=403, detail="Permission denied: You need 'Editor' or 'Owner' role to modify this database.")
+                    is_from_cache, execution_params = False, {}
+                    sql_for_display = ";\n".join(sql_commands) + ";"
+                    with stage("execute"):
+                        last_result_dict = _execute_in_own_transaction(engine, sql_commands, {})
+                if not last_result_dict.get("success"): raise Exception(last_result_dict.get("message", "A command in the sequence failed."))
                 result_dict = last_result_dict
             db_context_for_log = virtual_db
     except Exception as e:
-        if not db_context_for_log:
-            try:
-                db_context_for_log = vdb_service.get_accessible_database(db_session, user=current_user, virtual_name=x_target_database)
-            except Exception:
-                db_context_for_log = None
+        if not db_context_for_log and target_access:
+            db_context_for_log = target_access.virtual_db
 
         if db_context_for_log and not params: 
-            history_service.log_query_history(db=db_session, owner=current_user, virtual_db=db_context_for_log, command=request.command, sql=sql_for_display, status="error")
+            with stage("history_log"):
+                history_service.log_query_history(owner=current_user, virtual_db=db_context_for_log, command=request.command, sql=sql_for_display, status="error")
         if isinstance(e, HTTPException): raise e
         raise HTTPException(status_code=400, detail=f"SQL Execution Error: {e}")
 
     if db_context_for_log and not result_dict.get("success") and not params:
-        history_service.log_query_history(db=db_session, owner=current_user, virtual_db=db_context_for_log, command=final_prompt, sql=sql_for_display, status="error")
+        with stage("history_log"):
+            history_service.log_query_history(owner=current_user, virtual_db=db_context_for_log, command=final_prompt, sql=sql_for_display, status="error")
         raise HTTPException(status_code=400, detail=result_dict.get("message", "SQL execution failed."))
-    
-    if should_log_success and db_context_for_log and not params: history_service.log_query_history(db=db_session, owner=current_user, virtual_db=db_context_for_log, command=final_prompt, sql=sql_for_display, status="success")
-    else: print(f"WARN: Could not determine database context for logging successful query: {sql_for_display}")
-
-    response_data = result_dict.get("data")
-    final_result_data = None 
-    if response_data and "columns" in response_data and "rows" in response_data:
-        columns = response_data["columns"]
-        rows = response_data["rows"]
-        formatted_data = [dict(zip(columns, row)) for row in rows]
-        final_result_data = {"columns": columns, "data": formatted_data}
+
+    if template_used is not None and result_dict.get("success"):
+        template_cache_service.record_template_success(db_session, template_used)
+
+    if target_access and template_cache_service.is_schema_change(sql_commands):
+        template_cache_service.invalidate_for_schema_change(user_id=current_user.user_id, virtual_database_id=target_access.virtual_db.id)
+
+    if should_log_success and db_context_for_log and not params:
+        with stage("history_log"):
+            history_service.log_query_history(owner=current_user, virtual_db=db_context_for_log, command=final_prompt, sql=sql_for_display, status="success")
+    else: logger.debug("Successful query not added to history.")
+
+    with stage("serialize"):
+        response_data = result_dict.get("data")
+        final_result_data = None 
+        if response_data and "columns" in response_data and "rows" in response_data:
+            columns = response_data["columns"]
+            rows = response_data["rows"]
+            formatted_data = [dict(zip(columns, row)) for row in rows]
+            final_result_data = {"columns": columns, "data": formatted_data}
+        elif result_dict.get("result"):
+            # e.g. the ID of the background job finishing a DROP or RENAME
+            final_result_data = result_dict["result"]
     
     return QueryResponse(
         success=True, 
         message=result_dict.get("message", "Command executed successfully."),
         generated_sql=sql_for_display,
-        result=final_result_data
+        result=final_result_data,
+        timings=current_timings()
     )
 
 @router.post("/nl", response_model=NLResponse, tags=["Query"])
@@ -337,12 +481,12 @@ async def process_nl_query(
     Converts a natural language command to SQL for a specific user's database
     without executing it. This is a secure, multi-tenant version.
     """
-    virtual_db = vdb_service.get_accessible_database(db_session, user=current_user, virtual_name=x_target_database)
-    if not virtual_db:
+    access = resolve_tenant_access(db_session, user=current_user, virtual_name=x_target_database)
+    if not access:
         raise HTTPException(status_code=404, detail=f"Database '{x_target_database}' not found for your account.")
     
     try:
-        engine = get_engine_for_user_db(virtual_db.physical_name)
+        engine = get_engine_for_user_db(access.physical_name, access.server_id)
     except Exception as e:
         raise HTTPException(status_code=503, detail=f"Could not connect to database '{x_target_database}': {e}")
 
@@ -352,4 +496,12 @@ async def process_nl_query(
     if structured_response.get("query_type") == "ERROR":
         raise HTTPException(status_code=400, detail=structured_response.get("explanation", "Failed to process NLP command."))
         
-    return structured_response
\ No newline at end of file
+    return structured_response
+
+@router.get("/templates/stats", tags=["Query"])
+def get_template_cache_stats(
+    db_session: Session = Depends(get_db_session),
+    current_user: User = Depends(get_current_user)
+):
+    """Reports how well the template cache is working for the current user."""
+    return template_cache_service.get_template_cache_stats(db_session, user=current_user)
@@ -11,15 +11,16 @@ from app.core.security import get_current_user
 from app.models.user_model import User
 from app.db.session import get_db_session
 from app.db.engine import get_engine_for_user_db
-from app.services import virtual_database_service as vdb_service
 
 # --- Schema and other Imports ---
 from app.schemas.table_schema import FullSchemaResponse, TableSchema, ColumnSchema, StatusResponse
 from app.core.sql_executor import execute_sql 
 from app.core.diagram_generator import generate_schema_as_mermaid 
 
-from app.core.authorization import get_user_role_for_db, user_has_at_least_role
+from app.core.authorization import resolve_tenant_access, user_has_at_least_role
 from app.models.database_collab_model import DBRole
+from app.services import template_cache_service
+from app.core.request_timing import stage
 
 router = APIRouter()
 
@@ -70,15 +71,16 @@ async def get_database_schema(
     current_user: User = Depends(get_current_user)
 ):
     """Securely returns the full schema for the user's target database."""
-    virtual_db = vdb_service.get_accessible_database(db_session, user=current_user, virtual_name=x_target_database)
-    if not virtual_db:
+    access = resolve_tenant_access(db_session, user=current_user, virtual_name=x_target_database)
+    if not access:
         raise HTTPException(status_code=404, detail=f"Database '{x_target_database}' not found for your account.")
     
-    engine = get_engine_for_user_db(virtual_db.physical_name)
+    engine = get_engine_for_user_db(access.physical_name, access.server_id)
     inspector = inspect(engine)
 
     try:
-        tables = _get_full_schema_details(inspector, engine)
+        with stage("schema"):
+            tables = _get_full_schema_details(inspector, engine)
         return FullSchemaResponse(tables=tables)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to retrieve schema: {str(e)}")
@@ -90,20 +92,21 @@ async def export_schema_as_sql(
     current_user: User = Depends(get_current_user)
 ):
     """Securely generates a full SQL script for the user's target database."""
-    virtual_db = vdb_service.get_accessible_database(db_session, user=current_user, virtual_name=x_target_database)
-    if not virtual_db:
+    access = resolve_tenant_access(db_session, user=current_user, virtual_name=x_target_database)
+    if not access:
         raise HTTPException(status_code=404, detail=f"Database '{x_target_database}' not found.")
     
-    engine = get_engine_for_user_db(virtual_db.physical_name)
+    engine = get_engine_for_user_db(access.physical_name, access.server_id)
     inspector = inspect(engine)
     script = ""
-    for table_name in inspector.get_table_names(schema="public"):
-        try:
-            table_metadata = Table(table_name, MetaData(), autoload_with=engine, schema="public")
-            create_statement = str(CreateTable(table_metadata).compile(engine))
-            script += f"{create_statement.strip()};\n\n"
-        except Exception as e:
-            script += f"-- Could not generate CREATE statement for table '{table_name}': {e}\n\n"
+    with stage("schema"):
+        for table_name in inspector.get_table_names(schema="public"):
+            try:
+                table_metadata = Table(table_name, MetaData(), autoload_with=engine, schema="public")
+                create_statement = str(CreateTable(table_metadata).compile(engine))
+                script += f"{create_statement.strip()};\n\n"
+            except Exception as e:
+                script += f"-- Could not generate CREATE statement for table '{table_name}': {e}\n\n"
     return script if script else "-- No tables found to export."
 
 
@@ -114,13 +117,14 @@ async def get_schema_as_mermaid(
     current_user: User = Depends(get_current_user)
 ):
     """Securely generates a Mermaid.js diagram for the user's target database."""
-    virtual_db = vdb_service.get_accessible_database(db_session, user=current_user, virtual_name=x_target_database)
-    if not virtual_db:
+    access = resolve_tenant_access(db_session, user=current_user, virtual_name=x_target_database)
+    if not access:
         raise HTTPException(status_code=404, detail=f"Database '{x_target_database}' not found.")
     
-    engine = get_engine_for_user_db(virtual_db.physical_name)
+    engine = get_engine_for_user_db(access.physical_name, access.server_id)
     try:
-        mermaid_string = generate_schema_as_mermaid(engine)
+        with stage("schema"):
+            mermaid_string = generate_schema_as_mermaid(engine)
         return mermaid_string
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to generate Mermaid diagram: {str(e)}")
@@ -132,14 +136,14 @@ async def get_table_names(
     current_user: User = Depends(get_current_user)
 ):
     """Securely returns a list of table names for the user's target database."""
-    virtual_db = vdb_service.get_accessible_database(db_session, user=current_user, virtual_name=x_target_database)
-    if not virtual_db:
+    access = resolve_tenant_access(db_session, user=current_user, virtual_name=x_target_database)
+    if not access:
         raise HTTPException(status_code=404, detail=f"Database '{x_target_database}' not found for your account.")
     
     try:
-        engine = get_engine_for_user_db(virtual_db.physical_name)
-        inspector = inspect(engine)
-        table_names = inspector.get_table_names(schema="public")
+        engine = get_engine_for_user_db(access.physical_name, access.server_id)
+        with stage("schema"):
+            table_names = inspect(engine).get_table_names(schema="public")
         return table_names
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to retrieve table list: {str(e)}")
@@ -152,19 +156,22 @@ async def get_single_table_schema(
     current_user: User = Depends(get_current_user)
 ):
     """Securely retrieves the detailed schema for a single table."""
-    virtual_db = vdb_service.get_accessible_database(db_session, user=current_user, virtual_name=x_target_database)
-    if not virtual_db:
+    access = resolve_tenant_access(db_session, user=current_user, virtual_name=x_target_database)
+    if not access:
         raise HTTPException(status_code=404, detail=f"Database '{x_target_database}' not found for your account.")
     
-    engine = get_engine_for_user_db(virtual_db.physical_name)
+    engine = get_engine_for_user_db(access.physical_name, access.server_id)
     inspector = inspect(engine)
     
-    if not inspector.has_table(table_name):
+    with stage("schema"):
+        table_exists = inspector.has_table(table_name)
+    if not table_exists:
         raise HTTPException(status_code=404, detail=f"Table '{table_name}' not found in database '{x_target_database}'.")
 
     try:
         # We can reuse the helper and just find the table we need
-        all_tables = _get_full_schema_details(inspector, engine)
+        with stage("schema"):
+            all_tables = _get_full_schema_details(inspector, engine)
         target_table = next((t for t in all_tables if t.name == table_name), None)
         if not target_table:
              raise HTTPException(status_code=404, detail=f"Table '{table_name}' could not be processed.")
@@ -184,26 +191,26 @@ async def delete_table(
     if not table_name.isidentifier():
         raise HTTPException(status_code=400, detail="Invalid table name.")
 
-    virtual_db = vdb_service.get_accessible_database(db_session, user=current_user, virtual_name=x_target_database)
-    if not virtual_db:
+    access = resolve_tenant_access(db_session, user=current_user, virtual_name=x_target_database)
+    if not access:
         raise HTTPException(status_code=404, detail=f"Database '{x_target_database}' not found.")
     
-    user_role = get_user_role_for_db(db_session, user=current_user, virtual_db=virtual_db)
-    if not user_has_at_least_role(user_role, DBRole.editor):
+    if not user_has_at_least_role(access.role, DBRole.editor):
         raise HTTPException(status_code=403, detail="Permission denied: 'Editor' role required.")
     
-    engine = get_engine_for_user_db(virtual_db.physical_name)
+    engine = get_engine_for_user_db(access.physical_name, access.server_id)
     
     # The `DROP TABLE` command should be handled by the main query endpoint for consistency,
     # but if you need a dedicated endpoint, this is how you'd do it.
     # We will use the main query endpoint's logic for safety.
     sql = f'DROP TABLE "{table_name}";'
     try:
-        with engine.connect() as connection:
+        with stage("execute"), engine.connect() as connection:
             with connection.begin():
                 result = execute_sql(connection, sql)
         if not result["success"]:
             raise HTTPException(status_code=400, detail=result["message"])
+        template_cache_service.invalidate_for_schema_change(user_id=current_user.user_id, virtual_database_id=access.virtual_db.id)
         return StatusResponse(message=f"Table '{table_name}' deleted successfully.")
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
\ No newline at end of file
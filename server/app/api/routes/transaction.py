@@ -1,13 +1,17 @@
 # server/app/api/routes/transaction.py
 from fastapi import APIRouter, Depends, Header, HTTPException
-from sqlalchemy.engine import Engine
-from app.core import transaction_manager
+from app.core import transaction_router
+from app.core.transaction_manager import TransactionLimitError
 from sqlalchemy.orm import Session
 from app.core.security import get_current_user
 from app.models.user_model import User
 from app.db.session import get_db_session
+from app.core.authorization import resolve_tenant_access, user_has_at_least_role
+from app.core.config import settings
 from app.db.engine import get_engine_for_user_db
-from app.services import virtual_database_service as vdb_service
+from app.models.database_collab_model import DBRole
+from app.schemas.transaction_schema import ScriptRequest, ScriptResponse
+from app.services import transaction_script_service, template_cache_service
 
 router = APIRouter()
 
@@ -18,32 +22,71 @@ def begin_new_transaction(
     current_user: User = Depends(get_current_user)
 ):
     """Securely starts a new transaction and returns its unique ID."""
-    virtual_db = vdb_service.get_accessible_database(db_session, user=current_user, virtual_name=x_target_database)
-    if not virtual_db:
+    access = resolve_tenant_access(db_session, user=current_user, virtual_name=x_target_database)
+    if not access:
         raise HTTPException(status_code=404, detail=f"Database '{x_target_database}' not found.")
-    
-    engine = get_engine_for_user_db(virtual_db.physical_name)
 
-    connection = engine.connect() # Get a fresh connection from the pool
-    tx_id = transaction_manager.begin_transaction(connection)
+    try:
+        tx_id = transaction_router.begin(tenant=access.physical_name, user_id=current_user.user_id, server_id=access.server_id)
+    except TransactionLimitError as e:
+        raise HTTPException(status_code=429, detail=str(e))
+    except transaction_router.TransactionBrokerUnavailable as e:
+        raise HTTPException(status_code=503, detail=str(e))
     return {"transaction_id": tx_id}
 
+def _end(tx_id: str, user_id: str, commit: bool):
+    try:
+        found = transaction_router.end(tx_id, user_id=user_id, commit=commit)
+    except transaction_router.TransactionBrokerUnavailable as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    if not found:
+        raise HTTPException(status_code=404, detail="Transaction not found or already closed.")
+
 @router.post("/commit", tags=["Transaction"])
 def commit_existing_transaction(
-    x_transaction_id: str = Header(..., alias="X-Transaction-ID")
+    x_transaction_id: str = Header(..., alias="X-Transaction-ID"),
+    current_user: User = Depends(get_current_user)
 ):
     """Commits an active transaction."""
-    if not transaction_manager.get_transaction_connection(x_transaction_id):
-        raise HTTPException(status_code=404, detail="Transaction not found or already closed.")
-    transaction_manager.end_transaction(x_transaction_id, commit=True)
+    _end(x_transaction_id, current_user.user_id, commit=True)
     return {"message": "Transaction committed."}
 
 @router.post("/rollback", tags=["Transaction"])
 def rollback_existing_transaction(
-    x_transaction_id: str = Header(..., alias="X-Transaction-ID")
+    x_transaction_id: str = Header(..., alias="X-Transaction-ID"),
+    current_user: User = Depends(get_current_user)
 ):
     """Rolls back an active transaction."""
-    if not transaction_manager.get_transaction_connection(x_transaction_id):
-        raise HTTPException(status_code=404, detail="Transaction not found or already closed.")
-    transaction_manager.end_transaction(x_transaction_id, commit=False)
-    return {"message": "Transaction rolled back."}
\ No newline at end of file
+    _end(x_transaction_id, current_user.user_id, commit=False)
+    return {"message": "Transaction rolled back."}
+
+@router.post("/script", response_model=ScriptResponse, tags=["Transaction"])
+def run_transaction_script(
+    script: ScriptRequest,
+    x_target_database: str = Header(..., alias="X-Target-Database"),
+    db_session: Session = Depends(get_db_session),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Runs an ordered list of SQL or structured steps in one transaction, in a single round trip.
+    Steps can set named savepoints and choose what happens when they fail.
+    """
+    if not script.steps:
+        raise HTTPException(status_code=400, detail="A script needs at least one step.")
+    if len(script.steps) > settings.TRANSACTION_SCRIPT_MAX_STEPS:
+        raise HTTPException(status_code=400, detail=f"A script may contain at most {settings.TRANSACTION_SCRIPT_MAX_STEPS} steps.")
+    try:
+        transaction_script_service.validate_script(script)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    access = resolve_tenant_access(db_session, user=current_user, virtual_name=x_target_database)
+    if not access:
+        raise HTTPException(status_code=404, detail=f"Database '{x_target_database}' not found.")
+    if transaction_script_service.script_writes(script) and not user_has_at_least_role(access.role, DBRole.editor):
+        raise HTTPException(status_code=403, detail="Permission denied: You need 'Editor' or 'Owner' role to modify this database.")
+
+    response = transaction_script_service.run_script(get_engine_for_user_db(access.physical_name, access.server_id), script)
+    if response.committed and template_cache_service.is_schema_change([step.sql for step in script.steps if step.sql]):
+        template_cache_service.invalidate_for_schema_change(user_id=current_user.user_id, virtual_database_id=access.virtual_db.id)
+    return response
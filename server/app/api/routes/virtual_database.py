@@ -6,11 +6,11 @@ from typing import List
 from app.db.session import get_db_session
 from app.models.user_model import User
 from app.core.security import get_current_user
+from app.core.authorization import resolve_tenant_access, user_has_at_least_role
+from app.models.database_collab_model import DBRole
 from app.schemas.virtual_database_schema import VirtualDatabaseCreate, VirtualDatabaseRead
 from app.services import virtual_database_service as vdb_service
 
-from app.core.authorization import get_user_role_for_db
-
 router = APIRouter()
 
 @router.post(
@@ -42,18 +42,63 @@ def create_user_database(
         # Catch potential database creation errors
         raise HTTPException(status_code=500, detail=f"Failed to create database: {str(e)}")
 
-@router.get("/", response_model=List[VirtualDatabaseRead], tags=["Database Management"])
-def list_user_databases(
+@router.post(
+    "/{virtual_name}/clone",
+    response_model=VirtualDatabaseRead,
+    status_code=status.HTTP_201_CREATED,
+    tags=["Database Management"]
+)
+def clone_user_database(
+    virtual_name: str,
+    *,
     db: Session = Depends(get_db_session),
+    db_in: VirtualDatabaseCreate,
     current_user: User = Depends(get_current_user)
 ):
-    """Lists all virtual databases owned by the current user."""
-    all_dbs = vdb_service.get_all_dbs_for_user(db, user=current_user)
+    """
+    Creates a new database for the current user as a physical copy of `virtual_name`,
+    schema and data included.
+    """
+    access = resolve_tenant_access(db, user=current_user, virtual_name=virtual_name)
+    if not access:
+        raise HTTPException(status_code=404, detail=f"Database '{virtual_name}' not found.")
+    if not user_has_at_least_role(access.role, DBRole.editor):
+        raise HTTPException(status_code=403, detail="Permission denied: Cloning a database requires editor privileges.")
+    if vdb_service.get_accessible_database(db, user=current_user, virtual_name=db_in.virtual_name):
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="A database with this name already exists for your account."
+        )
 
-    for db_obj in all_dbs:
-        db_obj.current_user_role = get_user_role_for_db(db, user=current_user, virtual_db=db_obj)
+    try:
+        return vdb_service.clone_virtual_database(db, owner=current_user, source=access.virtual_db, db_in=db_in)
+    except vdb_service.DatabaseBusyError as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to clone database: {str(e)}")
 
-    return all_dbs
+@router.post("/{virtual_name}/restore", response_model=VirtualDatabaseRead, tags=["Database Management"])
+def restore_user_database(
+    virtual_name: str,
+    db: Session = Depends(get_db_session),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Restores a database you dropped, as long as its storage has not been reclaimed yet.
+    """
+    try:
+        return vdb_service.restore_virtual_database(db, owner=current_user, virtual_name=virtual_name)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+
+@router.get("/", response_model=List[VirtualDatabaseRead], tags=["Database Management"])
+def list_user_databases(
+    db: Session = Depends(get_db_session),
+    current_user: User = Depends(get_current_user)
+):
+    """Lists all virtual databases the current user owns or collaborates on."""
+    # Roles are computed in the same query, so this stays one round trip.
+    return vdb_service.get_all_dbs_for_user(db, user=current_user)
 
 @router.get("/collaborations", response_model=List[VirtualDatabaseRead], tags=["Database Management"])
 def list_collaborated_databases(
@@ -64,12 +109,7 @@ def list_collaborated_databases(
     Lists only the databases that the current user has been invited to
     as a collaborator.
     """
-    collaborated_dbs = vdb_service.get_collaborated_dbs_for_user(db, user=current_user)
-    
-    for db_obj in collaborated_dbs:
-        db_obj.current_user_role = get_user_role_for_db(db, user=current_user, virtual_db=db_obj)
-        
-    return collaborated_dbs
+    return vdb_service.get_collaborated_dbs_for_user(db, user=current_user)
 
 @router.get("/shared-by-me", response_model=List[VirtualDatabaseRead], tags=["Database Management"])
 def list_databases_shared_by_me(
@@ -1,8 +1,188 @@
 # app/core/authorization.py
+import json
+import logging
+import select
+import threading
+from dataclasses import dataclass
+from sqlalchemy import String, and_, case, cast, or_, create_engine, text
 from sqlalchemy.orm import Session
+from sqlalchemy.pool import NullPool
+from app.core.config import settings
+from app.db.engine import MAIN_APP_DB_URL, main_app_engine
+from app.core.logging_config import bind_tenant
+from app.core.request_timing import stage
+from app.db.snapshot import detached_snapshot
 from app.models.user_model import User
 from app.models.virtual_database_model import VirtualDatabase
 from app.models.database_collab_model import DatabaseMember, DBRole
+from app.services import hibernation_service
+from app.utils.ttl_cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+@dataclass(frozen=True)
+class TenantAccess:
+    """Everything a tenant-scoped route needs: the database, where it lives, and the caller's role."""
+    virtual_db: VirtualDatabase
+    physical_name: str
+    server_id: str
+    role: DBRole
+
+# (user_id, virtual_name) -> (detached VirtualDatabase snapshot, DBRole).
+# Only successful resolutions are cached; see invalidate_tenant_access for the write side.
+# Every worker has its own copy. Invalidations reach the other workers through Postgres
+# NOTIFY (see start_invalidation_listener); the TTL bounds staleness for any that are
+# missed, e.g. while a worker's listener is reconnecting, so keep it short.
+_tenant_access_cache = TTLCache(
+    "tenant_access",
+    ttl_seconds=settings.TENANT_ACCESS_CACHE_TTL_SECONDS,
+    max_entries=settings.TENANT_ACCESS_CACHE_MAX_ENTRIES,
+)
+
+# Per-request memo, stored on the request's metadata session.
+_SESSION_MEMO_KEY = "tenant_access"
+
+def role_expression(user_id: str):
+    """
+    SQL expression computing a user's role for VirtualDatabase rows that have been
+    outer-joined to that user's DatabaseMember row. Evaluates to the role name.
+    """
+    return case(
+        (VirtualDatabase.user_id == user_id, DBRole.owner.value),
+        else_=cast(DatabaseMember.role, String),
+    )
+
+def member_join_condition(user_id: str):
+    return and_(DatabaseMember.database_id == VirtualDatabase.id, DatabaseMember.user_id == user_id)
+
+def resolve_tenant_access(db: Session, *, user: User, virtual_name: str, require_awake: bool = True) -> TenantAccess | None:
+    """
+    Resolves a virtual database name for a user in one joined query, returning
+    the database, its physical name and the user's role, or None without access.
+    Results are memoized for the request and cached across requests.
+
+    With `require_awake` (the default, for callers that connect to the database), a
+    hibernated database starts waking up and hibernation_service.DatabaseWakingUp is raised.
+    """
+    with stage("tenant"):
+        access = _resolve_tenant_access(db, user=user, virtual_name=virtual_name, require_awake=require_awake)
+    if access is not None:
+        bind_tenant(access.virtual_db.id)
+    return access
+
+def _resolve_tenant_access(db: Session, *, user: User, virtual_name: str, require_awake: bool) -> TenantAccess | None:
+    key = (user.user_id, virtual_name)
+    memo = db.info.setdefault(_SESSION_MEMO_KEY, {})
+    if key in memo:
+        access = memo[key]
+        if access and require_awake:
+            hibernation_service.ensure_awake(access.virtual_db)
+        return access
+
+    cached = _tenant_access_cache.get(key)
+    if cached is not None:
+        snapshot, role = cached
+        virtual_db = db.merge(snapshot, load=False)
+    else:
+        row = db.query(VirtualDatabase, role_expression(user.user_id)).outerjoin(
+            DatabaseMember, member_join_condition(user.user_id)
+        ).filter(
+            VirtualDatabase.virtual_name == virtual_name,
+            or_(VirtualDatabase.user_id == user.user_id, DatabaseMember.user_id.isnot(None)),
+            VirtualDatabase.deleted_at.is_(None)
+        ).order_by(
+            # Prefer the user's own database if they also collaborate on one with the same name.
+            (VirtualDatabase.user_id == user.user_id).desc()
+        ).first()
+        if row is None:
+            return None
+        virtual_db, role_name = row
+        role = DBRole(role_name)
+        # Databases in or out of hibernation are re-read until they are active again.
+        if virtual_db.storage_state == hibernation_service.ACTIVE:
+            _tenant_access_cache.set(key, (detached_snapshot(virtual_db), role))
+
+    access = TenantAccess(virtual_db=virtual_db, physical_name=virtual_db.physical_name, server_id=virtual_db.server_id, role=role)
+    memo[key] = access
+    if require_awake:
+        hibernation_service.record_access(virtual_db.id)
+        hibernation_service.ensure_awake(virtual_db)
+    return access
+
+def _invalidate_local(user_id: str | None, database_id: str | None):
+    def is_stale(key, value):
+        snapshot, _ = value
+        return (user_id is not None and key[0] == user_id) or (database_id is not None and snapshot.id == database_id)
+
+    _tenant_access_cache.invalidate_where(is_stale)
+
+def invalidate_tenant_access(db: Session | None = None, *, user_id: str | None = None, database_id: str | None = None):
+    """
+    Drops cached access entries for a user (membership changes) or for a database
+    (rename, delete, move), including the memo of the given request session, and
+    tells the other workers to do the same. Call it after the change is committed.
+    """
+    _invalidate_local(user_id, database_id)
+    if db is not None:
+        # The request memo is tiny, so simply start it over.
+        db.info.pop(_SESSION_MEMO_KEY, None)
+
+    payload = json.dumps({"user_id": user_id, "database_id": database_id})
+    try:
+        with main_app_engine.connect() as conn:
+            conn.execute(text("SELECT pg_notify(:channel, :payload)"), {"channel": _INVALIDATION_CHANNEL, "payload": payload})
+            conn.commit()
+    except Exception as e:
+        logger.warning("Could not notify other workers of a tenant access change: %s", e)
+
+# --- Cross-process invalidation ---
+
+_INVALIDATION_CHANNEL = "fastdb_tenant_access"
+
+_listener_thread: threading.Thread | None = None
+_listener_stop = threading.Event()
+
+def _listen_once():
+    engine = create_engine(MAIN_APP_DB_URL, poolclass=NullPool)
+    try:
+        conn = engine.raw_connection()
+        try:
+            pg_conn = conn.driver_connection
+            pg_conn.autocommit = True
+            with pg_conn.cursor() as cursor:
+                cursor.execute(f"LISTEN {_INVALIDATION_CHANNEL}")
+            # Changes made while not listening were missed; start over.
+            _tenant_access_cache.clear()
+            while not _listener_stop.is_set():
+                if select.select([pg_conn], [], [], 1.0)[0]:
+                    pg_conn.poll()
+                    while pg_conn.notifies:
+                        message = json.loads(pg_conn.notifies.pop(0).payload)
+                        _invalidate_local(message.get("user_id"), message.get("database_id"))
+        finally:
+            conn.close()
+    finally:
+        engine.dispose()
+
+def _listener_loop():
+    while not _listener_stop.is_set():
+        try:
+            _listen_once()
+        except Exception as e:
+            logger.warning("Tenant access invalidation listener failed, reconnecting: %s", e)
+            _listener_stop.wait(5)
+
+def start_invalidation_listener():
+    """Starts the thread that applies other workers' tenant access invalidations to this process's cache."""
+    global _listener_thread
+    if _listener_thread and _listener_thread.is_alive():
+        return
+    _listener_stop.clear()
+    _listener_thread = threading.Thread(target=_listener_loop, name="tenant-access-listener", daemon=True)
+    _listener_thread.start()
+
+def stop_invalidation_listener():
+    _listener_stop.set()
 
 def get_user_role_for_db(db: Session, *, user: User, virtual_db: VirtualDatabase) -> DBRole | None:
     """
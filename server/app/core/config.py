@@ -17,14 +17,105 @@ class Settings(BaseSettings):
     JWTSECRET_KEY: str
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 2880
     ALGORITHM: str = "HS256"
+
+    AUTH_CACHE_TTL_SECONDS: int = 60
+    AUTH_CACHE_MAX_ENTRIES: int = 10000
+    # Upper bound on staleness when a worker misses another worker's invalidation
+    TENANT_ACCESS_CACHE_TTL_SECONDS: int = 30
+    TENANT_ACCESS_CACHE_MAX_ENTRIES: int = 10000
+
+    TRANSACTION_IDLE_TIMEOUT_SECONDS: int = 60
+    TRANSACTION_MAX_LIFETIME_SECONDS: int = 600
+    TRANSACTION_REAPER_INTERVAL_SECONDS: int = 5
+    TRANSACTION_MAX_PER_TENANT: int = 20
+    TRANSACTION_MAX_PER_USER: int = 10
+    # Comma-separated host:port list of transaction brokers. Empty keeps transactions in-process (single worker only).
+    TRANSACTION_BROKERS: str = ""
+    TRANSACTION_BROKER_AUTHKEY: str | None = None
+    TRANSACTION_SCRIPT_MAX_STEPS: int = 200
+
+    DATA_BATCH_MAX_QUERIES: int = 50
+    # Per-stage timings in a Server-Timing header and in the `timings` block of query responses.
+    SERVER_TIMING_ENABLED: bool = True
+    # Prometheus metrics at /metrics (per process; scrape each worker).
+    METRICS_ENABLED: bool = True
+
+    # Extra tenant database servers, as comma-separated id=host:port entries, registered at startup.
+    # The server in POSTGRES_SERVER/POSTGRES_PORT is always registered as "default".
+    DATABASE_SERVERS: str = ""
+    # Where new databases go: "least_loaded" (fewest live databases per unit of capacity) or "pinned".
+    DATABASE_PLACEMENT_POLICY: str = "least_loaded"
+    # Server that receives every new database under the "pinned" policy.
+    DATABASE_PINNED_SERVER: str = "default"
+
+    # Live migration of tenant databases between servers
+    MIGRATION_MAX_CUTOVER_LAG_BYTES: int = 16 * 1024 * 1024
+    MIGRATION_SYNC_TIMEOUT_SECONDS: int = 3600
+    # Longest the database may stay frozen waiting for its last changes to replicate.
+    MIGRATION_CUTOVER_TIMEOUT_SECONDS: int = 30
+    MIGRATION_POLL_INTERVAL_SECONDS: float = 1.0
+    # Where dumps are staged during a migration; empty uses the system temp directory.
+    MIGRATION_WORK_DIR: str = ""
+    # Shared secret for the operator API under /admin (X-Admin-Key header); unset disables it.
+    ADMIN_API_KEY: str | None = None
+
+    # Spare physical databases kept ready for signup and database creation; 0 disables the pool.
+    DATABASE_WARM_POOL_SIZE: int = 5
+    DATABASE_WARM_POOL_REFILL_INTERVAL_SECONDS: int = 30
+    # Comma-separated extensions pre-installed in the tenant template database.
+    TENANT_TEMPLATE_EXTENSIONS: str = "pgcrypto,pg_trgm"
+    # Per-database statement_timeout for tenant databases; 0 leaves the server default.
+    TENANT_STATEMENT_TIMEOUT_SECONDS: int = 0
+    # How long a clone waits for running queries on the source database to finish.
+    CLONE_DRAIN_TIMEOUT_SECONDS: int = 10
+
+    # Background admin jobs (physical drops and renames)
+    ADMIN_JOB_POLL_INTERVAL_SECONDS: int = 5
+    ADMIN_JOB_MAX_ATTEMPTS: int = 5
+    ADMIN_JOB_RETRY_BACKOFF_SECONDS: int = 10
+    # A running job whose worker stopped updating it for this long is picked up again.
+    ADMIN_JOB_STALE_SECONDS: int = 600
+    # UTC hours ("start-end") in which deleted databases are dropped and renamed ones renamed; empty runs them at once.
+    ADMIN_JOB_OFF_PEAK_HOURS: str = "2-5"
+
+    # Hibernation of idle tenant databases to pg_dump archives (scans run in the off-peak window)
+    HIBERNATION_ENABLED: bool = False
+    HIBERNATION_IDLE_DAYS: int = 30
+    HIBERNATION_SCAN_INTERVAL_SECONDS: int = 900
+    HIBERNATION_BATCH_SIZE: int = 20
+    HIBERNATION_ARCHIVE_DIR: str = "hibernation"
+    HIBERNATION_COMPRESSION_LEVEL: int = 6
+    HIBERNATION_WAKE_RETRY_AFTER_SECONDS: int = 5
+    # A hibernation or restore that has not finished after this long is assumed dead and settled.
+    HIBERNATION_STUCK_SECONDS: int = 3600
+    # Directory holding pg_dump / pg_restore; empty uses PATH.
+    POSTGRES_BIN_DIR: str = ""
+
+    # In-process L1 in front of the template and history "Rapid Cache" tiers
+    RAPID_CACHE_L1_TTL_SECONDS: int = 300
+    RAPID_CACHE_L1_MAX_ENTRIES: int = 5000
+    # Persistent template cache: per-user LRU cap, idle TTL and schema fingerprint cache lifetime
+    TEMPLATE_MAX_PER_USER: int = 500
+    TEMPLATE_IDLE_TTL_DAYS: int = 30
+    # Templates that broke this many times are no longer served; the prompt goes to the NLP engine
+    TEMPLATE_MAX_FAILURES: int = 3
+    SCHEMA_FINGERPRINT_TTL_SECONDS: int = 300
+
+    # Logging goes through a bounded queue to a writer thread; records beyond LOG_QUEUE_MAX_SIZE are dropped.
+    LOG_LEVEL: str = "INFO"
+    # "json" (one object per line) or "text"
+    LOG_FORMAT: str = "json"
+    LOG_QUEUE_MAX_SIZE: int = 10000
+    # Fraction of DEBUG records kept.
+    LOG_DEBUG_SAMPLE_RATE: float = 1.0
+
+    HISTORY_QUEUE_MAX_SIZE: int = 10000
+    HISTORY_BATCH_SIZE: int = 500
+    HISTORY_FLUSH_INTERVAL_SECONDS: float = 1.0
+    # Once the queue is this full (0-1), only HISTORY_SAMPLE_RATE of successful entries are kept.
+    HISTORY_SAMPLING_THRESHOLD: float = 0.5
+    HISTORY_SAMPLE_RATE: float = 0.1
     
     model_config = SettingsConfigDict(env_file=".env")
 
-settings = Settings()
-
-print("--- SETTINGS LOADED BY Pydantic ---")
-print(f"Host: {settings.POSTGRES_SERVER}")
-print(f"Port: {settings.POSTGRES_PORT}")
-print(f"User: {settings.POSTGRES_USER}")
-print(f"DB Name: {settings.POSTGRES_DB}")
-print("---------------------------------")
\ No newline at end of file
+settings = Settings()
\ No newline at end of file
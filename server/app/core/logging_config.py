@@ -0,0 +1,187 @@
+# app/core/logging_config.py
+"""
+Non-blocking structured logging.
+
+Modules log through `logging.getLogger(__name__)` as usual. configure_logging()
+gives the root logger a single queue handler: the calling thread only builds
+the record, stamps it with the request context (request ID, user and tenant,
+kept in context variables) and puts it on a bounded in-process queue. A
+listener thread formats the records, as JSON lines or plain text, and writes
+them to stdout. If the queue is full the record is dropped and counted instead
+of blocking the request.
+
+Records can be sampled: pass `extra={"sample_rate": 0.01}` to keep about 1% of
+a high-frequency event, and DEBUG records default to LOG_DEBUG_SAMPLE_RATE.
+Kept records carry their sample rate so counts can be scaled back up.
+"""
+import json
+import logging
+import queue
+import random
+import sys
+import uuid
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+from app.core.config import settings
+from app.utils.prometheus import Counter
+
+LOG_RECORDS_DROPPED = Counter("fastdb_log_records_dropped_total", "Log records dropped because the log queue was full.")
+
+_request_id: ContextVar[str | None] = ContextVar("log_request_id", default=None)
+_user_id: ContextVar[str | None] = ContextVar("log_user_id", default=None)
+_tenant: ContextVar[str | None] = ContextVar("log_tenant", default=None)
+
+_listener: QueueListener | None = None
+
+# Attributes every LogRecord has; anything else on a record came from `extra`.
+_STANDARD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime", "taskName"}
+_CONTEXT_ATTRS = ("request_id", "user_id", "tenant", "sample_rate")
+
+def bind_user(user_id: str | None):
+    """Tags the current request's log records with the authenticated user."""
+    _user_id.set(user_id)
+
+def bind_tenant(tenant: str | None):
+    """Tags the current request's log records with the virtual database it works on."""
+    _tenant.set(tenant)
+
+def current_request_id() -> str | None:
+    return _request_id.get()
+
+class _ContextFilter(logging.Filter):
+    """Runs in the calling thread: samples the record and copies the request context onto it."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        rate = getattr(record, "sample_rate", None)
+        if rate is None and record.levelno <= logging.DEBUG:
+            rate = settings.LOG_DEBUG_SAMPLE_RATE
+        if rate is not None and rate < 1.0:
+            if random.random() >= rate:
+                return False
+            record.sample_rate = rate
+        record.request_id = _request_id.get()
+        record.user_id = _user_id.get()
+        record.tenant = _tenant.get()
+        return True
+
+class _NonBlockingQueueHandler(QueueHandler):
+    def __init__(self, log_queue: "queue.SimpleQueue[logging.LogRecord]", max_size: int):
+        super().__init__(log_queue)
+        self.max_size = max_size
+
+    def handle(self, record: logging.LogRecord):
+        # The queue is thread-safe, so skip the handler lock Handler.handle would take.
+        if self.filter(record):
+            self.emit(record)
+            return record
+        return False
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # The queue is in-process, so the record needs no copying or pickling; only resolve
+        # the message now, since its arguments may change after the call returns.
+        record.message = record.getMessage()
+        record.msg, record.args = record.message, None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        # SimpleQueue has no size limit and a lock-free put; the bound is enforced approximately here.
+        if self.queue.qsize() >= self.max_size:
+            LOG_RECORDS_DROPPED.inc()
+            return
+        self.queue.put_nowait(record)
+
+class _JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for attr in _CONTEXT_ATTRS:
+            value = getattr(record, attr, None)
+            if value is not None:
+                entry[attr] = value
+        for key, value in vars(record).items():
+            if key not in _STANDARD_ATTRS and key not in entry and key not in _CONTEXT_ATTRS:
+                entry[key] = value
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+class _TextFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)s %(name)s [%(request_id)s] %(message)s")
+
+    def format(self, record: logging.LogRecord) -> str:
+        if not hasattr(record, "request_id"):
+            record.request_id = None
+        return super().format(record)
+
+def configure_logging():
+    """Routes all logging through the queue and starts the writer thread. Safe to call more than once."""
+    global _listener
+    if _listener is not None:
+        return
+    output = logging.StreamHandler(sys.stdout)
+    output.setFormatter(_JsonFormatter() if settings.LOG_FORMAT == "json" else _TextFormatter())
+
+    log_queue: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+    handler = _NonBlockingQueueHandler(log_queue, settings.LOG_QUEUE_MAX_SIZE)
+    handler.addFilter(_ContextFilter())
+
+    root = logging.getLogger()
+    root.handlers = [handler]
+    root.setLevel(settings.LOG_LEVEL.upper())
+    # uvicorn's own loggers write to the console directly; send them through the queue as well.
+    for name in ("uvicorn", "uvicorn.error", "uvicorn.access"):
+        uvicorn_logger = logging.getLogger(name)
+        uvicorn_logger.handlers = []
+        uvicorn_logger.propagate = True
+
+    _listener = QueueListener(log_queue, output, respect_handler_level=True)
+    _listener.start()
+
+def stop_logging():
+    """Writes out what is still queued and stops the writer thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+class RequestContextMiddleware:
+    """
+    ASGI middleware giving every HTTP request an ID for its log records: the caller's
+    X-Request-ID if it sent a sensible one, otherwise a new one. It is echoed in the response.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_id = None
+        for name, value in scope["headers"]:
+            if name == b"x-request-id":
+                request_id = value.decode("latin-1")
+                break
+        if not request_id or len(request_id) > 128 or not request_id.isprintable():
+            request_id = uuid.uuid4().hex
+
+        # Not reset afterwards: every request runs in its own task context, and the 500 handler,
+        # which runs outside this middleware, should still see the request's context.
+        _request_id.set(request_id)
+        _user_id.set(None)
+        _tenant.set(None)
+
+        async def send_with_request_id(message):
+            if message["type"] == "http.response.start":
+                message = {**message, "headers": list(message.get("headers", [])) + [(b"x-request-id", request_id.encode("latin-1"))]}
+            await send(message)
+
+        await self.app(scope, receive, send_with_request_id)
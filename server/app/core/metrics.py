@@ -0,0 +1,109 @@
+# app/core/metrics.py
+"""
+Prometheus metrics for /metrics.
+
+Request latency, pool checkouts, LLM calls and cache tiers are recorded as they
+happen (here, in app.db.engine, app.core.nlp_engine and app.core.request_timing).
+Everything that already has a stats dict (in-process caches, transactions, the
+history queue, connection pools) is copied into gauges when /metrics is
+scraped, so it costs nothing between scrapes.
+"""
+import time
+
+from app.core import transaction_router
+from app.core.config import settings
+from app.db.engine import get_pool_stats
+from app.services import history_writer
+from app.utils.prometheus import Counter, Gauge, Histogram, render_all
+from app.utils.ttl_cache import get_all_cache_stats
+
+HTTP_REQUEST_SECONDS = Histogram(
+    "fastdb_http_request_seconds", "Latency of HTTP requests by route template.", ["method", "route", "status"]
+)
+
+CACHE_LOOKUPS = Counter("fastdb_cache_lookups_total", "Lookups in in-process caches, by result.", ["cache", "result"])
+CACHE_ENTRIES = Gauge("fastdb_cache_entries", "Entries held by each in-process cache.", ["cache"])
+CACHE_EVICTIONS = Counter("fastdb_cache_evictions_total", "Entries evicted from in-process caches for space.", ["cache"])
+
+TRANSACTIONS_OPEN = Gauge("fastdb_transactions_open", "Open interactive transactions, per broker or in this process.", ["broker"])
+
+HISTORY_QUEUE_DEPTH = Gauge("fastdb_history_queue_depth", "Query history entries waiting to be written.")
+HISTORY_QUEUE_CAPACITY = Gauge("fastdb_history_queue_capacity", "Capacity of the query history write queue.")
+HISTORY_ENTRIES = Counter("fastdb_history_entries_total", "Query history entries by what happened to them.", ["outcome"])
+
+POOL_CONNECTIONS = Gauge("fastdb_pool_connections", "Pooled connections in this process, per pool.", ["pool", "state"])
+POOL_ENGINES = Gauge("fastdb_pool_engines", "Tenant engines (one pool each) in this process, per server.", ["pool"])
+
+def _collect():
+    for name, stats in get_all_cache_stats().items():
+        CACHE_LOOKUPS.set(stats["hits"], cache=name, result="hit")
+        CACHE_LOOKUPS.set(stats["misses"], cache=name, result="miss")
+        CACHE_ENTRIES.set(stats["size"], cache=name)
+        CACHE_EVICTIONS.set(stats["evictions"], cache=name)
+
+    TRANSACTIONS_OPEN.clear()
+    for broker, stats in transaction_router.get_stats().items():
+        if "open" in stats:
+            TRANSACTIONS_OPEN.set(stats["open"], broker=broker)
+
+    writer = history_writer.get_writer_stats()
+    HISTORY_QUEUE_DEPTH.set(writer["queued"])
+    HISTORY_QUEUE_CAPACITY.set(writer["capacity"])
+    for outcome in ("enqueued", "written", "sampled_out", "dropped", "failed"):
+        HISTORY_ENTRIES.set(writer[outcome], outcome=outcome)
+
+    POOL_CONNECTIONS.clear()
+    POOL_ENGINES.clear()
+    for pool, stats in get_pool_stats().items():
+        POOL_CONNECTIONS.set(stats["checked_out"], pool=pool, state="checked_out")
+        POOL_CONNECTIONS.set(stats["idle"], pool=pool, state="idle")
+        POOL_ENGINES.set(stats["engines"], pool=pool)
+
+def _route_template(scope) -> str:
+    """
+    The matched route as a template, e.g. /api/schema/{table_name}, so paths with IDs share a label.
+    The route's own path leaves out the prefixes of the routers it is included in; they are
+    whatever precedes the route's path in the request path.
+    """
+    route = scope.get("route")
+    path = getattr(route, "path", None)
+    if path is None:
+        return "unmatched"
+    try:
+        rendered = path.format(**scope.get("path_params", {}))
+    except (KeyError, IndexError, ValueError):
+        return path
+    if not scope["path"].endswith(rendered):
+        return path
+    return scope["path"][:len(scope["path"]) - len(rendered)] + path
+
+def render_metrics() -> str:
+    _collect()
+    return render_all()
+
+class MetricsMiddleware:
+    """ASGI middleware that records the latency of every HTTP request, labelled with its route template."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not settings.METRICS_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            HTTP_REQUEST_SECONDS.observe(
+                time.perf_counter() - started, method=scope["method"], route=_route_template(scope), status=status
+            )
@@ -1,9 +1,17 @@
 import os
 import json
+import time
 import httpx
 from typing import Dict, Any
 
 from app.core.config import settings
+from app.utils.prometheus import Counter, Histogram
+
+LLM_REQUEST_SECONDS = Histogram(
+    "fastdb_llm_request_seconds", "Latency of chat completion requests to the LLM.", ["outcome"],
+    buckets=(0.25, 0.5, 1.0, 2.0, 4.0, 8.0, 15.0, 30.0, 45.0),
+)
+LLM_TOKENS = Counter("fastdb_llm_tokens_total", "Tokens used by LLM requests, as reported by the API.", ["kind"])
 
 class NLPEngine:
     """
@@ -103,15 +111,25 @@ Example Response:
                     "response_format": {"type": "json_object"}
                 }
                 
-                response = await client.post(
-                    f"{self.base_url}/chat/completions",
-                    headers=self.headers,
-                    json=payload
-                )
+                started = time.perf_counter()
+                outcome = "error"
+                try:
+                    response = await client.post(
+                        f"{self.base_url}/chat/completions",
+                        headers=self.headers,
+                        json=payload
+                    )
+                    outcome = "ok" if response.is_success else f"http_{response.status_code}"
+                finally:
+                    LLM_REQUEST_SECONDS.observe(time.perf_counter() - started, outcome=outcome)
                 
                 response.raise_for_status() # Raises an exception for 4xx/5xx responses
                 
                 result = response.json()
+                usage = result.get("usage") or {}
+                for kind in ("prompt_tokens", "completion_tokens"):
+                    if usage.get(kind):
+                        LLM_TOKENS.inc(usage[kind], kind=kind.removesuffix("_tokens"))
                 content = result["choices"][0]["message"]["content"]
                 return json.loads(content)
                     
@@ -0,0 +1,43 @@
+# app/core/principal_cache.py
+import hashlib
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.db.snapshot import detached_snapshot
+from app.models.user_model import User
+from app.utils.ttl_cache import TTLCache
+
+# Authenticated users keyed by ("jwt", email) or ("api_key", sha256(api_key)).
+# Values are detached User snapshots, so a hit costs no metadata-DB round trip.
+# Anything that changes a user's email or API key, or removes the user, must call invalidate_user.
+_principals = TTLCache(
+    "auth_principals",
+    ttl_seconds=settings.AUTH_CACHE_TTL_SECONDS,
+    max_entries=settings.AUTH_CACHE_MAX_ENTRIES,
+)
+
+def _cache_key(kind: str, credential: str) -> tuple:
+    if kind == "api_key":
+        # Never keep raw API keys in memory longer than needed.
+        credential = hashlib.sha256(credential.encode()).hexdigest()
+    return (kind, credential)
+
+def get_cached_principal(db: Session, *, kind: str, credential: str) -> User | None:
+    """Returns the cached user for a credential, attached to `db`, or None on a miss."""
+    snapshot = _principals.get(_cache_key(kind, credential))
+    if snapshot is None:
+        return None
+    return db.merge(snapshot, load=False)
+
+def cache_principal(*, kind: str, credential: str, user: User) -> None:
+    _principals.set(_cache_key(kind, credential), detached_snapshot(user))
+
+def invalidate_user(user_id: str) -> None:
+    """
+    Drops every cached credential of a user, e.g. after an email or API key change.
+    Only in this process: other workers keep theirs for up to AUTH_CACHE_TTL_SECONDS.
+    """
+    _principals.invalidate_where(lambda key, snapshot: snapshot.user_id == user_id)
+
+def get_principal_cache_stats() -> dict:
+    return _principals.stats()
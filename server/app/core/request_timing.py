@@ -0,0 +1,106 @@
+# app/core/request_timing.py
+"""
+Per-request stage timing.
+
+ServerTimingMiddleware starts a timer for every HTTP request and keeps it in a
+context variable, so code anywhere below the route can wrap a step in
+`with stage("llm"):` without threading anything through. Durations of a stage
+entered more than once are summed. When the response starts, the stages are
+sent in a Server-Timing header, together with the cache tier that answered the
+request and the total time; routes can also put them in their response body
+via current_timings().
+"""
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict
+
+from app.core.config import settings
+from app.utils.prometheus import Counter
+
+# A cached template that fails and is regenerated counts once as "template" and once as "miss".
+QUERY_CACHE_TIERS = Counter(
+    "fastdb_query_cache_tier_total", "Query endpoint requests by the Rapid Cache tier that supplied their SQL.", ["tier"]
+)
+
+class RequestTimer:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages: Dict[str, float] = {}
+        self.cache_tier: str | None = None
+        # Batch queries may time stages from several threadpool workers at once.
+        self._lock = threading.Lock()
+
+    def add(self, name: str, seconds: float):
+        with self._lock:
+            self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def elapsed_ms(self) -> float:
+        return (time.perf_counter() - self.started) * 1000
+
+    def stages_ms(self) -> Dict[str, float]:
+        with self._lock:
+            return {name: round(seconds * 1000, 2) for name, seconds in self.stages.items()}
+
+    def header_value(self) -> str:
+        entries = [f"{name};dur={ms}" for name, ms in self.stages_ms().items()]
+        if self.cache_tier:
+            entries.append(f'cache;desc="{self.cache_tier}"')
+        entries.append(f"total;dur={round(self.elapsed_ms(), 2)}")
+        return ", ".join(entries)
+
+_current: ContextVar[RequestTimer | None] = ContextVar("request_timer", default=None)
+
+@contextmanager
+def stage(name: str):
+    """Times the enclosed block as `name` in the current request. Outside a request it does nothing."""
+    timer = _current.get()
+    if timer is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timer.add(name, time.perf_counter() - started)
+
+def set_cache_tier(tier: str):
+    """Records which cache tier answered the request: "template", "history", "miss" (the NLP engine) or "sql" (raw SQL)."""
+    QUERY_CACHE_TIERS.inc(tier=tier)
+    timer = _current.get()
+    if timer is not None:
+        timer.cache_tier = tier
+
+def current_timings() -> dict | None:
+    """The stages timed so far (in milliseconds) and the cache tier, or None when timing is off."""
+    timer = _current.get()
+    if timer is None:
+        return None
+    return {"cache": timer.cache_tier, "stages": timer.stages_ms(), "elapsed": round(timer.elapsed_ms(), 2)}
+
+class ServerTimingMiddleware:
+    """ASGI middleware that times each HTTP request and adds a Server-Timing header to its response."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not settings.SERVER_TIMING_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        timer = RequestTimer()
+        token = _current.set(timer)
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", timer.header_value().encode("latin-1")))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _current.reset(token)
@@ -1,4 +1,6 @@
-from fastapi import HTTPException, status, Depends, Request
+import logging
+import hmac
+from fastapi import HTTPException, status, Depends, Request, Header
 from jose import JWTError, jwt
 from datetime import datetime, timedelta, timezone
 from fastapi.security import OAuth2PasswordBearer
@@ -8,8 +10,14 @@ from sqlalchemy.orm import Session
 from app.db.session import get_db_session
 from app.services.user_service import get_user_by_api_key
 from app.services import user_service
+from app.utils.gen_apikey import API_KEY_PREFIX
 
 from .config import settings
+from . import principal_cache
+from .logging_config import bind_user
+from .request_timing import stage
+
+logger = logging.getLogger(__name__)
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/login")
 
@@ -35,9 +43,29 @@ def _decode_jwt_and_get_user(token: str, db: Session):
     except JWTError:
         raise credentials_exception
     
+    user = principal_cache.get_cached_principal(db, kind="jwt", credential=token_data.email)
+    if user is not None:
+        return user
+
     user = user_service.get_user_by_email(db, email=token_data.email)
     if user is None:
         raise credentials_exception
+    principal_cache.cache_principal(kind="jwt", credential=token_data.email, user=user)
+    return user
+
+def _get_user_by_api_key(token: str, db: Session):
+    user = principal_cache.get_cached_principal(db, kind="api_key", credential=token)
+    if user is not None:
+        return user
+
+    user = get_user_by_api_key(db, api_key=token)
+    if user is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Could not validate credentials (invalid API key)",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    principal_cache.cache_principal(kind="api_key", credential=token, user=user)
     return user
 
 
@@ -59,21 +87,19 @@ async def get_current_user(
     except ValueError:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid Authorization header format. Use 'Bearer <token>'.")
 
-    # --- The Core Logic: Try JWT first, then API Key ---
-    try:
-        # Call our new internal helper function.
-        user = _decode_jwt_and_get_user(token=token, db=db)
-        print("DEBUG: Authenticated user via JWT.")
-        return user
-    except HTTPException as jwt_exc:
-        # If it's not a valid JWT, it might be an API Key.
-        user = get_user_by_api_key(db, api_key=token)
-        if not user:
-            # If it's not a valid API key either, then authentication fails.
-            raise jwt_exc
-        
-        print("DEBUG: Authenticated user via API Key.")
+    # --- The Core Logic: API keys carry a fixed prefix, everything else must be a JWT ---
+    if token.startswith(API_KEY_PREFIX):
+        with stage("auth"):
+            user = _get_user_by_api_key(token=token, db=db)
+        bind_user(user.user_id)
+        logger.debug("Authenticated user via API key.")
         return user
+
+    with stage("auth"):
+        user = _decode_jwt_and_get_user(token=token, db=db)
+    bind_user(user.user_id)
+    logger.debug("Authenticated user via JWT.")
+    return user
     
 def get_current_user_from_session(
     token: str = Depends(oauth2_scheme), 
@@ -83,4 +109,10 @@ def get_current_user_from_session(
     A dependency that ONLY validates a JWT session token.
     Useful for account management endpoints.
     """
-    return _decode_jwt_and_get_user(token=token, db=db)
\ No newline at end of file
+    return _decode_jwt_and_get_user(token=token, db=db)
+def require_admin_key(x_admin_key: str | None = Header(None, alias="X-Admin-Key")):
+    """Guards the operator API under /admin with the ADMIN_API_KEY shared secret."""
+    if not settings.ADMIN_API_KEY:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="The admin API is disabled.")
+    if not x_admin_key or not hmac.compare_digest(x_admin_key, settings.ADMIN_API_KEY):
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid admin key.")
@@ -31,9 +31,11 @@ def execute_sql(connection: Connection, sql: str, params: Union[Dict, List, Tupl
     except (SQLAlchemyError, DBAPIError) as e:
         
         error_message = str(e)
+        sqlstate = None
         
         if hasattr(e, 'orig') and e.orig:
-            # Get the specific error message from the database driver
+            # Get the specific error message and SQLSTATE code from the database driver
             error_message = str(e.orig).strip()
+            sqlstate = getattr(e.orig, 'pgcode', None)
 
-        return {"success": False, "message": error_message}
\ No newline at end of file
+        return {"success": False, "message": error_message, "sqlstate": sqlstate}
\ No newline at end of file
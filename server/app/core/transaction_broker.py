@@ -0,0 +1,72 @@
+# server/app/core/transaction_broker.py
+"""
+Standalone process that owns interactive transactions on behalf of API workers.
+
+Run one or more of these next to the API and list them in TRANSACTION_BROKERS:
+
+    python -m app.core.transaction_broker --host 0.0.0.0 --port 7070
+
+Workers talk to it through app.core.transaction_router over an authenticated
+multiprocessing connection; the broker keeps the open connections and runs
+the same reaper and limits as the in-process transaction manager.
+"""
+import argparse
+import logging
+import threading
+from multiprocessing.connection import Listener, AuthenticationError
+
+from app.core import transaction_manager, transaction_router
+from app.core.logging_config import configure_logging, stop_logging
+
+logger = logging.getLogger(__name__)
+
+def _dispatch(op: str, kwargs: dict):
+    if op == "begin":
+        return transaction_router.begin_local(**kwargs)
+    if op == "execute":
+        return transaction_router.execute_local(kwargs.pop("tx_id"), kwargs.pop("statements"), **kwargs)
+    if op == "end":
+        return transaction_router.end_local(kwargs.pop("tx_id"), **kwargs)
+    if op == "stats":
+        return transaction_manager.get_transaction_stats()
+    raise ValueError(f"Unknown broker operation '{op}'.")
+
+def _serve_client(conn):
+    with conn:
+        while True:
+            try:
+                op, kwargs = conn.recv()
+            except (EOFError, OSError):
+                return
+            try:
+                reply = ("ok", _dispatch(op, kwargs))
+            except Exception as e:
+                reply = ("error", (type(e).__name__, str(e)))
+            try:
+                conn.send(reply)
+            except OSError:
+                return
+
+def serve(host: str, port: int):
+    configure_logging()
+    transaction_manager.start_reaper()
+    logger.info("Transaction broker listening on %s:%s", host, port)
+    try:
+        with Listener((host, port), authkey=transaction_router.broker_authkey()) as listener:
+            while True:
+                try:
+                    conn = listener.accept()
+                except (AuthenticationError, EOFError, OSError) as e:
+                    logger.warning("Rejected broker connection: %s", e)
+                    continue
+                threading.Thread(target=_serve_client, args=(conn,), daemon=True).start()
+    finally:
+        transaction_manager.stop_reaper()
+        stop_logging()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="FastDB transaction broker")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=7070)
+    args = parser.parse_args()
+    serve(args.host, args.port)
@@ -1,46 +1,197 @@
 # server/app/core/transaction_manager.py
+import logging
+import time
 import uuid
 import threading
-from typing import Dict
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Dict, Iterator
+from sqlalchemy import text
 from sqlalchemy.engine import Connection
 
-# This will store our active transactions.
-# The key is the transaction_id (str), the value is the Connection object.
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+class TransactionLimitError(Exception):
+    """Raised when a tenant or user already holds the maximum number of open transactions."""
+
+@dataclass
+class _Transaction:
+    connection: Connection
+    tenant: str
+    user_id: str
+    created_at: float
+    last_activity: float
+    # Number of requests currently executing on the connection. Busy transactions are never reaped.
+    busy: int = 0
+
+# This will store our active transactions, keyed by transaction_id.
 # Using a lock makes it safe for concurrent requests.
-_active_transactions: Dict[str, Connection] = {}
+_active_transactions: Dict[str, _Transaction] = {}
 _lock = threading.Lock()
 
-def begin_transaction(connection: Connection) -> str:
-    """Starts a transaction, stores the connection, and returns a new transaction ID."""
+_stats = {"opened": 0, "committed": 0, "rolled_back": 0, "reaped": 0, "rejected": 0}
+
+_reaper_thread: threading.Thread | None = None
+_reaper_stop = threading.Event()
+
+def begin_transaction(connection: Connection, *, tenant: str, user_id: str) -> str:
+    """
+    Starts a transaction, stores the connection, and returns a new transaction ID.
+    `tenant` is the physical database name the connection belongs to.
+    """
+    now = time.monotonic()
     with _lock:
+        open_txs = list(_active_transactions.values())
+        if sum(1 for tx in open_txs if tx.tenant == tenant) >= settings.TRANSACTION_MAX_PER_TENANT:
+            _stats["rejected"] += 1
+            raise TransactionLimitError("Too many open transactions for this database.")
+        if sum(1 for tx in open_txs if tx.user_id == user_id) >= settings.TRANSACTION_MAX_PER_USER:
+            _stats["rejected"] += 1
+            raise TransactionLimitError("Too many open transactions for this user.")
+
         tx_id = str(uuid.uuid4())
+        # Reserve the slot while busy so the reaper leaves it alone until BEGIN has run.
+        _active_transactions[tx_id] = _Transaction(connection, tenant, user_id, now, now, busy=1)
+        _stats["opened"] += 1
+
+    try:
         connection.begin() # Start the actual DB transaction
-        _active_transactions[tx_id] = connection
-        return tx_id
+        # Let Postgres end the transaction itself if this process never does (e.g. it crashes).
+        idle_timeout_ms = (settings.TRANSACTION_IDLE_TIMEOUT_SECONDS + 2 * settings.TRANSACTION_REAPER_INTERVAL_SECONDS) * 1000
+        connection.execute(text(f"SET LOCAL idle_in_transaction_session_timeout = {int(idle_timeout_ms)}"))
+    except Exception:
+        with _lock:
+            _active_transactions.pop(tx_id, None)
+        connection.close()
+        raise
+
+    with _lock:
+        _active_transactions[tx_id].busy -= 1
+    return tx_id
 
-def get_transaction_connection(tx_id: str) -> Connection | None:
+def _lookup(tx_id: str, user_id: str | None, tenant: str | None) -> _Transaction | None:
+    tx = _active_transactions.get(tx_id)
+    if tx is None:
+        return None
+    # A transaction is only visible to the user who opened it, on the database it was opened on.
+    if (user_id is not None and tx.user_id != user_id) or (tenant is not None and tx.tenant != tenant):
+        return None
+    return tx
+
+def get_transaction_connection(tx_id: str, *, user_id: str | None = None, tenant: str | None = None) -> Connection | None:
     """Retrieves an active connection using its transaction ID."""
     with _lock:
-        return _active_transactions.get(tx_id)
+        tx = _lookup(tx_id, user_id, tenant)
+        if tx is None:
+            return None
+        tx.last_activity = time.monotonic()
+        return tx.connection
+
+@contextmanager
+def use_transaction(tx_id: str, *, user_id: str | None = None, tenant: str | None = None) -> Iterator[Connection | None]:
+    """
+    Yields the connection of an active transaction (or None) and marks it busy
+    for the duration, so the reaper cannot roll it back mid-statement.
+    """
+    with _lock:
+        tx = _lookup(tx_id, user_id, tenant)
+        if tx is not None:
+            tx.busy += 1
+    if tx is None:
+        yield None
+        return
+    try:
+        yield tx.connection
+    finally:
+        with _lock:
+            tx.busy -= 1
+            tx.last_activity = time.monotonic()
+
+def _close(tx_id: str, connection: Connection, commit: bool):
+    try:
+        if commit:
+            connection.commit()
+            logger.debug("Transaction %s committed.", tx_id)
+        else:
+            connection.rollback()
+            logger.debug("Transaction %s rolled back.", tx_id)
+    finally:
+        # This is the most important line. It returns the connection to the pool.
+        connection.close()
+        logger.debug("Connection for transaction %s returned to the pool.", tx_id)
 
 def end_transaction(tx_id: str, commit: bool = True):
     """Ends a transaction by committing or rolling back, and cleans up."""
       # Use pop to atomically get the connection and remove it from the dict.
     with _lock:
-        connection = _active_transactions.pop(tx_id, None)
+        tx = _active_transactions.pop(tx_id, None)
+        if tx:
+            _stats["committed" if commit else "rolled_back"] += 1
 
-    if connection:
-        print(f"DEBUG: Ending transaction {tx_id} on connection {id(connection)}. Commit: {commit}")
-        try:
-            if commit:
-                connection.commit()
-                print(f"DEBUG: Transaction {tx_id} committed.")
-            else:
-                connection.rollback()
-                print(f"DEBUG: Transaction {tx_id} rolled back.")
-        finally:
-            # This is the most important line. It returns the connection to the pool.
-            connection.close()
-            print(f"DEBUG: Connection for transaction {tx_id} closed and returned to pool.")
+    if tx:
+        logger.debug("Ending transaction %s (commit: %s).", tx_id, commit)
+        _close(tx_id, tx.connection, commit)
     else:
-        print(f"WARN: Attempted to end non-existent transaction {tx_id}.")
\ No newline at end of file
+        logger.warning("Attempted to end non-existent transaction %s.", tx_id)
+
+def reap_expired_transactions() -> int:
+    """
+    Rolls back transactions that have been idle longer than the idle timeout or
+    open longer than the maximum lifetime. Returns the number reaped.
+    """
+    now = time.monotonic()
+    with _lock:
+        expired = [
+            tx_id for tx_id, tx in _active_transactions.items()
+            if not tx.busy and (
+                now - tx.last_activity > settings.TRANSACTION_IDLE_TIMEOUT_SECONDS
+                or now - tx.created_at > settings.TRANSACTION_MAX_LIFETIME_SECONDS
+            )
+        ]
+        reaped = [(tx_id, _active_transactions.pop(tx_id)) for tx_id in expired]
+        _stats["reaped"] += len(reaped)
+
+    for tx_id, tx in reaped:
+        logger.warning("Reaping expired transaction %s for database '%s'.", tx_id, tx.tenant)
+        try:
+            _close(tx_id, tx.connection, commit=False)
+        except Exception as e:
+            logger.error("Failed to roll back reaped transaction %s: %s", tx_id, e)
+    return len(reaped)
+
+def _reaper_loop():
+    while not _reaper_stop.wait(settings.TRANSACTION_REAPER_INTERVAL_SECONDS):
+        try:
+            reap_expired_transactions()
+        except Exception as e:
+            logger.error("Transaction reaper failed: %s", e)
+
+def start_reaper():
+    """Starts the background thread that rolls back abandoned transactions."""
+    global _reaper_thread
+    if _reaper_thread and _reaper_thread.is_alive():
+        return
+    _reaper_stop.clear()
+    _reaper_thread = threading.Thread(target=_reaper_loop, name="transaction-reaper", daemon=True)
+    _reaper_thread.start()
+
+def stop_reaper(rollback_open: bool = True):
+    """Stops the reaper and, on shutdown, rolls back whatever is still open."""
+    _reaper_stop.set()
+    if rollback_open:
+        for tx_id in list(_active_transactions):
+            end_transaction(tx_id, commit=False)
+
+def get_transaction_stats() -> dict:
+    with _lock:
+        open_txs = list(_active_transactions.values())
+        stats = dict(_stats)
+    now = time.monotonic()
+    stats["open"] = len(open_txs)
+    stats["open_by_tenant"] = {}
+    for tx in open_txs:
+        stats["open_by_tenant"][tx.tenant] = stats["open_by_tenant"].get(tx.tenant, 0) + 1
+    stats["oldest_age_seconds"] = round(max((now - tx.created_at for tx in open_txs), default=0.0), 3)
+    return stats
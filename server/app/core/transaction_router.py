@@ -0,0 +1,162 @@
+# server/app/core/transaction_router.py
+"""
+Routes transaction operations to whichever process holds the transaction.
+
+Without TRANSACTION_BROKERS configured, transactions live in this process
+(app.core.transaction_manager), which only works with a single worker.
+With brokers configured, every transaction is opened on a broker process
+(app.core.transaction_broker) and its ID is prefixed with the broker's index,
+so any worker on any instance sharing the same broker list can reach it.
+"""
+import hashlib
+import queue
+import threading
+import zlib
+from multiprocessing.connection import Client
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.core import transaction_manager
+from app.core.config import settings
+from app.core.sql_executor import execute_sql
+from app.db.engine import DEFAULT_SERVER_ID, get_engine_for_user_db
+
+# (sql, params) pairs executed in order inside a transaction.
+Statements = List[Tuple[str, Optional[Dict[str, Any]]]]
+
+class TransactionBrokerUnavailable(RuntimeError):
+    """Raised when the broker that owns a transaction cannot be reached."""
+
+def broker_authkey() -> bytes:
+    if settings.TRANSACTION_BROKER_AUTHKEY:
+        return settings.TRANSACTION_BROKER_AUTHKEY.encode()
+    return hashlib.sha256(f"fastdb-tx-broker:{settings.JWTSECRET_KEY}".encode()).digest()
+
+def parse_broker_address(address: str) -> Tuple[str, int]:
+    host, _, port = address.strip().rpartition(":")
+    return host, int(port)
+
+# --- Local (in-process) implementation, also used by the broker process itself ---
+
+def begin_local(*, tenant: str, user_id: str, server_id: str = DEFAULT_SERVER_ID) -> str:
+    connection = get_engine_for_user_db(tenant, server_id).connect() # Get a fresh connection from the pool
+    try:
+        return transaction_manager.begin_transaction(connection, tenant=tenant, user_id=user_id)
+    except transaction_manager.TransactionLimitError:
+        connection.close()
+        raise
+
+def execute_local(tx_id: str, statements: Statements, *, user_id: str, tenant: str) -> List[dict] | None:
+    """Runs statements in an open transaction, stopping at the first failure. None if not found."""
+    with transaction_manager.use_transaction(tx_id, user_id=user_id, tenant=tenant) as connection:
+        if connection is None:
+            return None
+        results = []
+        for sql, params in statements:
+            result = execute_sql(connection, sql, params=params)
+            results.append(result)
+            if not result.get("success"):
+                break
+        return results
+
+def end_local(tx_id: str, *, user_id: str, commit: bool) -> bool:
+    if not transaction_manager.get_transaction_connection(tx_id, user_id=user_id):
+        return False
+    transaction_manager.end_transaction(tx_id, commit=commit)
+    return True
+
+# --- Remote (broker) implementation ---
+
+class _BrokerClient:
+    """A small pool of authenticated connections to one broker."""
+
+    def __init__(self, address: str):
+        self.address = parse_broker_address(address)
+        self._idle: "queue.LifoQueue" = queue.LifoQueue()
+
+    def _connect(self):
+        try:
+            return Client(self.address, authkey=broker_authkey())
+        except OSError as e:
+            raise TransactionBrokerUnavailable(f"Transaction broker {self.address} is unreachable: {e}")
+
+    def call(self, op: str, **kwargs):
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            conn = self._connect()
+
+        try:
+            conn.send((op, kwargs))
+        except OSError:
+            # A pooled connection went stale (e.g. the broker restarted); the request was never delivered.
+            conn.close()
+            conn = self._connect()
+            conn.send((op, kwargs))
+
+        try:
+            status, payload = conn.recv()
+        except (EOFError, OSError) as e:
+            conn.close()
+            raise TransactionBrokerUnavailable(f"Transaction broker {self.address} dropped the connection: {e}")
+        self._idle.put(conn)
+
+        if status == "error":
+            error_type, message = payload
+            if error_type == "TransactionLimitError":
+                raise transaction_manager.TransactionLimitError(message)
+            raise RuntimeError(message)
+        return payload
+
+_clients: Dict[int, _BrokerClient] = {}
+_clients_lock = threading.Lock()
+
+def _broker_addresses() -> List[str]:
+    return [a for a in settings.TRANSACTION_BROKERS.split(",") if a.strip()]
+
+def _client(index: int) -> _BrokerClient:
+    with _clients_lock:
+        if index not in _clients:
+            _clients[index] = _BrokerClient(_broker_addresses()[index])
+        return _clients[index]
+
+def _split(tx_id: str) -> Tuple[int | None, str]:
+    """Splits a routed ID "b<index>.<local id>" into its parts; plain IDs are local."""
+    prefix, dot, local_id = tx_id.partition(".")
+    if dot and prefix.startswith("b") and prefix[1:].isdigit():
+        index = int(prefix[1:])
+        if index < len(_broker_addresses()):
+            return index, local_id
+    return None, tx_id
+
+# --- Public API used by the routes ---
+
+def begin(*, tenant: str, user_id: str, server_id: str = DEFAULT_SERVER_ID) -> str:
+    brokers = _broker_addresses()
+    if not brokers:
+        return begin_local(tenant=tenant, user_id=user_id, server_id=server_id)
+    # Keep a tenant's transactions on one broker so its per-tenant cap is enforced in one place.
+    index = zlib.crc32(tenant.encode()) % len(brokers)
+    local_id = _client(index).call("begin", tenant=tenant, user_id=user_id, server_id=server_id)
+    return f"b{index}.{local_id}"
+
+def execute(tx_id: str, statements: Statements, *, user_id: str, tenant: str) -> List[dict] | None:
+    index, local_id = _split(tx_id)
+    if index is None:
+        return execute_local(local_id, statements, user_id=user_id, tenant=tenant)
+    return _client(index).call("execute", tx_id=local_id, statements=statements, user_id=user_id, tenant=tenant)
+
+def end(tx_id: str, *, user_id: str, commit: bool) -> bool:
+    """Commits or rolls back a transaction. Returns False if it doesn't exist for this user."""
+    index, local_id = _split(tx_id)
+    if index is None:
+        return end_local(local_id, user_id=user_id, commit=commit)
+    return _client(index).call("end", tx_id=local_id, user_id=user_id, commit=commit)
+
+def get_stats() -> dict:
+    stats = {"local": transaction_manager.get_transaction_stats()}
+    for index, address in enumerate(_broker_addresses()):
+        try:
+            stats[address] = _client(index).call("stats")
+        except (TransactionBrokerUnavailable, RuntimeError) as e:
+            stats[address] = {"error": str(e)}
+    return stats
@@ -1,14 +1,37 @@
 # app/db/engine.py
-from sqlalchemy import create_engine
+import logging
+import time
+from sqlalchemy import create_engine, text
 from sqlalchemy.engine import Engine
+from sqlalchemy.pool import QueuePool
 from app.core.config import settings
+from app.utils.prometheus import Histogram
+
+logger = logging.getLogger(__name__)
+
+POOL_CHECKOUT_SECONDS = Histogram(
+    "fastdb_pool_checkout_seconds",
+    "Time to get a connection from a pool, including waiting for a free one and opening new ones.",
+    ["pool"],
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0, 30.0),
+)
+
+class TimedQueuePool(QueuePool):
+    """A QueuePool that records checkout times, labelled with the pool's logging name (the server ID)."""
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            POOL_CHECKOUT_SECONDS.observe(time.perf_counter() - started, pool=self.logging_name or "unnamed")
 
 # --- Engine 1: For the main application's metadata (users, virtual_dbs, etc.) ---
 MAIN_APP_DB_URL = (
     f"postgresql+psycopg2://{settings.POSTGRES_USER}:{settings.POSTGRES_PASSWORD}@"
     f"{settings.POSTGRES_SERVER}:{settings.POSTGRES_PORT}/{settings.POSTGRES_DB}"
 )
-main_app_engine = create_engine(MAIN_APP_DB_URL, pool_pre_ping=True)
+main_app_engine = create_engine(MAIN_APP_DB_URL, pool_pre_ping=True, poolclass=TimedQueuePool, pool_logging_name="metadata")
 
 # --- Engine 2: For administrative tasks (CREATE/DROP DATABASE) ---
 # Connects to the 'postgres' maintenance DB with a privileged user.
@@ -18,20 +41,85 @@ SUPERUSER_DB_URL = (
 )
 superuser_engine = create_engine(SUPERUSER_DB_URL, pool_pre_ping=True)
 
+# Tenant databases can live on several Postgres servers (see placement_service).
+# The default server is the one in Settings, which also holds the metadata database;
+# the others are looked up in fastdb_database_servers. Every server uses the same roles.
+DEFAULT_SERVER_ID = "default"
+_server_addresses: dict[str, tuple[str, int]] = {DEFAULT_SERVER_ID: (settings.POSTGRES_SERVER, settings.POSTGRES_PORT)}
+_superuser_engines: dict[str, Engine] = {DEFAULT_SERVER_ID: superuser_engine}
+
 # We will keep a cache of engines for user databases to avoid creating new pools constantly.
-_user_db_engines: dict[str, Engine] = {}
+# Keyed on (server_id, physical_name).
+_user_db_engines: dict[tuple[str, str], Engine] = {}
+
+def get_server_address(server_id: str) -> tuple[str, int]:
+    """Host and port of a database server, read from the registry table on first use."""
+    if server_id not in _server_addresses:
+        with main_app_engine.connect() as conn:
+            row = conn.execute(
+                text("SELECT host, port FROM fastdb_database_servers WHERE id = :id"), {"id": server_id}
+            ).first()
+        if row is None:
+            raise LookupError(f"Unknown database server '{server_id}'.")
+        _server_addresses[server_id] = (row.host, row.port)
+    return _server_addresses[server_id]
+
+def set_server_address(server_id: str, host: str, port: int):
+    """Records where a server lives, closing this process's pools to it if it moved."""
+    if _server_addresses.get(server_id) == (host, port):
+        return
+    _server_addresses[server_id] = (host, port)
+    if server_id != DEFAULT_SERVER_ID:
+        engine = _superuser_engines.pop(server_id, None)
+        if engine is not None:
+            engine.dispose()
+    for key in [key for key in _user_db_engines if key[0] == server_id]:
+        _user_db_engines.pop(key).dispose()
 
-def get_engine_for_user_db(physical_db_name: str) -> Engine:
+def get_superuser_engine_for_server(server_id: str = DEFAULT_SERVER_ID) -> Engine:
+    """The privileged maintenance-database engine of one database server."""
+    if server_id not in _superuser_engines:
+        host, port = get_server_address(server_id)
+        _superuser_engines[server_id] = create_engine(
+            superuser_engine.url.set(host=host, port=port), pool_pre_ping=True
+        )
+    return _superuser_engines[server_id]
+
+def get_engine_for_user_db(physical_db_name: str, server_id: str = DEFAULT_SERVER_ID) -> Engine:
     """
     Engine 3: For connecting to a specific user's physical database.
     This function creates and caches engines on-demand.
     """
-    if physical_db_name not in _user_db_engines:
-        print(f"Creating and caching new engine for user database: '{physical_db_name}'")
+    key = (server_id, physical_db_name)
+    if key not in _user_db_engines:
+        logger.info("Creating engine for user database '%s' on server '%s'.", physical_db_name, server_id)
+        host, port = get_server_address(server_id)
         user_db_url = (
             f"postgresql+psycopg2://{settings.POSTGRES_USER}:{settings.POSTGRES_PASSWORD}@"
-            f"{settings.POSTGRES_SERVER}:{settings.POSTGRES_PORT}/{physical_db_name}"
+            f"{host}:{port}/{physical_db_name}"
+        )
+        _user_db_engines[key] = create_engine(
+            user_db_url, pool_pre_ping=True, poolclass=TimedQueuePool, pool_logging_name=server_id
         )
-        _user_db_engines[physical_db_name] = create_engine(user_db_url, pool_pre_ping=True)
     
-    return _user_db_engines[physical_db_name]
\ No newline at end of file
+    return _user_db_engines[key]
+
+def dispose_engine_for_user_db(physical_db_name: str, server_id: str | None = None):
+    """
+    Closes this process's pooled connections to a user database, e.g. before it is copied or dropped.
+    Without `server_id`, pools to a database of that name on any server are closed.
+    """
+    for key in [key for key in _user_db_engines if key[1] == physical_db_name and server_id in (None, key[0])]:
+        engine = _user_db_engines.pop(key, None)
+        if engine is not None:
+            engine.dispose()
+
+def get_pool_stats() -> dict[str, dict[str, int]]:
+    """Connections checked out and idle in this process's pools: the metadata pool and tenant pools per server."""
+    stats = {"metadata": {"engines": 1, "checked_out": main_app_engine.pool.checkedout(), "idle": main_app_engine.pool.checkedin()}}
+    for (server_id, _), engine in list(_user_db_engines.items()):
+        server = stats.setdefault(server_id, {"engines": 0, "checked_out": 0, "idle": 0})
+        server["engines"] += 1
+        server["checked_out"] += engine.pool.checkedout()
+        server["idle"] += engine.pool.checkedin()
+    return stats
@@ -3,7 +3,7 @@ from sqlalchemy.orm import sessionmaker, Session
 from sqlalchemy.engine import Engine
 from typing import Generator
 
-from app.db.engine import main_app_engine, superuser_engine
+from app.db.engine import main_app_engine, get_superuser_engine_for_server, DEFAULT_SERVER_ID
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=main_app_engine)
 
@@ -15,9 +15,10 @@ def get_db_session() -> Generator[Session, None, None]:
         db.close()
 
 # --- Engine Provider for Admin Tasks ---
-def get_superuser_engine() -> Engine:
+def get_superuser_engine(server_id: str = DEFAULT_SERVER_ID) -> Engine:
     """
     Provides the special engine for administrative tasks like CREATE DATABASE.
-    This engine is connected to the 'postgres' maintenance database as a privileged user.
+    This engine is connected to the 'postgres' maintenance database as a privileged user,
+    on the given database server (the one in Settings by default).
     """
-    return superuser_engine
\ No newline at end of file
+    return get_superuser_engine_for_server(server_id)
@@ -0,0 +1,14 @@
+# app/db/snapshot.py
+from sqlalchemy import inspect
+from sqlalchemy.orm import make_transient_to_detached
+
+def detached_snapshot(instance):
+    """
+    Copies the column values of a loaded ORM instance into a new, detached
+    instance. The copy can be kept in a process-wide cache and re-attached to
+    any session with `session.merge(snapshot, load=False)` without a query.
+    """
+    mapper = inspect(instance).mapper
+    snapshot = mapper.class_(**{attr.key: getattr(instance, attr.key) for attr in mapper.column_attrs})
+    make_transient_to_detached(snapshot)
+    return snapshot
@@ -1,8 +1,17 @@
-from fastapi import FastAPI
+import logging
+from contextlib import asynccontextmanager
+from fastapi import Depends, FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from .api.api import api_router
 from .api.routes.auth import auth_router
-from .api.routes import health 
+from .api.routes import admin, health 
+from .core import authorization, transaction_manager
+from .services import admin_job_service, hibernation_service, history_writer, placement_service, provisioning_service
+from .core.config import settings
+from .core.logging_config import RequestContextMiddleware, configure_logging, current_request_id, stop_logging
+from .core.metrics import MetricsMiddleware
+from .core.request_timing import ServerTimingMiddleware
+from .core.security import require_admin_key
 
 from fastapi import Request
 from fastapi.responses import JSONResponse
@@ -15,8 +24,33 @@ custom_json_encoders = {
     date: lambda v: v.isoformat(),
 }
 
+logger = logging.getLogger(__name__)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    configure_logging()
+    logger.info("Metadata database '%s' on %s:%s as '%s'.", settings.POSTGRES_DB, settings.POSTGRES_SERVER,
+                settings.POSTGRES_PORT, settings.POSTGRES_USER)
+    # Background workers that live as long as the process
+    transaction_manager.start_reaper()
+    authorization.start_invalidation_listener()
+    history_writer.start_writer()
+    placement_service.sync_servers()
+    provisioning_service.start_pool_refiller()
+    admin_job_service.start_job_worker()
+    hibernation_service.start_scanner()
+    yield
+    hibernation_service.stop_scanner()
+    admin_job_service.stop_job_worker()
+    provisioning_service.stop_pool_refiller()
+    authorization.stop_invalidation_listener()
+    transaction_manager.stop_reaper()
+    history_writer.stop_writer()
+    stop_logging()
+
 app = FastAPI(
     title="FastDB - Natural Language Database Manager",
+    lifespan=lifespan,
     json_encoders=custom_json_encoders,
     description="An API for converting natural language to SQL and managing a database.",
     version="1.0.0"
@@ -38,25 +72,36 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*", "X-Target-Database"],
-    expose_headers=["*"],
+    expose_headers=["*", "Server-Timing", "X-Request-ID"],
 )
+app.add_middleware(ServerTimingMiddleware)
+app.add_middleware(MetricsMiddleware)
+app.add_middleware(RequestContextMiddleware)
+
+@app.exception_handler(hibernation_service.DatabaseWakingUp)
+async def database_waking_up_handler(request: Request, exc: hibernation_service.DatabaseWakingUp):
+    return JSONResponse(
+        status_code=503,
+        headers={"Retry-After": str(settings.HIBERNATION_WAKE_RETRY_AFTER_SECONDS)},
+        content={"status": "migrating" if exc.state == hibernation_service.MIGRATING else "waking_up", "detail": str(exc)},
+    )
 
 @app.exception_handler(Exception)
 async def generic_exception_handler(request: Request, exc: Exception):
-    # Print the full traceback to your console
-    import traceback
-    traceback.print_exc()
-    
+    logger.error("Unhandled error on %s %s", request.method, request.url.path, exc_info=exc)
+    request_id = current_request_id()
     return JSONResponse(
         status_code=500,
-        content={"message": f"An unexpected error occurred: {exc}"},
+        headers={"X-Request-ID": request_id} if request_id else None,
+        content={"message": f"An unexpected error occurred: {exc}", "request_id": request_id},
     )
 
 # Include the main API router
 app.include_router(api_router, prefix="/api")
 app.include_router(auth_router, prefix="/auth", tags=["Authentication"])
 
-app.include_router(health.router) 
+app.include_router(health.router)
+app.include_router(admin.router, prefix="/admin", tags=["Admin"], dependencies=[Depends(require_admin_key)]) 
 
 @app.get("/", tags=["Root"])
 async def read_root():
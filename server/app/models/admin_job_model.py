@@ -0,0 +1,33 @@
+# app/models/admin_job_model.py
+from sqlalchemy import Column, String, Text, JSON, Integer, DateTime, ForeignKey, Index
+from sqlalchemy.sql import func
+import uuid
+
+from app.db.base import Base
+
+def generate_uuid_hex():
+    return uuid.uuid4().hex
+
+class AdminJob(Base):
+    """An administrative operation (drop, rename) on a physical database, run by a background worker."""
+    __tablename__ = "fastdb_admin_jobs"
+
+    id = Column(String(32), primary_key=True, default=generate_uuid_hex)
+    user_id = Column(String(32), ForeignKey("fastdb_users.user_id", ondelete="CASCADE"), nullable=False, index=True)
+    # Kept after the database row is purged, so the job stays inspectable.
+    virtual_database_id = Column(String(32), nullable=True)
+    kind = Column(String(50), nullable=False)
+    payload = Column(JSON, nullable=False)
+    # pending -> running -> succeeded | failed | cancelled
+    status = Column(String(20), nullable=False, default="pending")
+    attempts = Column(Integer, nullable=False, default=0)
+    last_error = Column(Text, nullable=True)
+    # Not picked up before this time: retry backoff, or the off-peak window for drops.
+    run_after = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+    __table_args__ = (
+        # Serves the workers' poll for due jobs.
+        Index("ix_admin_jobs_status_run_after", "status", "run_after"),
+    )
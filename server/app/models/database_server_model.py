@@ -0,0 +1,20 @@
+# app/models/database_server_model.py
+from sqlalchemy import Column, String, Integer, DateTime, text
+from sqlalchemy.sql import func
+
+from app.db.base import Base
+
+class DatabaseServer(Base):
+    """A Postgres server that tenant databases can be placed on."""
+    __tablename__ = "fastdb_database_servers"
+
+    id = Column(String(64), primary_key=True)
+    host = Column(String(255), nullable=False)
+    port = Column(Integer, nullable=False, default=5432)
+    # active: takes new databases; draining: keeps its databases but takes no new ones; offline: neither.
+    status = Column(String(20), nullable=False, default="active", server_default=text("'active'"))
+    # Live databases the least-loaded policy places here at most; NULL means unlimited.
+    max_databases = Column(Integer, nullable=True)
+    # Relative capacity used to compare servers' load.
+    weight = Column(Integer, nullable=False, default=1, server_default=text("1"))
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
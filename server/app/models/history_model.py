@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, Text, ForeignKey  
+from sqlalchemy import Column, Integer, String, DateTime, Text, ForeignKey, Index
 from sqlalchemy.sql import func
 from app.db.base import Base
 
@@ -10,6 +10,16 @@ class QueryHistory(Base):
     virtual_database_id = Column(String(32), ForeignKey("fastdb_virtual_databases.id", ondelete="CASCADE"), nullable=False, index=True)
     command_text = Column(String(1000), nullable=True) 
     generated_sql = Column(Text, nullable=False)
+    # SHA-256 of the whitespace-normalized command / SQL (see caching_utils.lookup_hash)
+    command_hash = Column(String(64), nullable=True)
+    sql_hash = Column(String(64), nullable=False)
     executed_at = Column(DateTime(timezone=True), server_default=func.now())
     status = Column(String(50), nullable=False) 
-    query_type = Column(String(50), nullable=False)
\ No newline at end of file
+    query_type = Column(String(50), nullable=False)
+
+    __table_args__ = (
+        # Serves find_in_history: newest entry for a command on a database.
+        Index("ix_query_history_command_lookup", "user_id", "virtual_database_id", "command_hash", "executed_at"),
+        # One entry per distinct SQL on a database; the history writer upserts against it.
+        Index("uq_query_history_user_db_sql", "user_id", "virtual_database_id", "sql_hash", unique=True),
+    )
@@ -1,5 +1,6 @@
 # app/models/query_template_model.py
-from sqlalchemy import Column, String, Text, JSON
+from sqlalchemy import Column, String, Text, JSON, Boolean, Integer, DateTime, Index, text
+from sqlalchemy.sql import func
 from app.db.base import Base
 
 class QueryTemplate(Base):
@@ -10,4 +11,22 @@ class QueryTemplate(Base):
     user_id = Column(String(32), index=True, nullable=False)
     normalized_prompt = Column(Text, nullable=False)
     sql_template = Column(Text, nullable=False)
-    original_param_map = Column(JSON, nullable=False)
\ No newline at end of file
+    original_param_map = Column(JSON, nullable=False)
+    # Templates built from automatically extracted literals start unverified and are
+    # only served from cache once a second LLM answer has templatized the same way.
+    verified = Column(Boolean, nullable=False, default=True, server_default=text("true"))
+
+    # Tables the SQL touches and a hash of their columns when the template was built.
+    # A different fingerprint on the target database means the template is stale.
+    referenced_tables = Column(JSON, nullable=True)
+    schema_fingerprint = Column(String(64), nullable=True)
+
+    hit_count = Column(Integer, nullable=False, default=0, server_default=text("0"))
+    failure_count = Column(Integer, nullable=False, default=0, server_default=text("0"))
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    last_used_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    __table_args__ = (
+        # Serves per-user LRU / TTL eviction.
+        Index("ix_query_templates_user_last_used", "user_id", "last_used_at"),
+    )
@@ -1,5 +1,5 @@
 # server/app/models/virtual_database_model.py
-from sqlalchemy import Column, String, ForeignKey, DateTime, func
+from sqlalchemy import Column, String, ForeignKey, DateTime, func, text
 from sqlalchemy.orm import relationship
 import uuid
 
@@ -17,8 +17,19 @@ class VirtualDatabase(Base):
     virtual_name = Column(String(255), nullable=False)
     # The actual, unique name of the database in PostgreSQL
     physical_name = Column(String(255), unique=True, nullable=False)
+    # The fastdb_database_servers entry the physical database lives on.
+    server_id = Column(String(64), nullable=False, default="default", server_default=text("'default'"), index=True)
     
     created_at = Column(DateTime(timezone=True), server_default=func.now())
+    # Soft delete: the database is hidden at once and physically dropped later by an admin job.
+    deleted_at = Column(DateTime(timezone=True), nullable=True, index=True)
+
+    # Hibernation: idle databases are dumped to an archive and dropped, then restored on next access.
+    # active -> hibernating -> hibernated -> waking -> active; "migrating" while moving to another server.
+    storage_state = Column(String(20), nullable=False, default="active", server_default=text("'active'"))
+    storage_state_since = Column(DateTime(timezone=True), nullable=True)
+    archive_path = Column(String(1024), nullable=True)
+    last_accessed_at = Column(DateTime(timezone=True), nullable=True)
 
     # This creates a relationship so you can easily access the user from a db object
     owner = relationship("User")
\ No newline at end of file
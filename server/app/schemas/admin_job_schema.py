@@ -0,0 +1,23 @@
+# app/schemas/admin_job_schema.py
+from pydantic import BaseModel
+from datetime import datetime
+from typing import Optional
+
+class AdminJobRead(BaseModel):
+    id: str
+    kind: str
+    status: str
+    virtual_database_id: Optional[str] = None
+    attempts: int
+    last_error: Optional[str] = None
+    run_after: datetime
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
+class AdminJobDetail(AdminJobRead):
+    """Operator view of a job, including its payload and progress."""
+    payload: dict
+    user_id: str
@@ -2,13 +2,49 @@
 from pydantic import BaseModel
 from typing import List, Dict, Any, Optional, Tuple
 
+from app.schemas.query_schema import QueryResponse
+
+class AggregateSpec(BaseModel):
+    # One of: count, sum, avg, min, max, count_distinct
+    function: str
+    column: str = "*"
+    alias: Optional[str] = None
+
+class JoinSpec(BaseModel):
+    table: str
+    # "inner" or "left"
+    type: str = "inner"
+    alias: Optional[str] = None
+    # Pairs of qualified columns, e.g. [("orders.customer_id", "customers.id")].
+    # When omitted, the condition is inferred from the foreign keys between the tables.
+    on: Optional[List[Tuple[str, str]]] = None
+
 class StructuredQueryRequest(BaseModel):
     table: str
+    joins: Optional[List[JoinSpec]] = None
     select: Optional[List[str]] = None
+    aggregates: Optional[List[AggregateSpec]] = None
     where: Optional[List[Tuple[str, str, Any]]] = None
+    group_by: Optional[List[str]] = None
+    # Each condition references an aggregate by its alias, e.g. ("count_all", ">", 5)
+    having: Optional[List[Tuple[str, str, Any]]] = None
     order_by: Optional[List[Tuple[str, str]]] = None
     limit: Optional[int] = None
     offset: Optional[int] = 0
 
 class InsertRequest(BaseModel):
-    data: List[Dict[str, Any]]
\ No newline at end of file
+    data: List[Dict[str, Any]]
+
+class BatchQueryItem(BaseModel):
+    # Caller-chosen ID used to key the result
+    id: str
+    query: StructuredQueryRequest
+
+class BatchQueryRequest(BaseModel):
+    queries: List[BatchQueryItem]
+    # Run the reads on several pooled connections at once instead of one after another
+    concurrent: bool = False
+
+class BatchQueryResponse(BaseModel):
+    success: bool
+    results: Dict[str, QueryResponse]
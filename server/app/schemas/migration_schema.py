@@ -0,0 +1,7 @@
+# app/schemas/migration_schema.py
+from pydantic import BaseModel, Field
+
+class MigrationCreate(BaseModel):
+    target_server_id: str = Field(..., min_length=1, max_length=64)
+    # "auto" uses logical replication when the source allows it, else a dump under a write freeze.
+    method: str = Field("auto", pattern="^(auto|logical|dump)$")
@@ -30,11 +30,20 @@ class QueryResultData(BaseModel):
 class QueryResultMetadata(BaseModel):
     rows_affected: int
 
+class QueryTimings(BaseModel):
+    # Cache tier that supplied the SQL: "template", "history", "miss" (NLP engine) or "sql" (raw SQL).
+    cache: Optional[str] = None
+    # Milliseconds spent in each stage, e.g. auth, tenant, llm, execute.
+    stages: Dict[str, float]
+    # Milliseconds since the request arrived, up to building the response.
+    elapsed: float
+
 class QueryResponse(BaseModel):
     success: bool
     message: str
     generated_sql: Optional[str] = None
     result: Optional[Union[QueryResultData, QueryResultMetadata, Dict[str, Any]]] = None
+    timings: Optional[QueryTimings] = None
 
 class QueryCommand(BaseModel):
     command: str
@@ -0,0 +1,44 @@
+# server/app/schemas/transaction_schema.py
+from pydantic import BaseModel
+from typing import List, Dict, Any, Optional, Literal
+
+from app.schemas.data_schema import StructuredQueryRequest
+from app.schemas.table_schema import InsertDataRequest, UpdateDataRequest, DeleteDataRequest
+from app.schemas.query_schema import QueryResultData, QueryResultMetadata
+
+class ScriptStep(BaseModel):
+    # Caller-chosen ID echoed back in the step's result
+    id: Optional[str] = None
+    # At most one operation per step; a step with only `savepoint` just sets the savepoint.
+    sql: Optional[str] = None
+    params: Optional[Dict[str, Any]] = None
+    select: Optional[StructuredQueryRequest] = None
+    insert: Optional[InsertDataRequest] = None
+    update: Optional[UpdateDataRequest] = None
+    delete: Optional[DeleteDataRequest] = None
+    # Named savepoint set before the step runs
+    savepoint: Optional[str] = None
+    # abort: roll back the whole script and stop.
+    # rollback_to_savepoint: undo back to `rollback_to` (or the latest named savepoint) and carry on.
+    # continue: undo only this step and carry on.
+    on_error: Literal["abort", "rollback_to_savepoint", "continue"] = "abort"
+    rollback_to: Optional[str] = None
+
+class ScriptRequest(BaseModel):
+    steps: List[ScriptStep]
+    # False runs the script and rolls it back, e.g. to preview its results
+    commit: bool = True
+
+class ScriptStepResult(BaseModel):
+    id: Optional[str] = None
+    index: int
+    success: bool
+    message: str
+    result: Optional[QueryResultData | QueryResultMetadata] = None
+    # Savepoint the transaction was rolled back to after this step failed, if any
+    rolled_back_to: Optional[str] = None
+
+class ScriptResponse(BaseModel):
+    success: bool
+    committed: bool
+    results: List[ScriptStepResult]
@@ -15,6 +15,10 @@ class VirtualDatabaseRead(VirtualDatabaseBase):
     physical_name: str
     created_at: datetime
     current_user_role: DBRole | None = None
+    # "active", or "hibernated" / "waking" while the database sits in cold storage
+    storage_state: str = "active"
+    # The database server it lives on
+    server_id: str = "default"
 
     class Config:
         from_attributes = True
\ No newline at end of file
@@ -0,0 +1,256 @@
+# app/services/admin_job_service.py
+"""
+Background jobs for administrative operations on physical databases.
+
+Requests only record a job row; worker threads in every API process poll the
+jobs table with SELECT ... FOR UPDATE SKIP LOCKED, so each job runs once no
+matter how many workers there are. Handlers are idempotent: they look at the
+current state of pg_database and the metadata row rather than replaying a
+recorded step, so a retried or reclaimed job converges instead of failing.
+Jobs that touch the same database are serialised with an advisory lock, and
+run against the server the database is placed on.
+"""
+import logging
+import threading
+import zlib
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict
+
+from sqlalchemy import or_, and_, func, text
+from sqlalchemy.orm import Session
+
+from app.core.authorization import invalidate_tenant_access
+from app.core.config import settings
+from app.db.engine import DEFAULT_SERVER_ID, dispose_engine_for_user_db
+from app.db.session import SessionLocal, get_superuser_engine
+from app.models.admin_job_model import AdminJob
+from app.models.user_model import User
+from app.models.virtual_database_model import VirtualDatabase
+from app.services import hibernation_service, history_service
+from app.utils.gen_physical_name import generate_physical_name
+
+logger = logging.getLogger(__name__)
+
+DROP_DATABASE = "drop_database"
+RENAME_DATABASE = "rename_database"
+
+_stats = {"succeeded": 0, "failed": 0, "retried": 0, "cancelled": 0}
+_lock = threading.Lock()
+
+_worker_thread: threading.Thread | None = None
+_worker_stop = threading.Event()
+_worker_wake = threading.Event()
+
+class JobCancelled(Exception):
+    """The job no longer applies, e.g. its database was restored before the drop ran."""
+
+def _count(key: str):
+    with _lock:
+        _stats[key] += 1
+
+def enqueue_job(db: Session, *, user_id: str, virtual_database_id: str | None, kind: str, payload: dict,
+                run_after: datetime | None = None) -> AdminJob:
+    """Adds a job to the session. It becomes visible to workers when the caller commits."""
+    job = AdminJob(
+        user_id=user_id,
+        virtual_database_id=virtual_database_id,
+        kind=kind,
+        payload=payload,
+        status="pending",
+        attempts=0,
+        run_after=run_after or datetime.now(timezone.utc),
+    )
+    db.add(job)
+    db.flush()
+    return job
+
+def wake_worker():
+    """Lets this process's worker pick up a just-committed job without waiting for the next poll."""
+    _worker_wake.set()
+
+def get_job(db: Session, *, user: User, job_id: str) -> AdminJob | None:
+    return db.query(AdminJob).filter(AdminJob.id == job_id, AdminJob.user_id == user.user_id).first()
+
+def cancel_pending_job(db: Session, *, virtual_database_id: str, kind: str) -> bool:
+    """Cancels a job that has not started yet. The caller commits."""
+    job = db.query(AdminJob).filter(
+        AdminJob.virtual_database_id == virtual_database_id,
+        AdminJob.kind == kind,
+        AdminJob.status == "pending"
+    ).with_for_update(skip_locked=True).first()
+    if job is None:
+        return False
+    job.status = "cancelled"
+    return True
+
+def _database_exists(conn, name: str) -> bool:
+    return conn.execute(text("SELECT 1 FROM pg_database WHERE datname = :name"), {"name": name}).scalar() is not None
+
+def _terminate_backends(conn, name: str):
+    conn.execute(text("""
+        SELECT pg_terminate_backend(pid) FROM pg_stat_activity
+        WHERE datname = :name AND pid <> pg_backend_pid()
+    """), {"name": name})
+
+def _run_drop(db: Session, job: AdminJob, conn):
+    virtual_db = db.get(VirtualDatabase, job.virtual_database_id) if job.virtual_database_id else None
+    if virtual_db is not None and virtual_db.deleted_at is None:
+        raise JobCancelled("The database was restored.")
+    # The row is authoritative: a rename may have run since the job was queued.
+    physical_name = virtual_db.physical_name if virtual_db is not None else job.payload["physical_name"]
+
+    dispose_engine_for_user_db(physical_name, _server_id(db, job))
+    if _database_exists(conn, physical_name):
+        _terminate_backends(conn, physical_name)
+        conn.execute(text(f'DROP DATABASE IF EXISTS "{physical_name}"'))
+    if virtual_db is not None:
+        hibernation_service.discard_archive(virtual_db)
+        db.delete(virtual_db)
+    history_service.invalidate_cached_history(virtual_database_id=job.virtual_database_id)
+
+def _run_rename(db: Session, job: AdminJob, conn):
+    virtual_db = db.get(VirtualDatabase, job.virtual_database_id)
+    if virtual_db is None or virtual_db.deleted_at is not None:
+        raise JobCancelled("The database was deleted.")
+    # Converge on the current virtual name, so several queued renames end in the right place whatever their order.
+    new_name = generate_physical_name(virtual_db.user_id, virtual_db.virtual_name)
+    old_name = virtual_db.physical_name
+    # Same name apart from the random suffix: already renamed.
+    if old_name[:-6] == new_name[:-6]:
+        return
+    if virtual_db.storage_state == hibernation_service.HIBERNATED:
+        # Nothing to rename yet; the restore creates the database under the new name.
+        virtual_db.physical_name = new_name
+        return
+    if virtual_db.storage_state != hibernation_service.ACTIVE:
+        raise RuntimeError(f"Database is {virtual_db.storage_state}; retrying later.")
+
+    if not _database_exists(conn, old_name):
+        # Renamed on an earlier attempt that failed before the row was updated.
+        renamed = [row.datname for row in conn.execute(
+            text("SELECT datname FROM pg_database WHERE left(datname, :n) = :prefix AND length(datname) = :length"),
+            {"n": len(new_name) - 6, "prefix": new_name[:-6], "length": len(new_name)}
+        )]
+        if len(renamed) != 1:
+            raise RuntimeError(f"Physical database '{old_name}' not found.")
+        virtual_db.physical_name = renamed[0]
+        return
+
+    dispose_engine_for_user_db(old_name, virtual_db.server_id)
+    _terminate_backends(conn, old_name)
+    conn.execute(text(f'ALTER DATABASE "{old_name}" RENAME TO "{new_name}"'))
+    virtual_db.physical_name = new_name
+
+_HANDLERS: Dict[str, Callable[[Session, AdminJob, object], None]] = {
+    DROP_DATABASE: _run_drop,
+    RENAME_DATABASE: _run_rename,
+}
+
+def register_handler(kind: str, handler: Callable[[Session, AdminJob, object], None]):
+    """Adds a job kind implemented in another module. `handler(db, job, conn)` gets the job's server connection."""
+    _HANDLERS[kind] = handler
+
+def _claim_next(db: Session) -> AdminJob | None:
+    """Marks the next due job as running. Running jobs whose worker died are reclaimed after ADMIN_JOB_STALE_SECONDS."""
+    now = datetime.now(timezone.utc)
+    job = db.query(AdminJob).filter(or_(
+        and_(AdminJob.status == "pending", AdminJob.run_after <= now),
+        and_(AdminJob.status == "running", AdminJob.updated_at < now - timedelta(seconds=settings.ADMIN_JOB_STALE_SECONDS)),
+    )).order_by(AdminJob.run_after).with_for_update(skip_locked=True).first()
+    if job is None:
+        db.rollback()
+        return None
+    job.status = "running"
+    job.attempts += 1
+    job.updated_at = now
+    db.commit()
+    return job
+
+def _server_id(db: Session, job: AdminJob) -> str:
+    """The server the job's database lives on; the payload remembers it once the row is purged."""
+    virtual_db = db.get(VirtualDatabase, job.virtual_database_id) if job.virtual_database_id else None
+    if virtual_db is not None:
+        return virtual_db.server_id
+    return job.payload.get("server_id", DEFAULT_SERVER_ID)
+
+def _run_job(db: Session, job: AdminJob):
+    lock_key = zlib.crc32(f"fastdb_admin_job:{job.virtual_database_id}".encode())
+    engine = get_superuser_engine(_server_id(db, job))
+    try:
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            conn.execute(text("SELECT pg_advisory_lock(:key)"), {"key": lock_key})
+            try:
+                _HANDLERS[job.kind](db, job, conn)
+                job.status = "succeeded"
+                job.last_error = None
+                db.commit()
+            finally:
+                conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": lock_key})
+        invalidate_tenant_access(database_id=job.virtual_database_id)
+        _count("succeeded")
+        logger.info("Admin job %s (%s) succeeded.", job.id, job.kind)
+    except JobCancelled as e:
+        db.rollback()
+        job.status = "cancelled"
+        job.last_error = str(e)
+        db.commit()
+        _count("cancelled")
+    except Exception as e:
+        db.rollback()
+        job.last_error = str(e)
+        if job.attempts < settings.ADMIN_JOB_MAX_ATTEMPTS:
+            job.status = "pending"
+            job.run_after = datetime.now(timezone.utc) + timedelta(
+                seconds=settings.ADMIN_JOB_RETRY_BACKOFF_SECONDS * 2 ** (job.attempts - 1)
+            )
+            _count("retried")
+            logger.warning("Admin job %s (%s) failed, retrying after %s: %s", job.id, job.kind, job.run_after, e)
+        else:
+            job.status = "failed"
+            _count("failed")
+            logger.error("Admin job %s (%s) failed for good: %s", job.id, job.kind, e)
+        db.commit()
+
+def run_due_jobs() -> int:
+    """Runs jobs until none are due. Returns the number run."""
+    count = 0
+    while not _worker_stop.is_set():
+        db = SessionLocal()
+        try:
+            job = _claim_next(db)
+            if job is None:
+                return count
+            _run_job(db, job)
+            count += 1
+        finally:
+            db.close()
+    return count
+
+def _worker_loop():
+    while not _worker_stop.is_set():
+        try:
+            run_due_jobs()
+        except Exception as e:
+            logger.error("Admin job worker failed: %s", e)
+        _worker_wake.wait(settings.ADMIN_JOB_POLL_INTERVAL_SECONDS)
+        _worker_wake.clear()
+
+def start_job_worker():
+    """Starts the background thread that runs queued admin jobs."""
+    global _worker_thread
+    if _worker_thread and _worker_thread.is_alive():
+        return
+    _worker_stop.clear()
+    _worker_thread = threading.Thread(target=_worker_loop, name="admin-job-worker", daemon=True)
+    _worker_thread.start()
+
+def stop_job_worker():
+    _worker_stop.set()
+    _worker_wake.set()
+
+def get_job_stats(db: Session) -> dict:
+    with _lock:
+        stats = dict(_stats)
+    rows = db.query(AdminJob.status, func.count(AdminJob.id)).group_by(AdminJob.status).all()
+    stats["by_status"] = {status: count for status, count in rows}
+    return stats
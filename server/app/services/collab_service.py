@@ -1,11 +1,12 @@
 # app/services/collaboration_service.py
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, joinedload
 from typing import List
 
 from app.models.user_model import User
 from app.models.virtual_database_model import VirtualDatabase
 from app.models.database_collab_model import DatabaseMember, DBRole
 from app.services import user_service
+from app.core.authorization import invalidate_tenant_access
 
 def add_member_to_db(db: Session, *, inviter: User, virtual_db: VirtualDatabase, invitee_email: str, role: DBRole) -> DatabaseMember:
     """Adds a user as a member to a virtual database."""
@@ -33,6 +34,7 @@ def add_member_to_db(db: Session, *, inviter: User, virtual_db: VirtualDatabase,
     db.add(new_member)
     db.commit()
     db.refresh(new_member)
+    invalidate_tenant_access(db, user_id=invitee.user_id)
     return new_member
 
 def update_member_role(
@@ -65,6 +67,7 @@ def update_member_role(
     member_record.role = new_role
     db.commit()
     db.refresh(member_record)
+    invalidate_tenant_access(db, user_id=member_user_id)
     return member_record
 
 def remove_member_from_db(
@@ -95,8 +98,18 @@ def remove_member_from_db(
     # Delete the record and commit the change.
     db.delete(member_record)
     db.commit()
+    invalidate_tenant_access(db, user_id=member_user_id)
     return 
 
 def get_database_members(db: Session, *, virtual_db: VirtualDatabase) -> List[DatabaseMember]:
-    """Lists all members of a virtual database."""
-    return db.query(DatabaseMember).filter_by(database_id=virtual_db.id).all()
\ No newline at end of file
+    """
+    Lists all members of a virtual database, with their users loaded in the same query.
+    The query also loads the database's owner, so virtual_db.owner needs no query of its own.
+    """
+    rows = db.query(VirtualDatabase, DatabaseMember).options(
+        joinedload(VirtualDatabase.owner),
+        joinedload(DatabaseMember.user)
+    ).outerjoin(
+        DatabaseMember, DatabaseMember.database_id == VirtualDatabase.id
+    ).filter(VirtualDatabase.id == virtual_db.id).all()
+    return [member for _, member in rows if member is not None]
\ No newline at end of file
@@ -0,0 +1,358 @@
+# app/services/hibernation_service.py
+"""
+Cold storage for idle tenant databases.
+
+A scanner (one per cluster, elected with an advisory lock, off-peak only) dumps
+databases nobody has resolved for HIBERNATION_IDLE_DAYS to a compressed pg_dump
+archive and drops them. The next request that needs the database starts a
+restore in the background and gets a 503 "waking up" answer until it is back.
+
+Before the dump the database is closed to new connections, its remaining
+sessions are ended, and it is renamed, so nothing can commit after the dump's
+snapshot; only pg_dump connects to the renamed copy. A session used since the
+idle cutoff (per pg_stat_activity) or a recorded access calls the hibernation
+off, and the database is reopened unchanged.
+
+Access times are buffered in memory and written by the history writer's flush hook.
+"""
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Dict
+
+from sqlalchemy import text
+
+from app.core import authorization
+from app.core.config import settings
+from app.db.engine import dispose_engine_for_user_db
+from app.db.session import SessionLocal, get_superuser_engine
+from app.models.virtual_database_model import VirtualDatabase
+from app.services import history_writer, provisioning_service
+from app.utils.off_peak import is_off_peak
+from app.utils.pg_tools import run_pg_tool
+
+logger = logging.getLogger(__name__)
+
+ACTIVE = "active"
+HIBERNATING = "hibernating"
+HIBERNATED = "hibernated"
+WAKING = "waking"
+# Frozen for the cutover to another database server (see migration_service).
+MIGRATING = "migrating"
+
+_SCAN_LOCK_KEY = 0x46444248  # "FDBH"
+# Name a database is dumped under; tenants connect by physical name, so they cannot reach it.
+_FROZEN_SUFFIX = "_hibernating"
+# How long terminated sessions get to exit before hibernation is called off.
+_TERMINATE_WAIT_SECONDS = 10
+
+_stats = {"hibernated": 0, "woken": 0, "hibernate_errors": 0, "wake_errors": 0, "aborted": 0}
+_pending_access: Dict[str, datetime] = {}
+_lock = threading.Lock()
+
+_scanner_thread: threading.Thread | None = None
+_scanner_stop = threading.Event()
+
+class DatabaseWakingUp(Exception):
+    """The database is hibernated or being restored; the client should retry shortly."""
+
+    def __init__(self, virtual_name: str, state: str):
+        self.virtual_name = virtual_name
+        self.state = state
+        if state == MIGRATING:
+            super().__init__(f"Database '{virtual_name}' is moving to another server. Retry in a few seconds.")
+        else:
+            super().__init__(f"Database '{virtual_name}' is waking up from hibernation. Retry in a few seconds.")
+
+def _count(key: str):
+    with _lock:
+        _stats[key] += 1
+
+def record_access(virtual_database_id: str):
+    with _lock:
+        _pending_access[virtual_database_id] = datetime.now(timezone.utc)
+
+def flush_access_times():
+    with _lock:
+        pending = list(_pending_access.items())
+        _pending_access.clear()
+    if not pending:
+        return
+    db = SessionLocal()
+    try:
+        db.execute(
+            text("UPDATE fastdb_virtual_databases SET last_accessed_at = :at WHERE id = :id"),
+            [{"id": database_id, "at": at} for database_id, at in pending]
+        )
+        db.commit()
+    finally:
+        db.close()
+
+history_writer.register_flush_hook(flush_access_times)
+
+def _set_state(db, database_id: str, new_state: str, *, expected: str | None = None, **values) -> bool:
+    """Compare-and-set on storage_state, so only one process moves a database between states."""
+    query = db.query(VirtualDatabase).filter(VirtualDatabase.id == database_id)
+    if expected is not None:
+        query = query.filter(VirtualDatabase.storage_state == expected)
+    updated = query.update(
+        {VirtualDatabase.storage_state: new_state, VirtualDatabase.storage_state_since: datetime.now(timezone.utc), **values},
+        synchronize_session=False
+    )
+    db.commit()
+    return updated == 1
+
+def _archive_path(physical_name: str) -> str:
+    return os.path.join(settings.HIBERNATION_ARCHIVE_DIR, f"{physical_name}.dump")
+
+def _idle_cutoff() -> datetime:
+    return datetime.now(timezone.utc) - timedelta(days=settings.HIBERNATION_IDLE_DAYS)
+
+def _database_exists(conn, name: str) -> bool:
+    return conn.execute(text("SELECT 1 FROM pg_database WHERE datname = :name"), {"name": name}).scalar() is not None
+
+def _freeze(conn, physical_name: str, cutoff: datetime) -> bool:
+    """
+    Closes the database to new connections, ends its idle sessions and renames it for the dump.
+    Returns False, leaving it closed for _unfreeze, if a session was used since `cutoff`.
+    """
+    conn.execute(text(f'ALTER DATABASE "{physical_name}" ALLOW_CONNECTIONS false'))
+    sessions = """
+        FROM pg_stat_activity WHERE datname = :name AND pid <> pg_backend_pid() AND backend_type = 'client backend'
+    """
+    in_use = conn.execute(
+        text(f"SELECT count(*) {sessions} AND (state IS DISTINCT FROM 'idle' OR state_change >= :cutoff)"),
+        {"name": physical_name, "cutoff": cutoff}
+    ).scalar()
+    if in_use:
+        return False
+    conn.execute(text(f"SELECT pg_terminate_backend(pid) {sessions}"), {"name": physical_name})
+    deadline = time.monotonic() + _TERMINATE_WAIT_SECONDS
+    while conn.execute(text(f"SELECT count(*) {sessions}"), {"name": physical_name}).scalar():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.1)
+    frozen_name = physical_name + _FROZEN_SUFFIX
+    conn.execute(text(f'ALTER DATABASE "{physical_name}" RENAME TO "{frozen_name}"'))
+    conn.execute(text(f'ALTER DATABASE "{frozen_name}" ALLOW_CONNECTIONS true'))
+    return True
+
+def _unfreeze(conn, physical_name: str):
+    """Undoes _freeze, wherever it stopped."""
+    frozen_name = physical_name + _FROZEN_SUFFIX
+    if _database_exists(conn, frozen_name) and not _database_exists(conn, physical_name):
+        conn.execute(text(f'ALTER DATABASE "{frozen_name}" RENAME TO "{physical_name}"'))
+    if _database_exists(conn, physical_name):
+        conn.execute(text(f'ALTER DATABASE "{physical_name}" ALLOW_CONNECTIONS true'))
+
+def hibernate_database(virtual_database_id: str) -> bool:
+    """Dumps an idle database to its archive and drops it. Returns True if it was hibernated."""
+    db = SessionLocal()
+    try:
+        cutoff = _idle_cutoff()
+        claimed = db.query(VirtualDatabase).filter(
+            VirtualDatabase.id == virtual_database_id,
+            VirtualDatabase.storage_state == ACTIVE,
+            VirtualDatabase.deleted_at.is_(None),
+            VirtualDatabase.created_at < cutoff,
+            (VirtualDatabase.last_accessed_at.is_(None)) | (VirtualDatabase.last_accessed_at < cutoff)
+        ).update(
+            {VirtualDatabase.storage_state: HIBERNATING, VirtualDatabase.storage_state_since: datetime.now(timezone.utc)},
+            synchronize_session=False
+        )
+        db.commit()
+        if not claimed:
+            return False
+        # Other processes stop serving it from their caches and see the new state.
+        authorization.invalidate_tenant_access(database_id=virtual_database_id)
+
+        virtual_db = db.get(VirtualDatabase, virtual_database_id)
+        physical_name = virtual_db.physical_name
+        server_id = virtual_db.server_id
+        frozen_name = physical_name + _FROZEN_SUFFIX
+        archive = _archive_path(physical_name)
+        partial = archive + ".partial"
+        engine = get_superuser_engine(server_id)
+        try:
+            os.makedirs(settings.HIBERNATION_ARCHIVE_DIR, exist_ok=True)
+            dispose_engine_for_user_db(physical_name, server_id)
+            with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+                frozen = _freeze(conn, physical_name, cutoff)
+                if frozen:
+                    # Resolved since the scan picked it: keep it.
+                    flush_access_times()
+                    db.refresh(virtual_db)
+                    frozen = not (virtual_db.last_accessed_at and virtual_db.last_accessed_at >= cutoff)
+                if not frozen:
+                    _count("aborted")
+                    _unfreeze(conn, physical_name)
+                    _set_state(db, virtual_database_id, ACTIVE, expected=HIBERNATING)
+                    return False
+
+            run_pg_tool("pg_dump", server_id, "--format=custom", f"--compress={settings.HIBERNATION_COMPRESSION_LEVEL}",
+                         f"--file={partial}", frozen_name)
+            os.replace(partial, archive)
+
+            with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+                conn.execute(text(f'DROP DATABASE IF EXISTS "{frozen_name}" WITH (FORCE)'))
+            _set_state(db, virtual_database_id, HIBERNATED, expected=HIBERNATING, archive_path=archive)
+        except Exception as e:
+            _count("hibernate_errors")
+            logger.error("Failed to hibernate '%s': %s", physical_name, getattr(e, 'stderr', None) or e)
+            if _database_missing(physical_name, server_id) and _database_missing(frozen_name, server_id):
+                # Failed after the drop: the archive is the database now.
+                _set_state(db, virtual_database_id, HIBERNATED, expected=HIBERNATING, archive_path=archive)
+            else:
+                with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+                    _unfreeze(conn, physical_name)
+                for path in (partial, archive):
+                    if os.path.exists(path):
+                        os.remove(path)
+                _set_state(db, virtual_database_id, ACTIVE, expected=HIBERNATING)
+            return False
+
+        _count("hibernated")
+        logger.info("Hibernated '%s' to '%s'.", physical_name, archive)
+        return True
+    finally:
+        db.close()
+
+def _database_missing(physical_name: str, server_id: str) -> bool:
+    with get_superuser_engine(server_id).connect() as conn:
+        return conn.execute(text("SELECT 1 FROM pg_database WHERE datname = :name"), {"name": physical_name}).scalar() is None
+
+def _restore(virtual_database_id: str):
+    db = SessionLocal()
+    try:
+        virtual_db = db.get(VirtualDatabase, virtual_database_id)
+        physical_name = virtual_db.physical_name
+        engine = get_superuser_engine(virtual_db.server_id)
+        try:
+            with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+                # template0: the archive brings its own fastdb_meta objects and extensions.
+                conn.execute(text(f'DROP DATABASE IF EXISTS "{physical_name}"'))
+                conn.execute(text(f'CREATE DATABASE "{physical_name}" TEMPLATE template0'))
+                provisioning_service.apply_database_defaults(conn, physical_name)
+            run_pg_tool("pg_restore", virtual_db.server_id, "--exit-on-error", f"--dbname={physical_name}", virtual_db.archive_path)
+        except Exception as e:
+            _count("wake_errors")
+            logger.error("Failed to restore '%s' from hibernation: %s", physical_name, getattr(e, 'stderr', None) or e)
+            with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+                conn.execute(text(f'DROP DATABASE IF EXISTS "{physical_name}"'))
+            # The next access tries again.
+            _set_state(db, virtual_database_id, HIBERNATED, expected=WAKING)
+            return
+
+        archive = virtual_db.archive_path
+        _set_state(db, virtual_database_id, ACTIVE, expected=WAKING, archive_path=None,
+                   last_accessed_at=datetime.now(timezone.utc))
+        if archive and os.path.exists(archive):
+            os.remove(archive)
+        _count("woken")
+        logger.info("Restored '%s' from hibernation.", physical_name)
+    finally:
+        db.close()
+
+def ensure_awake(virtual_db: VirtualDatabase):
+    """Raises DatabaseWakingUp unless the database is active, starting a restore if it is hibernated."""
+    if virtual_db.storage_state == ACTIVE:
+        return
+    if virtual_db.storage_state == HIBERNATED:
+        db = SessionLocal()
+        try:
+            # Only the request that wins the state change starts the restore.
+            if _set_state(db, virtual_db.id, WAKING, expected=HIBERNATED):
+                logger.info("Waking '%s' from hibernation.", virtual_db.physical_name)
+                threading.Thread(target=_restore, args=(virtual_db.id,), name="hibernation-wake", daemon=True).start()
+        finally:
+            db.close()
+    raise DatabaseWakingUp(virtual_db.virtual_name, virtual_db.storage_state)
+
+def discard_archive(virtual_db: VirtualDatabase):
+    """Deletes a hibernated database's archive, e.g. when the database itself is dropped."""
+    if virtual_db.archive_path and os.path.exists(virtual_db.archive_path):
+        os.remove(virtual_db.archive_path)
+
+def _recover_stuck(db):
+    """Settles databases left mid-transition by a process that died."""
+    stuck_before = datetime.now(timezone.utc) - timedelta(seconds=settings.HIBERNATION_STUCK_SECONDS)
+    stuck = db.query(VirtualDatabase).filter(
+        VirtualDatabase.storage_state.in_([HIBERNATING, WAKING]),
+        VirtualDatabase.storage_state_since < stuck_before
+    ).all()
+    for virtual_db in stuck:
+        archive = virtual_db.archive_path or _archive_path(virtual_db.physical_name)
+        if virtual_db.storage_state == WAKING:
+            with get_superuser_engine(virtual_db.server_id).connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+                conn.execute(text(f'DROP DATABASE IF EXISTS "{virtual_db.physical_name}"'))
+            _set_state(db, virtual_db.id, HIBERNATED, expected=WAKING)
+        elif (_database_missing(virtual_db.physical_name, virtual_db.server_id)
+              and _database_missing(virtual_db.physical_name + _FROZEN_SUFFIX, virtual_db.server_id)
+              and os.path.exists(archive)):
+            _set_state(db, virtual_db.id, HIBERNATED, expected=HIBERNATING, archive_path=archive)
+        else:
+            with get_superuser_engine(virtual_db.server_id).connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+                _unfreeze(conn, virtual_db.physical_name)
+            _set_state(db, virtual_db.id, ACTIVE, expected=HIBERNATING)
+        logger.warning("Recovered '%s' stuck in state '%s'.", virtual_db.physical_name, virtual_db.storage_state)
+
+def scan_for_idle_databases() -> int:
+    """Hibernates up to HIBERNATION_BATCH_SIZE idle databases. Returns the number hibernated."""
+    flush_access_times()
+    with get_superuser_engine().connect().execution_options(isolation_level="AUTOCOMMIT") as lock_conn:
+        if not lock_conn.execute(text("SELECT pg_try_advisory_lock(:key)"), {"key": _SCAN_LOCK_KEY}).scalar():
+            return 0
+        try:
+            db = SessionLocal()
+            try:
+                _recover_stuck(db)
+                cutoff = _idle_cutoff()
+                candidates = [row.id for row in db.query(VirtualDatabase.id).filter(
+                    VirtualDatabase.storage_state == ACTIVE,
+                    VirtualDatabase.deleted_at.is_(None),
+                    VirtualDatabase.created_at < cutoff,
+                    (VirtualDatabase.last_accessed_at.is_(None)) | (VirtualDatabase.last_accessed_at < cutoff)
+                ).order_by(VirtualDatabase.last_accessed_at.asc().nullsfirst()).limit(settings.HIBERNATION_BATCH_SIZE)]
+            finally:
+                db.close()
+            return sum(1 for database_id in candidates if not _scanner_stop.is_set() and hibernate_database(database_id))
+        finally:
+            lock_conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": _SCAN_LOCK_KEY})
+
+def _scanner_loop():
+    while not _scanner_stop.wait(settings.HIBERNATION_SCAN_INTERVAL_SECONDS):
+        if not is_off_peak():
+            continue
+        try:
+            scan_for_idle_databases()
+        except Exception as e:
+            logger.error("Hibernation scan failed: %s", e)
+
+def start_scanner():
+    """Starts the background thread that hibernates idle databases, if hibernation is enabled."""
+    global _scanner_thread
+    if not settings.HIBERNATION_ENABLED or (_scanner_thread and _scanner_thread.is_alive()):
+        return
+    _scanner_stop.clear()
+    _scanner_thread = threading.Thread(target=_scanner_loop, name="hibernation-scanner", daemon=True)
+    _scanner_thread.start()
+
+def stop_scanner():
+    _scanner_stop.set()
+
+def get_hibernation_stats() -> dict:
+    with _lock:
+        stats = dict(_stats)
+    db = SessionLocal()
+    try:
+        rows = db.execute(text(
+            "SELECT storage_state, count(*) FROM fastdb_virtual_databases WHERE deleted_at IS NULL GROUP BY storage_state"
+        )).all()
+    finally:
+        db.close()
+    stats["by_state"] = {state: count for state, count in rows}
+    stats["enabled"] = settings.HIBERNATION_ENABLED
+    stats["idle_days"] = settings.HIBERNATION_IDLE_DAYS
+    return stats
@@ -5,64 +5,98 @@ from app.models.saved_query_model import SavedQuery
 from app.models.user_model import User
 from app.models.virtual_database_model import VirtualDatabase
 from app.schemas.history_schema import SavedQueryCreate
+from app.services import history_writer
+from app.utils.caching_utils import lookup_hash
+from app.utils.ttl_cache import TTLCache
+from app.db.snapshot import detached_snapshot
+from app.core.config import settings
+
+# In-process L1 in front of find_in_history / find_in_history_sql, keyed on
+# (user_id, virtual_database_id, hash). Only hits are kept, as detached snapshots.
+_history_by_command = TTLCache("rapid_cache_history_command", ttl_seconds=settings.RAPID_CACHE_L1_TTL_SECONDS, max_entries=settings.RAPID_CACHE_L1_MAX_ENTRIES)
+_history_by_sql = TTLCache("rapid_cache_history_sql", ttl_seconds=settings.RAPID_CACHE_L1_TTL_SECONDS, max_entries=settings.RAPID_CACHE_L1_MAX_ENTRIES)
 
 def get_query_history(db: Session, *, owner: User, limit: int = 50):
     """Gets the query history ONLY for the specified owner."""
     return db.query(QueryHistory).filter(QueryHistory.user_id == owner.user_id).order_by(QueryHistory.executed_at.desc()).limit(limit).all()
 
-def log_query_history(db: Session, *, owner: User, virtual_db: VirtualDatabase, command: str, sql: str, status: str):
-    """Logs a query history entry for the specified owner."""
-
-    existing_entry = db.query(QueryHistory).filter(
-        QueryHistory.user_id == owner.user_id,
-        QueryHistory.generated_sql == sql
-    ).first()
-
-    # 2. If it exists, delete it.
-    if existing_entry:
-        print(f"DEBUG: Found and deleting duplicate history entry for user {owner.user_id}")
-        db.delete(existing_entry)
-        # We flush here to make sure the delete is part of the session's work
-        # before we add the new item.
-        db.flush() 
-
-    query_type = sql.strip().split()[0].upper()
-    db_history = QueryHistory(
-        user_id=owner.user_id, 
+def log_query_history(*, owner: User, virtual_db: VirtualDatabase, command: str, sql: str, status: str):
+    """
+    Logs a query history entry for the specified owner.
+    The entry is written in the background (see history_writer), so it shows up shortly after.
+    """
+    history_writer.enqueue(
+        user_id=owner.user_id,
         virtual_database_id=virtual_db.id,
-        command_text=command,
-        generated_sql=sql,
-        status=status,
-        query_type=query_type
+        command=command,
+        sql=sql,
+        status=status
     )
-    db.add(db_history)
-    db.commit()
-    db.refresh(db_history)
-    return db_history
+
+    command_key = (owner.user_id, virtual_db.id, lookup_hash(command))
+    sql_key = (owner.user_id, virtual_db.id, lookup_hash(sql))
+    if status == "success":
+        # Populate the L1 right away; the row itself is only written by the background writer.
+        entry = QueryHistory(
+            user_id=owner.user_id,
+            virtual_database_id=virtual_db.id,
+            command_text=command,
+            generated_sql=sql,
+            command_hash=command_key[2],
+            sql_hash=sql_key[2],
+            status=status
+        )
+        _history_by_command.set(command_key, entry)
+        _history_by_sql.set(sql_key, entry)
+    else:
+        # The upsert turns the stored entry for this SQL into an error entry.
+        _history_by_command.invalidate(command_key)
+        _history_by_sql.invalidate(sql_key)
+
+def invalidate_cached_history(*, virtual_database_id: str):
+    """Drops every L1 history entry for a database, e.g. after its schema changed or it was deleted."""
+    for cache in (_history_by_command, _history_by_sql):
+        cache.invalidate_where(lambda key, _: key[1] == virtual_database_id)
 
 def find_in_history(db: Session, *, owner: User, command: str, virtual_db: VirtualDatabase) -> QueryHistory | None:
     """
     Looks for a recent, successful execution of an identical command text for a user.
     This acts as a cache to avoid unnecessary LLM calls.
     """
-    return db.query(QueryHistory).filter(
+    key = (owner.user_id, virtual_db.id, lookup_hash(command))
+    cached = _history_by_command.get(key)
+    if cached is not None:
+        return cached
+
+    entry = db.query(QueryHistory).filter(
         QueryHistory.user_id == owner.user_id,
-        QueryHistory.command_text == command,
         QueryHistory.virtual_database_id == virtual_db.id,
+        QueryHistory.command_hash == key[2],
         QueryHistory.status == 'success' 
     ).order_by(QueryHistory.executed_at.desc()).first()
+    if entry:
+        _history_by_command.set(key, detached_snapshot(entry))
+    return entry
 
 def find_in_history_sql(db: Session, *, owner: User, sql_command: str, virtual_db: VirtualDatabase) -> QueryHistory | None:
     """
     Looks for a recent, successful execution of an identical generated_sql for a user.
     This acts as a cache to avoid unnecessary LLM calls.
     """
-    return db.query(QueryHistory).filter(
+    key = (owner.user_id, virtual_db.id, lookup_hash(sql_command))
+    cached = _history_by_sql.get(key)
+    if cached is not None:
+        return cached
+
+    entry = db.query(QueryHistory).filter(
         QueryHistory.user_id == owner.user_id,
-        QueryHistory.generated_sql == sql_command,
         QueryHistory.virtual_database_id == virtual_db.id,
+        QueryHistory.sql_hash == key[2],
         QueryHistory.status == 'success' 
-    ).order_by(QueryHistory.executed_at.desc()).first()
+    ).first()
+    if entry:
+        _history_by_sql.set(key, detached_snapshot(entry))
+    return entry
 
 def get_saved_queries(db: Session, *, owner: User):
     """Gets the saved queries ONLY for the specified owner."""
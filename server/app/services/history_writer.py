@@ -0,0 +1,193 @@
+# app/services/history_writer.py
+"""
+Write-behind queue for query history.
+
+Requests only enqueue a history entry; a background thread drains the queue
+and writes each batch as one multi-row INSERT ... ON CONFLICT upsert.
+When the queue backs up, successful entries are sampled so the API never
+blocks on the metadata database; error entries are kept until the queue is full.
+"""
+import logging
+import queue
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Tuple
+
+from sqlalchemy.dialects.postgresql import insert
+
+from app.core.config import settings
+from app.db.session import SessionLocal
+from app.models.history_model import QueryHistory
+from app.utils.caching_utils import lookup_hash
+
+logger = logging.getLogger(__name__)
+
+_queue: "queue.Queue[dict]" = queue.Queue(maxsize=settings.HISTORY_QUEUE_MAX_SIZE)
+_stats = {"enqueued": 0, "written": 0, "sampled_out": 0, "dropped": 0, "failed": 0, "batches": 0}
+_stats_lock = threading.Lock()
+
+_writer_thread: threading.Thread | None = None
+_writer_stop = threading.Event()
+# Serialises batch writes between the writer thread and explicit flushes.
+_write_lock = threading.Lock()
+# Other write-behind buffers (e.g. template hit counters) flushed on the same cadence.
+_flush_hooks: List[Callable[[], None]] = []
+
+def register_flush_hook(hook: Callable[[], None]):
+    """Runs `hook` after every batch, on every idle tick and on shutdown."""
+    if hook not in _flush_hooks:
+        _flush_hooks.append(hook)
+
+def _run_flush_hooks():
+    for hook in _flush_hooks:
+        try:
+            hook()
+        except Exception as e:
+            logger.error("History writer flush hook %s failed: %s", getattr(hook, '__name__', hook), e)
+
+def _count(key: str, n: int = 1):
+    with _stats_lock:
+        _stats[key] += n
+
+def enqueue(*, user_id: str, virtual_database_id: str, command: str | None, sql: str, status: str):
+    """Queues one history entry. Never blocks; may drop the entry under backpressure."""
+    backlog = _queue.qsize() / settings.HISTORY_QUEUE_MAX_SIZE
+    if status == "success" and backlog >= settings.HISTORY_SAMPLING_THRESHOLD and random.random() >= settings.HISTORY_SAMPLE_RATE:
+        _count("sampled_out")
+        return
+
+    entry = {
+        "user_id": user_id,
+        "virtual_database_id": virtual_database_id,
+        "command_text": command,
+        "generated_sql": sql,
+        "command_hash": lookup_hash(command),
+        "sql_hash": lookup_hash(sql),
+        "status": status,
+        "query_type": (sql.strip().split() or ["UNKNOWN"])[0].upper(),
+        # Stamp the time now, not when the batch is written.
+        "executed_at": datetime.now(timezone.utc),
+    }
+    try:
+        _queue.put_nowait(entry)
+    except queue.Full:
+        _count("dropped")
+        return
+    _count("enqueued")
+
+def _drain(max_items: int) -> List[dict]:
+    batch = []
+    while len(batch) < max_items:
+        try:
+            batch.append(_queue.get_nowait())
+        except queue.Empty:
+            break
+    return batch
+
+def _upsert(db, rows: List[dict]):
+    statement = insert(QueryHistory).values(rows)
+    # A repeated query replaces its previous entry rather than adding a new one.
+    db.execute(statement.on_conflict_do_update(
+        index_elements=[QueryHistory.user_id, QueryHistory.virtual_database_id, QueryHistory.sql_hash],
+        set_={
+            "command_text": statement.excluded.command_text,
+            "generated_sql": statement.excluded.generated_sql,
+            "command_hash": statement.excluded.command_hash,
+            "status": statement.excluded.status,
+            "query_type": statement.excluded.query_type,
+            "executed_at": statement.excluded.executed_at,
+        }
+    ))
+
+def _write_batch(batch: List[dict]):
+    # One row per conflict key: a single upsert cannot touch the same row twice. Latest entry wins.
+    latest: Dict[Tuple[str, str, str], dict] = {}
+    for entry in batch:
+        key = (entry["user_id"], entry["virtual_database_id"], entry["sql_hash"])
+        latest.pop(key, None)
+        latest[key] = entry
+    rows = list(latest.values())
+
+    db = SessionLocal()
+    try:
+        _upsert(db, rows)
+        db.commit()
+        _count("written", len(rows))
+    except Exception as e:
+        db.rollback()
+        # Usually one bad row (e.g. its database was deleted meanwhile); retry row by row.
+        logger.warning("History batch of %d failed, retrying individually: %s", len(rows), e)
+        for row in rows:
+            try:
+                _upsert(db, [row])
+                db.commit()
+                _count("written")
+            except Exception:
+                db.rollback()
+                _count("failed")
+    finally:
+        db.close()
+    _count("batches")
+
+def flush() -> int:
+    """Writes everything currently queued. Returns the number of entries drained."""
+    drained = 0
+    with _write_lock:
+        while True:
+            batch = _drain(settings.HISTORY_BATCH_SIZE)
+            if not batch:
+                _run_flush_hooks()
+                return drained
+            drained += len(batch)
+            _write_batch(batch)
+
+def _writer_loop():
+    while not _writer_stop.is_set():
+        # Wait for the first entry, then give the batch a moment to fill up.
+        try:
+            first = _queue.get(timeout=settings.HISTORY_FLUSH_INTERVAL_SECONDS)
+        except queue.Empty:
+            _run_flush_hooks()
+            continue
+        deadline = time.monotonic() + settings.HISTORY_FLUSH_INTERVAL_SECONDS
+        batch = [first]
+        while len(batch) < settings.HISTORY_BATCH_SIZE and not _writer_stop.is_set():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(_queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        try:
+            with _write_lock:
+                _write_batch(batch)
+        except Exception as e:
+            _count("failed", len(batch))
+            logger.error("History writer failed to write a batch: %s", e)
+        _run_flush_hooks()
+
+def start_writer():
+    """Starts the background thread that persists queued history entries."""
+    global _writer_thread
+    if _writer_thread and _writer_thread.is_alive():
+        return
+    _writer_stop.clear()
+    _writer_thread = threading.Thread(target=_writer_loop, name="history-writer", daemon=True)
+    _writer_thread.start()
+
+def stop_writer(timeout: float = 10.0):
+    """Stops the writer and flushes whatever is still queued."""
+    _writer_stop.set()
+    if _writer_thread:
+        _writer_thread.join(timeout)
+    flush()
+
+def get_writer_stats() -> dict:
+    with _stats_lock:
+        stats = dict(_stats)
+    stats["queued"] = _queue.qsize()
+    stats["capacity"] = settings.HISTORY_QUEUE_MAX_SIZE
+    return stats
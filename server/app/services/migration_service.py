@@ -0,0 +1,433 @@
+# app/services/migration_service.py
+"""
+Live migration of a tenant database to another database server.
+
+An operator starts a migration through the admin API; it runs as a
+"migrate_database" admin job, holding that job's per-database lock.
+
+logical: the schema is restored on the target and a subscription there copies
+    the data, then streams changes while the tenant keeps working. Once the
+    replication lag is under MIGRATION_MAX_CUTOVER_LAG_BYTES the database is
+    frozen, a marker row is replicated to make sure every committed change has
+    arrived, sequence values are copied and the row is switched to the target.
+dump: the database is frozen for a pg_dump / pg_restore, then switched. Used when
+    the source server does not run with wal_level=logical or a table has no
+    replica identity (logical replication cannot carry its updates and deletes).
+
+While frozen the database is read-only and in the "migrating" storage state, so
+requests get a 503 with Retry-After. The switch is a compare-and-set on the row;
+the old copy is dropped right after. Other processes may still route to the old
+server until their tenant access cache expires, and fail rather than write there.
+DDL run during the copy stops the subscription; the cutover then times out, the
+attempt is undone and the job retried.
+"""
+import logging
+import os
+import tempfile
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import List
+
+from sqlalchemy import create_engine, func, text
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import NullPool
+
+from app.core.authorization import invalidate_tenant_access
+from app.core.config import settings
+from app.db.engine import dispose_engine_for_user_db, get_server_address
+from app.db.session import get_superuser_engine
+from app.models.admin_job_model import AdminJob
+from app.models.database_server_model import DatabaseServer
+from app.models.virtual_database_model import VirtualDatabase
+from app.services import admin_job_service, hibernation_service, placement_service, provisioning_service
+from app.utils.pg_tools import run_pg_tool
+
+logger = logging.getLogger(__name__)
+
+MIGRATE_DATABASE = "migrate_database"
+
+AUTO = "auto"
+LOGICAL = "logical"
+DUMP = "dump"
+METHODS = (AUTO, LOGICAL, DUMP)
+
+_PUBLICATION = "fastdb_migration"
+
+_stats = {"logical": 0, "dump": 0, "aborted": 0,
+          "cutover_ms_last": None, "cutover_ms_max": 0.0, "cutover_ms_total": 0.0, "duration_s_last": None}
+_lock = threading.Lock()
+
+def _slot_name(virtual_db: VirtualDatabase) -> str:
+    # Subscription and replication slot share this name.
+    return f"fastdb_migration_{virtual_db.id.replace('-', '')}"[:63]
+
+def _tenant_engine(physical_name: str, server_id: str):
+    return create_engine(get_superuser_engine(server_id).url.set(database=physical_name), poolclass=NullPool)
+
+def _conninfo_value(value) -> str:
+    return "'" + str(value).replace("\\", "\\\\").replace("'", "\\'") + "'"
+
+def _logical_blockers(physical_name: str, server_id: str) -> List[str]:
+    """Reasons logical replication cannot move this database; empty if it can."""
+    with get_superuser_engine(server_id).connect() as conn:
+        if conn.execute(text("SHOW wal_level")).scalar() != "logical":
+            return [f"Server '{server_id}' does not run with wal_level=logical."]
+    engine = _tenant_engine(physical_name, server_id)
+    try:
+        with engine.connect() as conn:
+            tables = [row.name for row in conn.execute(text("""
+                SELECT c.oid::regclass::text AS name FROM pg_class c
+                JOIN pg_namespace n ON n.oid = c.relnamespace
+                WHERE c.relkind = 'r' AND n.nspname NOT IN ('pg_catalog', 'information_schema')
+                  AND n.nspname NOT LIKE 'pg_toast%'
+                  AND (c.relreplident = 'n' OR (c.relreplident = 'd' AND NOT EXISTS (
+                      SELECT 1 FROM pg_index i WHERE i.indrelid = c.oid AND i.indisprimary)))
+            """))]
+    finally:
+        engine.dispose()
+    return [f"Table {name} has no primary key or replica identity." for name in tables]
+
+def start_migration(db: Session, *, virtual_db: VirtualDatabase, target_server_id: str, method: str = AUTO) -> AdminJob:
+    """Queues a migration. Raises ValueError if it cannot be started."""
+    if method not in METHODS:
+        raise ValueError(f"Unknown migration method '{method}'.")
+    if virtual_db.deleted_at is not None:
+        raise ValueError("The database is deleted.")
+    if virtual_db.server_id == target_server_id:
+        raise ValueError(f"The database is already on server '{target_server_id}'.")
+    target = db.get(DatabaseServer, target_server_id)
+    if target is None or target.status != placement_service.ACTIVE:
+        raise ValueError(f"Database server '{target_server_id}' is not active.")
+    in_flight = db.query(AdminJob.id).filter(
+        AdminJob.virtual_database_id == virtual_db.id,
+        AdminJob.kind == MIGRATE_DATABASE,
+        AdminJob.status.in_(["pending", "running"])
+    ).first()
+    if in_flight:
+        raise ValueError(f"The database is already being migrated (job {in_flight.id}).")
+    if method == LOGICAL and virtual_db.storage_state == hibernation_service.ACTIVE:
+        blockers = _logical_blockers(virtual_db.physical_name, virtual_db.server_id)
+        if blockers:
+            raise ValueError(" ".join(blockers))
+
+    job = admin_job_service.enqueue_job(
+        db,
+        user_id=virtual_db.user_id,
+        virtual_database_id=virtual_db.id,
+        kind=MIGRATE_DATABASE,
+        payload={"source_server_id": virtual_db.server_id, "target_server_id": target_server_id, "method": method},
+    )
+    db.commit()
+    admin_job_service.wake_worker()
+    return job
+
+def _report(db: Session, job: AdminJob, **progress):
+    """Records progress on the job row. Also a heartbeat, so a long copy is not reclaimed as stale."""
+    job.payload = {**job.payload, "progress": {**job.payload.get("progress", {}), **progress}}
+    job.updated_at = datetime.now(timezone.utc)
+    db.commit()
+
+def _sleep_or_timeout(deadline: float, what: str):
+    if time.monotonic() >= deadline:
+        raise RuntimeError(f"Timed out {what}.")
+    time.sleep(settings.MIGRATION_POLL_INTERVAL_SECONDS)
+
+def _create_target(physical_name: str, server_id: str):
+    with get_superuser_engine(server_id).connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        conn.execute(text(f'DROP DATABASE IF EXISTS "{physical_name}" WITH (FORCE)'))
+        # template0: the dump brings its own fastdb_meta objects and extensions.
+        conn.execute(text(f'CREATE DATABASE "{physical_name}" TEMPLATE template0'))
+        provisioning_service.apply_database_defaults(conn, physical_name)
+
+def _freeze(db: Session, conn, virtual_db: VirtualDatabase):
+    """Stops writes: new requests get a 503, new sessions are read-only and open ones are closed."""
+    updated = db.query(VirtualDatabase).filter(
+        VirtualDatabase.id == virtual_db.id,
+        VirtualDatabase.storage_state == hibernation_service.ACTIVE
+    ).update(
+        {VirtualDatabase.storage_state: hibernation_service.MIGRATING, VirtualDatabase.storage_state_since: datetime.now(timezone.utc)},
+        synchronize_session=False
+    )
+    db.commit()
+    if not updated:
+        raise RuntimeError("The database is no longer active; retrying later.")
+    invalidate_tenant_access(database_id=virtual_db.id)
+    physical_name = virtual_db.physical_name
+    conn.execute(text(f'ALTER DATABASE "{physical_name}" SET default_transaction_read_only = on'))
+    dispose_engine_for_user_db(physical_name, virtual_db.server_id)
+    conn.execute(text("""
+        SELECT pg_terminate_backend(pid) FROM pg_stat_activity
+        WHERE datname = :name AND pid <> pg_backend_pid() AND backend_type = 'client backend'
+    """), {"name": physical_name})
+
+def _switch(db: Session, conn, virtual_db: VirtualDatabase, source: str, target: str):
+    """Points the row at the target, then drops the old copy."""
+    physical_name = virtual_db.physical_name
+    updated = db.query(VirtualDatabase).filter(
+        VirtualDatabase.id == virtual_db.id,
+        VirtualDatabase.storage_state == hibernation_service.MIGRATING,
+        VirtualDatabase.server_id == source
+    ).update(
+        {VirtualDatabase.server_id: target, VirtualDatabase.storage_state: hibernation_service.ACTIVE,
+         VirtualDatabase.storage_state_since: datetime.now(timezone.utc)},
+        synchronize_session=False
+    )
+    db.commit()
+    if not updated:
+        raise RuntimeError("The database changed state during the cutover.")
+    invalidate_tenant_access(database_id=virtual_db.id)
+    dispose_engine_for_user_db(physical_name, source)
+    conn.execute(text(f'DROP DATABASE IF EXISTS "{physical_name}" WITH (FORCE)'))
+
+def _lag_bytes(conn, slot: str) -> int | None:
+    return conn.execute(text("""
+        SELECT pg_wal_lsn_diff(pg_current_wal_lsn(), confirmed_flush_lsn)::bigint
+        FROM pg_replication_slots WHERE slot_name = :slot
+    """), {"slot": slot}).scalar()
+
+def _drop_slot(conn, slot: str):
+    """Drops the replication slot once its walsender is gone."""
+    deadline = time.monotonic() + settings.MIGRATION_CUTOVER_TIMEOUT_SECONDS
+    while True:
+        row = conn.execute(text("SELECT active_pid FROM pg_replication_slots WHERE slot_name = :slot"), {"slot": slot}).first()
+        if row is None:
+            return
+        if row.active_pid is None:
+            conn.execute(text("SELECT pg_drop_replication_slot(:slot)"), {"slot": slot})
+            return
+        if time.monotonic() >= deadline:
+            conn.execute(text("SELECT pg_terminate_backend(:pid)"), {"pid": row.active_pid})
+        time.sleep(0.2)
+
+def _drop_subscription(physical_name: str, server_id: str, slot: str):
+    """Detaches the subscription from its slot first, so dropping it never needs the source."""
+    with get_superuser_engine(server_id).connect() as conn:
+        exists = conn.execute(text("SELECT 1 FROM pg_subscription WHERE subname = :slot"), {"slot": slot}).scalar()
+    if not exists:
+        return
+    engine = _tenant_engine(physical_name, server_id)
+    try:
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as dst:
+            dst.execute(text("SET session_replication_role = replica"))
+            dst.execute(text(f"ALTER SUBSCRIPTION {slot} DISABLE"))
+            dst.execute(text(f"ALTER SUBSCRIPTION {slot} SET (slot_name = NONE)"))
+            dst.execute(text(f"DROP SUBSCRIPTION {slot}"))
+    finally:
+        engine.dispose()
+
+def _copy_sequences(source_engine, target_engine):
+    """Logical replication does not carry sequence values."""
+    with source_engine.connect() as src:
+        sequences = src.execute(text(
+            "SELECT schemaname, sequencename, last_value FROM pg_sequences WHERE last_value IS NOT NULL"
+        )).all()
+    with target_engine.begin() as dst:
+        for row in sequences:
+            dst.execute(text("SELECT setval(format('%I.%I', :schema, :name), :value)"),
+                        {"schema": row.schemaname, "name": row.sequencename, "value": row.last_value})
+
+def _ensure_marker_table(physical_name: str, server_id: str):
+    """
+    Databases provisioned from template1 (when the tenant template was unavailable) have no
+    fastdb_meta.info for the cutover marker. Created before the schema dump and the publication,
+    so the target gets it too and replication carries the marker.
+    """
+    engine = _tenant_engine(physical_name, server_id)
+    try:
+        with engine.begin() as conn:
+            conn.execute(text("CREATE SCHEMA IF NOT EXISTS fastdb_meta"))
+            conn.execute(text("CREATE TABLE IF NOT EXISTS fastdb_meta.info (key text PRIMARY KEY, value text NOT NULL)"))
+    finally:
+        engine.dispose()
+
+def _migrate_logical(db: Session, job: AdminJob, conn, virtual_db: VirtualDatabase, source: str, target: str) -> float:
+    physical_name = virtual_db.physical_name
+    slot = _slot_name(virtual_db)
+    _ensure_marker_table(physical_name, source)
+    with tempfile.TemporaryDirectory(dir=settings.MIGRATION_WORK_DIR or None) as work_dir:
+        schema = os.path.join(work_dir, "schema.dump")
+        run_pg_tool("pg_dump", source, "--format=custom", "--schema-only", f"--file={schema}", physical_name)
+        _create_target(physical_name, target)
+        run_pg_tool("pg_restore", target, "--exit-on-error", f"--dbname={physical_name}", schema)
+
+    source_engine = _tenant_engine(physical_name, source)
+    target_engine = _tenant_engine(physical_name, target)
+    try:
+        with source_engine.connect().execution_options(isolation_level="AUTOCOMMIT") as src:
+            src.execute(text(f"CREATE PUBLICATION {_PUBLICATION} FOR ALL TABLES"))
+        host, port = get_server_address(source)
+        conninfo = " ".join(f"{key}={_conninfo_value(value)}" for key, value in (
+            ("host", host), ("port", port), ("dbname", physical_name),
+            ("user", settings.POSTGRES_SUPERUSER), ("password", settings.POSTGRES_SUPERUSER_PASSWORD),
+        ))
+        with target_engine.connect().execution_options(isolation_level="AUTOCOMMIT") as dst:
+            # Keeps the tenant's DDL event triggers from logging our own statements.
+            dst.execute(text("SET session_replication_role = replica"))
+            dst.execute(text(
+                f"CREATE SUBSCRIPTION {slot} CONNECTION '{conninfo.replace(chr(39), chr(39) * 2)}' PUBLICATION {_PUBLICATION}"
+            ))
+
+            deadline = time.monotonic() + settings.MIGRATION_SYNC_TIMEOUT_SECONDS
+            while True:
+                total, synced = dst.execute(text("""
+                    SELECT count(*), count(*) FILTER (WHERE srsubstate IN ('s', 'r')) FROM pg_subscription_rel
+                    WHERE srsubid = (SELECT oid FROM pg_subscription WHERE subname = :slot)
+                """), {"slot": slot}).one()
+                _report(db, job, phase="copying", tables_total=total, tables_synced=synced, lag_bytes=_lag_bytes(conn, slot))
+                if synced == total:
+                    break
+                _sleep_or_timeout(deadline, "copying the initial data")
+
+            while True:
+                lag = _lag_bytes(conn, slot)
+                _report(db, job, phase="catching_up", lag_bytes=lag)
+                if lag is not None and lag <= settings.MIGRATION_MAX_CUTOVER_LAG_BYTES:
+                    break
+                _sleep_or_timeout(deadline, "catching up with changes")
+
+            cutover_started = time.monotonic()
+            _freeze(db, conn, virtual_db)
+            _report(db, job, phase="cutover")
+            # Replication applies commits in order: once the marker arrives, so has every earlier change.
+            marker = uuid.uuid4().hex
+            with source_engine.begin() as src:
+                src.execute(text("SET LOCAL transaction_read_only = off"))
+                src.execute(text("""
+                    INSERT INTO fastdb_meta.info (key, value) VALUES ('migration_marker', :marker)
+                    ON CONFLICT (key) DO UPDATE SET value = excluded.value
+                """), {"marker": marker})
+            deadline = time.monotonic() + settings.MIGRATION_CUTOVER_TIMEOUT_SECONDS
+            while dst.execute(text("SELECT value FROM fastdb_meta.info WHERE key = 'migration_marker'")).scalar() != marker:
+                _sleep_or_timeout(deadline, "waiting for the last changes to replicate")
+            dst.execute(text("DELETE FROM fastdb_meta.info WHERE key = 'migration_marker'"))
+        _copy_sequences(source_engine, target_engine)
+    finally:
+        source_engine.dispose()
+        target_engine.dispose()
+    _drop_subscription(physical_name, target, slot)
+    _drop_slot(conn, slot)
+    _switch(db, conn, virtual_db, source, target)
+    return (time.monotonic() - cutover_started) * 1000
+
+def _migrate_dump(db: Session, job: AdminJob, conn, virtual_db: VirtualDatabase, source: str, target: str) -> float:
+    physical_name = virtual_db.physical_name
+    cutover_started = time.monotonic()
+    _freeze(db, conn, virtual_db)
+    _report(db, job, phase="dumping")
+    with tempfile.TemporaryDirectory(dir=settings.MIGRATION_WORK_DIR or None) as work_dir:
+        archive = os.path.join(work_dir, f"{physical_name}.dump")
+        run_pg_tool("pg_dump", source, "--format=custom", f"--file={archive}", physical_name)
+        _report(db, job, phase="restoring")
+        _create_target(physical_name, target)
+        run_pg_tool("pg_restore", target, "--exit-on-error", f"--dbname={physical_name}", archive)
+    _switch(db, conn, virtual_db, source, target)
+    return (time.monotonic() - cutover_started) * 1000
+
+def _undo(db: Session, conn, virtual_db: VirtualDatabase, source: str, target: str):
+    """Removes what a failed or interrupted attempt left behind and unfreezes the source."""
+    physical_name = virtual_db.physical_name
+    slot = _slot_name(virtual_db)
+    _drop_subscription(physical_name, target, slot)
+    with get_superuser_engine(target).connect().execution_options(isolation_level="AUTOCOMMIT") as target_conn:
+        target_conn.execute(text(f'DROP DATABASE IF EXISTS "{physical_name}" WITH (FORCE)'))
+    _drop_slot(conn, slot)
+    if conn.execute(text("SELECT 1 FROM pg_database WHERE datname = :name"), {"name": physical_name}).scalar():
+        engine = _tenant_engine(physical_name, source)
+        try:
+            with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as src:
+                src.execute(text(f"DROP PUBLICATION IF EXISTS {_PUBLICATION}"))
+        finally:
+            engine.dispose()
+        conn.execute(text(f'ALTER DATABASE "{physical_name}" RESET default_transaction_read_only'))
+    db.query(VirtualDatabase).filter(
+        VirtualDatabase.id == virtual_db.id,
+        VirtualDatabase.storage_state == hibernation_service.MIGRATING
+    ).update(
+        {VirtualDatabase.storage_state: hibernation_service.ACTIVE, VirtualDatabase.storage_state_since: datetime.now(timezone.utc)},
+        synchronize_session=False
+    )
+    db.commit()
+    db.refresh(virtual_db)
+
+def _run_migration(db: Session, job: AdminJob, conn):
+    virtual_db = db.get(VirtualDatabase, job.virtual_database_id)
+    if virtual_db is None or virtual_db.deleted_at is not None:
+        raise admin_job_service.JobCancelled("The database was deleted.")
+    source, target = job.payload["source_server_id"], job.payload["target_server_id"]
+    if virtual_db.server_id == target:
+        # Switched on an earlier attempt that failed before dropping the old copy.
+        with get_superuser_engine(source).connect().execution_options(isolation_level="AUTOCOMMIT") as source_conn:
+            source_conn.execute(text(f'DROP DATABASE IF EXISTS "{virtual_db.physical_name}" WITH (FORCE)'))
+        return
+    if virtual_db.server_id != source:
+        raise admin_job_service.JobCancelled(f"The database moved to server '{virtual_db.server_id}' meanwhile.")
+
+    if virtual_db.storage_state == hibernation_service.HIBERNATED:
+        # Only the archive exists; the next wake-up restores it on the target.
+        moved = db.query(VirtualDatabase).filter(
+            VirtualDatabase.id == virtual_db.id,
+            VirtualDatabase.storage_state == hibernation_service.HIBERNATED
+        ).update({VirtualDatabase.server_id: target}, synchronize_session=False)
+        db.commit()
+        if not moved:
+            raise RuntimeError("The database started waking up; retrying later.")
+        return
+    if virtual_db.storage_state not in (hibernation_service.ACTIVE, hibernation_service.MIGRATING):
+        raise RuntimeError(f"Database is {virtual_db.storage_state}; retrying later.")
+    if virtual_db.storage_state == hibernation_service.MIGRATING:
+        logger.warning("Undoing an interrupted migration of '%s'.", virtual_db.physical_name)
+    # Whatever an earlier attempt left behind (subscription, slot, half-copied target) goes first.
+    _undo(db, conn, virtual_db, source, target)
+
+    method = job.payload["method"]
+    if method != DUMP:
+        blockers = _logical_blockers(virtual_db.physical_name, source)
+        if blockers and method == LOGICAL:
+            raise RuntimeError(" ".join(blockers))
+        method = DUMP if blockers else LOGICAL
+
+    logger.info("Migrating '%s' from server '%s' to '%s' (%s).", virtual_db.physical_name, source, target, method)
+    started = time.monotonic()
+    _report(db, job, phase="starting", method=method)
+    try:
+        migrate = _migrate_logical if method == LOGICAL else _migrate_dump
+        cutover_ms = migrate(db, job, conn, virtual_db, source, target)
+    except Exception:
+        db.rollback()
+        with _lock:
+            _stats["aborted"] += 1
+        _undo(db, conn, virtual_db, source, target)
+        raise
+
+    duration_s = time.monotonic() - started
+    with _lock:
+        _stats[method] += 1
+        _stats["cutover_ms_last"] = round(cutover_ms, 3)
+        _stats["cutover_ms_max"] = max(_stats["cutover_ms_max"], cutover_ms)
+        _stats["cutover_ms_total"] += cutover_ms
+        _stats["duration_s_last"] = round(duration_s, 3)
+    _report(db, job, phase="done", cutover_ms=round(cutover_ms, 3), duration_s=round(duration_s, 3))
+    logger.info("Migrated '%s' to server '%s' in %.1f s (%.0f ms frozen).", virtual_db.physical_name, target, duration_s, cutover_ms)
+
+admin_job_service.register_handler(MIGRATE_DATABASE, _run_migration)
+
+def get_migration_stats(db: Session) -> dict:
+    with _lock:
+        stats = dict(_stats)
+    completed = stats["logical"] + stats["dump"]
+    stats["cutover_ms_avg"] = round(stats["cutover_ms_total"] / completed, 3) if completed else 0.0
+    stats["cutover_ms_max"] = round(stats["cutover_ms_max"], 3)
+    stats["cutover_ms_total"] = round(stats["cutover_ms_total"], 3)
+    in_flight = db.query(AdminJob).filter(
+        AdminJob.kind == MIGRATE_DATABASE, AdminJob.status.in_(["pending", "running"])
+    ).order_by(AdminJob.created_at).all()
+    stats["in_flight"] = [
+        {"job_id": job.id, "virtual_database_id": job.virtual_database_id, "status": job.status, **job.payload}
+        for job in in_flight
+    ]
+    stats["by_status"] = dict(db.query(AdminJob.status, func.count(AdminJob.id)).filter(
+        AdminJob.kind == MIGRATE_DATABASE
+    ).group_by(AdminJob.status).all())
+    return stats
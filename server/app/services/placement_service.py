@@ -0,0 +1,109 @@
+# app/services/placement_service.py
+"""
+Placement of tenant databases across Postgres servers.
+
+Servers are registered in fastdb_database_servers: the server from Settings as
+"default" plus any listed in DATABASE_SERVERS, upserted at startup. Each
+VirtualDatabase records the server its physical database lives on, and every
+engine, provisioning and admin job for it goes to that server. New databases are
+placed by DATABASE_PLACEMENT_POLICY; clones stay on their source's server, since
+CREATE DATABASE ... TEMPLATE only copies within one server.
+
+A server's status is managed in the table: "draining" keeps its databases but
+takes no new ones, "offline" also stops its warm pool.
+"""
+from typing import Dict, List, Tuple
+
+from sqlalchemy import func
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.db.engine import DEFAULT_SERVER_ID, set_server_address
+from app.db.session import SessionLocal
+from app.models.database_server_model import DatabaseServer
+from app.models.virtual_database_model import VirtualDatabase
+
+LEAST_LOADED = "least_loaded"
+PINNED = "pinned"
+
+ACTIVE = "active"
+DRAINING = "draining"
+OFFLINE = "offline"
+
+class NoServerAvailable(RuntimeError):
+    """No registered database server can take a new database."""
+
+def _configured_servers() -> Dict[str, Tuple[str, int]]:
+    servers = {DEFAULT_SERVER_ID: (settings.POSTGRES_SERVER, settings.POSTGRES_PORT)}
+    for entry in settings.DATABASE_SERVERS.split(","):
+        if not entry.strip():
+            continue
+        server_id, _, address = entry.strip().partition("=")
+        host, _, port = address.rpartition(":")
+        servers[server_id.strip()] = (host, int(port))
+    return servers
+
+def sync_servers():
+    """Registers the configured servers. Status and capacity are left as they are in the table."""
+    db = SessionLocal()
+    try:
+        for server_id, (host, port) in _configured_servers().items():
+            statement = insert(DatabaseServer).values(id=server_id, host=host, port=port)
+            db.execute(statement.on_conflict_do_update(
+                index_elements=[DatabaseServer.id], set_={"host": host, "port": port}
+            ))
+        db.commit()
+        for server in db.query(DatabaseServer).all():
+            set_server_address(server.id, server.host, server.port)
+    finally:
+        db.close()
+
+def list_server_ids(db: Session, *, statuses: Tuple[str, ...] = (ACTIVE,)) -> List[str]:
+    return [row.id for row in db.query(DatabaseServer.id).filter(DatabaseServer.status.in_(statuses)).order_by(DatabaseServer.id)]
+
+def _live_databases(db: Session) -> Dict[str, int]:
+    rows = db.query(VirtualDatabase.server_id, func.count(VirtualDatabase.id)).filter(
+        VirtualDatabase.deleted_at.is_(None)
+    ).group_by(VirtualDatabase.server_id).all()
+    return {server_id: count for server_id, count in rows}
+
+def choose_server(db: Session) -> str:
+    """Picks the server for a new database according to DATABASE_PLACEMENT_POLICY."""
+    policy = settings.DATABASE_PLACEMENT_POLICY
+    if policy == PINNED:
+        server = db.get(DatabaseServer, settings.DATABASE_PINNED_SERVER)
+        if server is None or server.status != ACTIVE:
+            raise NoServerAvailable(f"Pinned database server '{settings.DATABASE_PINNED_SERVER}' is not active.")
+        return server.id
+    if policy != LEAST_LOADED:
+        raise ValueError(f"Unknown DATABASE_PLACEMENT_POLICY '{policy}'.")
+
+    counts = _live_databases(db)
+    candidates = []
+    for server in db.query(DatabaseServer).filter(DatabaseServer.status == ACTIVE):
+        count = counts.get(server.id, 0)
+        if server.max_databases is not None and count >= server.max_databases:
+            continue
+        candidates.append((count / max(server.weight, 1), server.id))
+    if not candidates:
+        raise NoServerAvailable("No database server can take a new database.")
+    return min(candidates)[1]
+
+def get_placement_stats(db: Session) -> dict:
+    counts = _live_databases(db)
+    return {
+        "policy": settings.DATABASE_PLACEMENT_POLICY,
+        "servers": [
+            {
+                "id": server.id,
+                "host": server.host,
+                "port": server.port,
+                "status": server.status,
+                "weight": server.weight,
+                "max_databases": server.max_databases,
+                "databases": counts.get(server.id, 0),
+            }
+            for server in db.query(DatabaseServer).order_by(DatabaseServer.id)
+        ],
+    }
@@ -0,0 +1,336 @@
+# app/services/provisioning_service.py
+"""
+Tenant database provisioning.
+
+Every tenant database is a copy of a FastDB-managed template database that
+already holds the extensions, the fastdb_meta schema and the DDL-tracking event
+triggers, so a new database needs no bootstrap queries. The template is
+versioned: changing TENANT_TEMPLATE_VERSION or the configured extensions builds
+a new template next to the old one. Templates and spares of an older
+TENANT_TEMPLATE_VERSION are retired; those of the same or a newer version are
+left alone, since during a rolling deploy (or with differing extension settings)
+other processes may still be provisioning from them. A process whose template
+disappears anyway falls back to template1 and rebuilds it on its next call.
+
+CREATE DATABASE is slow and serialises on the template database, so a background
+thread also keeps DATABASE_WARM_POOL_SIZE empty databases ready. Signup and database
+creation claim one with ALTER DATABASE ... RENAME, which is atomic: when two
+workers race for the same spare, the loser's rename fails and it tries the next.
+The pool lives entirely in pg_database, so every worker and instance shares it.
+
+With several database servers (see placement_service), each active server has
+its own template and warm pool, and a database is provisioned on the server
+its caller placed it on.
+"""
+import logging
+import random
+import threading
+import time
+import uuid
+import zlib
+from typing import List, Set
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.pool import NullPool
+
+from app.core.config import settings
+from app.db.engine import DEFAULT_SERVER_ID
+from app.db.session import SessionLocal, get_superuser_engine
+from app.services import placement_service
+
+logger = logging.getLogger(__name__)
+
+# Bump whenever _TEMPLATE_BOOTSTRAP changes.
+TENANT_TEMPLATE_VERSION = 1
+
+TEMPLATE_PREFIX = "fastdb_template_"
+SPARE_PREFIX = "fastdb_spare_"
+# Only one process builds the template or refills the pool at a time.
+_PROVISIONING_LOCK_KEY = 0x46444250  # "FDBP"
+
+_TEMPLATE_BOOTSTRAP = [
+    "CREATE SCHEMA IF NOT EXISTS fastdb_meta",
+    "CREATE TABLE fastdb_meta.info (key text PRIMARY KEY, value text NOT NULL)",
+    """CREATE TABLE fastdb_meta.ddl_log (
+        id bigserial PRIMARY KEY,
+        command_tag text NOT NULL,
+        object_type text,
+        object_identity text,
+        executed_at timestamptz NOT NULL DEFAULT now()
+    )""",
+    """CREATE FUNCTION fastdb_meta.log_ddl() RETURNS event_trigger
+    LANGUAGE plpgsql SECURITY DEFINER SET search_path = pg_catalog AS $$
+    DECLARE r record;
+    BEGIN
+        FOR r IN SELECT * FROM pg_event_trigger_ddl_commands() WHERE schema_name IS DISTINCT FROM 'fastdb_meta' LOOP
+            INSERT INTO fastdb_meta.ddl_log (command_tag, object_type, object_identity)
+            VALUES (r.command_tag, r.object_type, r.object_identity);
+        END LOOP;
+    END $$""",
+    """CREATE FUNCTION fastdb_meta.log_drop() RETURNS event_trigger
+    LANGUAGE plpgsql SECURITY DEFINER SET search_path = pg_catalog AS $$
+    DECLARE r record;
+    BEGIN
+        FOR r IN SELECT * FROM pg_event_trigger_dropped_objects() WHERE original AND schema_name IS DISTINCT FROM 'fastdb_meta' LOOP
+            INSERT INTO fastdb_meta.ddl_log (command_tag, object_type, object_identity)
+            VALUES (tg_tag, r.object_type, r.object_identity);
+        END LOOP;
+    END $$""",
+    "CREATE EVENT TRIGGER fastdb_log_ddl ON ddl_command_end EXECUTE FUNCTION fastdb_meta.log_ddl()",
+    "CREATE EVENT TRIGGER fastdb_log_drop ON sql_drop EXECUTE FUNCTION fastdb_meta.log_drop()",
+    "GRANT USAGE ON SCHEMA fastdb_meta TO PUBLIC",
+    "GRANT SELECT ON ALL TABLES IN SCHEMA fastdb_meta TO PUBLIC",
+    # Tenants start with an empty log, not the template's own setup.
+    "TRUNCATE fastdb_meta.ddl_log",
+]
+
+def _extensions() -> List[str]:
+    return [name.strip() for name in settings.TENANT_TEMPLATE_EXTENSIONS.split(",") if name.strip()]
+
+def template_revision() -> str:
+    """Identifies the template contents: the bootstrap version plus the configured extensions."""
+    return f"v{TENANT_TEMPLATE_VERSION}_{zlib.crc32(','.join(_extensions()).encode()):08x}"
+
+def template_name() -> str:
+    return f"{TEMPLATE_PREFIX}{template_revision()}"
+
+def _spare_prefix() -> str:
+    return f"{SPARE_PREFIX}{template_revision()}_"
+
+_stats = {"claimed": 0, "claim_misses": 0, "created_spares": 0, "retired_spares": 0, "refill_errors": 0,
+          "claim_latency_ms_total": 0.0, "claim_latency_ms_max": 0.0}
+_lock = threading.Lock()
+
+_refill_thread: threading.Thread | None = None
+_refill_stop = threading.Event()
+_refill_wanted = threading.Event()
+# Servers on which this process has seen the current template in place.
+_templates_ready: Set[str] = set()
+
+def _list_databases(conn, prefix: str) -> List[str]:
+    rows = conn.execute(
+        text("SELECT datname FROM pg_database WHERE left(datname, :n) = :prefix"),
+        {"n": len(prefix), "prefix": prefix}
+    ).all()
+    return [row.datname for row in rows]
+
+def _list_spares(conn) -> List[str]:
+    return _list_databases(conn, _spare_prefix())
+
+def _is_older_revision(name: str, prefix: str) -> bool:
+    """True if a template or spare was built for an older TENANT_TEMPLATE_VERSION than this process's."""
+    version = name[len(prefix):].split("_", 1)[0]
+    if not (version.startswith("v") and version[1:].isdigit()):
+        return False
+    return int(version[1:]) < TENANT_TEMPLATE_VERSION
+
+def _drop_database(conn, name: str):
+    conn.execute(text(f'ALTER DATABASE "{name}" IS_TEMPLATE false'))
+    conn.execute(text(f'DROP DATABASE IF EXISTS "{name}" WITH (FORCE)'))
+
+def _create_tenant_database(conn, name: str, server_id: str):
+    """CREATE DATABASE from the current template, plus the per-database defaults templates cannot carry."""
+    if server_id in _templates_ready:
+        try:
+            conn.execute(text(f'CREATE DATABASE "{name}" TEMPLATE "{template_name()}"'))
+        except DBAPIError as e:
+            # The template was dropped or is being rebuilt; build it again on the next call.
+            logger.warning("Could not copy tenant template '%s' on server '%s', using template1: %s",
+                           template_name(), server_id, e)
+            _templates_ready.discard(server_id)
+            conn.execute(text(f'CREATE DATABASE "{name}" TEMPLATE template1'))
+    else:
+        conn.execute(text(f'CREATE DATABASE "{name}" TEMPLATE template1'))
+    apply_database_defaults(conn, name)
+
+def apply_database_defaults(conn, name: str):
+    """Per-database settings every tenant database carries; pg_dump does not copy them."""
+    if settings.TENANT_STATEMENT_TIMEOUT_SECONDS > 0:
+        conn.execute(text(f"ALTER DATABASE \"{name}\" SET statement_timeout = '{settings.TENANT_STATEMENT_TIMEOUT_SECONDS}s'"))
+
+def _bootstrap_template(name: str, server_id: str):
+    engine = create_engine(get_superuser_engine(server_id).url.set(database=name), poolclass=NullPool)
+    try:
+        with engine.begin() as conn:
+            available = {row.name for row in conn.execute(text("SELECT name FROM pg_available_extensions"))}
+            for extension in _extensions():
+                if extension in available:
+                    conn.execute(text(f'CREATE EXTENSION IF NOT EXISTS "{extension}"'))
+                else:
+                    logger.warning("Extension '%s' is not available on this server; tenant template built without it.", extension)
+            for statement in _TEMPLATE_BOOTSTRAP:
+                conn.execute(text(statement))
+            conn.execute(
+                text("INSERT INTO fastdb_meta.info (key, value) VALUES ('template_revision', :revision)"),
+                {"revision": template_revision()}
+            )
+    finally:
+        engine.dispose()
+
+def _ensure_template_locked(conn, server_id: str):
+    """Builds the current template if missing and retires older versions. Caller holds the provisioning lock."""
+    name = template_name()
+    ready = conn.execute(text("SELECT datistemplate FROM pg_database WHERE datname = :name"), {"name": name}).scalar()
+    if not ready:
+        if ready is not None:
+            # Left over from an interrupted build.
+            _drop_database(conn, name)
+        logger.info("Building tenant template database '%s' on server '%s'.", name, server_id)
+        conn.execute(text(f'CREATE DATABASE "{name}" TEMPLATE template1'))
+        try:
+            _bootstrap_template(name, server_id)
+        except Exception:
+            _drop_database(conn, name)
+            raise
+        conn.execute(text(f'ALTER DATABASE "{name}" IS_TEMPLATE true ALLOW_CONNECTIONS false'))
+    for old in _list_databases(conn, TEMPLATE_PREFIX):
+        if _is_older_revision(old, TEMPLATE_PREFIX):
+            logger.info("Retiring tenant template database '%s'.", old)
+            _drop_database(conn, old)
+    _templates_ready.add(server_id)
+
+def ensure_template(server_id: str = DEFAULT_SERVER_ID) -> str:
+    """Makes sure the current tenant template exists on a server and returns its name."""
+    engine = get_superuser_engine(server_id)
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        # Blocking: a worker that starts while another builds the template waits for it.
+        conn.execute(text("SELECT pg_advisory_lock(:key)"), {"key": _PROVISIONING_LOCK_KEY})
+        try:
+            _ensure_template_locked(conn, server_id)
+        finally:
+            conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": _PROVISIONING_LOCK_KEY})
+    return template_name()
+
+def _claim_spare(conn, physical_name: str) -> bool:
+    spares = _list_spares(conn)
+    random.shuffle(spares)  # spreads concurrent claimers over different spares
+    for spare in spares:
+        try:
+            conn.execute(text(f'ALTER DATABASE "{spare}" RENAME TO "{physical_name}"'))
+            return True
+        except DBAPIError:
+            # Claimed by someone else in the meantime; try the next one.
+            continue
+    return False
+
+def provision_physical_database(physical_name: str, server_id: str = DEFAULT_SERVER_ID) -> bool:
+    """
+    Makes `physical_name` exist on the given server, from its warm pool when possible.
+    Returns True if a spare was claimed, False if it had to be created.
+    """
+    if server_id not in _templates_ready:
+        try:
+            ensure_template(server_id)
+        except Exception as e:
+            logger.error("Could not build the tenant template on server '%s', provisioning from template1: %s", server_id, e)
+    started = time.perf_counter()
+    engine = get_superuser_engine(server_id)
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        claimed = settings.DATABASE_WARM_POOL_SIZE > 0 and _claim_spare(conn, physical_name)
+        if not claimed:
+            _create_tenant_database(conn, physical_name, server_id)
+    elapsed_ms = (time.perf_counter() - started) * 1000
+
+    with _lock:
+        if claimed:
+            _stats["claimed"] += 1
+            _stats["claim_latency_ms_total"] += elapsed_ms
+            _stats["claim_latency_ms_max"] = max(_stats["claim_latency_ms_max"], elapsed_ms)
+        else:
+            _stats["claim_misses"] += 1
+    if settings.DATABASE_WARM_POOL_SIZE > 0:
+        logger.info("Provisioned '%s' on server '%s' in %.1f ms (%s).", physical_name, server_id, elapsed_ms,
+                    'warm pool' if claimed else 'CREATE DATABASE')
+        _refill_wanted.set()
+    return claimed
+
+def _active_server_ids() -> List[str]:
+    db = SessionLocal()
+    try:
+        return placement_service.list_server_ids(db)
+    finally:
+        db.close()
+
+def _refill_server(server_id: str) -> int:
+    engine = get_superuser_engine(server_id)
+    created = 0
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        if not conn.execute(text("SELECT pg_try_advisory_lock(:key)"), {"key": _PROVISIONING_LOCK_KEY}).scalar():
+            return 0
+        try:
+            _ensure_template_locked(conn, server_id)
+            # Spares copied from a template of an older version are replaced.
+            retired = [name for name in _list_databases(conn, SPARE_PREFIX) if _is_older_revision(name, SPARE_PREFIX)]
+            for name in retired:
+                _drop_database(conn, name)
+            depth = len(_list_spares(conn))
+            while depth < settings.DATABASE_WARM_POOL_SIZE and not _refill_stop.is_set():
+                _create_tenant_database(conn, f"{_spare_prefix()}{uuid.uuid4().hex}", server_id)
+                depth += 1
+                created += 1
+            with _lock:
+                _stats["created_spares"] += created
+                _stats["retired_spares"] += len(retired)
+        finally:
+            conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": _PROVISIONING_LOCK_KEY})
+    return created
+
+def refill_pool() -> int:
+    """Tops every server's pool up to DATABASE_WARM_POOL_SIZE. Returns the number of spares created."""
+    created = 0
+    for server_id in _active_server_ids():
+        if _refill_stop.is_set():
+            break
+        try:
+            created += _refill_server(server_id)
+        except Exception as e:
+            # One unreachable server must not starve the others.
+            with _lock:
+                _stats["refill_errors"] += 1
+            logger.error("Warm pool refill failed on server '%s': %s", server_id, e)
+    return created
+
+def _refill_loop():
+    while not _refill_stop.is_set():
+        try:
+            refill_pool()
+        except Exception as e:
+            with _lock:
+                _stats["refill_errors"] += 1
+            logger.error("Warm pool refill failed: %s", e)
+        _refill_wanted.wait(settings.DATABASE_WARM_POOL_REFILL_INTERVAL_SECONDS)
+        _refill_wanted.clear()
+
+def start_pool_refiller():
+    """Starts the background thread that keeps the warm pool full."""
+    global _refill_thread
+    if settings.DATABASE_WARM_POOL_SIZE <= 0 or (_refill_thread and _refill_thread.is_alive()):
+        return
+    _refill_stop.clear()
+    _refill_thread = threading.Thread(target=_refill_loop, name="warm-pool-refiller", daemon=True)
+    _refill_thread.start()
+
+def stop_pool_refiller():
+    _refill_stop.set()
+    _refill_wanted.set()
+
+def get_pool_stats() -> dict:
+    with _lock:
+        stats = dict(_stats)
+    stats["servers"] = {}
+    for server_id in _active_server_ids():
+        try:
+            with get_superuser_engine(server_id).connect() as conn:
+                depth = len(_list_spares(conn))
+        except Exception as e:
+            stats["servers"][server_id] = {"error": str(e)}
+            continue
+        stats["servers"][server_id] = {"depth": depth, "template_ready": server_id in _templates_ready}
+    stats["depth"] = sum(server.get("depth", 0) for server in stats["servers"].values())
+    stats["target_size"] = settings.DATABASE_WARM_POOL_SIZE
+    stats["template"] = template_name()
+    stats["claim_latency_ms_avg"] = round(stats["claim_latency_ms_total"] / stats["claimed"], 3) if stats["claimed"] else 0.0
+    stats["claim_latency_ms_total"] = round(stats["claim_latency_ms_total"], 3)
+    stats["claim_latency_ms_max"] = round(stats["claim_latency_ms_max"], 3)
+    return stats
@@ -1,5 +1,8 @@
 # server/app/services/sql_builder.py (Corrected)
+from sqlalchemy import inspect
+from sqlalchemy.exc import NoSuchTableError
 from sqlalchemy.engine import Engine
+from typing import Dict, Tuple
 
 def quote(identifier: str, engine: Engine) -> str:
     """
@@ -31,4 +34,229 @@ def build_delete_sql(table_name: str, conditions: dict, engine: Engine):
     """Generates a DELETE SQL statement and parameters."""
     where_clauses = [f"{quote(k, engine)} = :{k}" for k in conditions.keys()]
     sql = f"DELETE FROM {quote(table_name, engine)} WHERE {' AND '.join(where_clauses)};"
-    return sql, conditions
\ No newline at end of file
+    return sql, conditions
+
+# --- Structured (fluent builder) SELECT queries ---
+
+ALLOWED_OPERATORS = {'=', '!=', '>', '<', '>=', '<=', 'IN', 'LIKE', 'NOT LIKE', 'IS', 'IS NOT'}
+
+# Whitelisted aggregate functions and the SQL they compile to.
+AGGREGATE_FUNCTIONS = {
+    "count": "COUNT({})",
+    "sum": "SUM({})",
+    "avg": "AVG({})",
+    "min": "MIN({})",
+    "max": "MAX({})",
+    "count_distinct": "COUNT(DISTINCT {})",
+}
+
+JOIN_TYPES = {"inner": "INNER JOIN", "left": "LEFT JOIN"}
+
+def _check_identifier(name: str, kind: str = "column") -> str:
+    if not isinstance(name, str) or not name.isidentifier():
+        raise ValueError(f"Invalid {kind} name: {name}")
+    return name
+
+def _check_operator(op: str) -> str:
+    if op.upper() not in ALLOWED_OPERATORS:
+        raise ValueError(f"Invalid operator: {op}")
+    return op.upper()
+
+def _column_ref(ref: str, tables: set) -> str:
+    """
+    Validates a column reference, either "column" or "table.column", and
+    returns it quoted. The qualifier must be the base table or a joined table/alias.
+    """
+    if not isinstance(ref, str):
+        raise ValueError(f"Invalid column name: {ref}")
+    qualifier, dot, column = ref.rpartition(".")
+    _check_identifier(column)
+    if not dot:
+        return f'"{column}"'
+    if qualifier not in tables:
+        raise ValueError(f"Unknown table in column reference: {ref}")
+    return f'"{qualifier}"."{column}"'
+
+def _infer_join_condition(join_table: str, join_name: str, joined: dict, engine: Engine) -> str:
+    """
+    Derives an ON clause for a join from the foreign keys between the joined
+    table and the tables already in the query. Exactly one relationship must exist.
+    """
+    if engine is None:
+        raise ValueError(f"Join on '{join_table}' needs an explicit 'on' condition.")
+
+    inspector = inspect(engine)
+    try:
+        join_fks = inspector.get_foreign_keys(join_table)
+    except NoSuchTableError:
+        raise ValueError(f"Unknown table: {join_table}")
+    candidates = []
+    # The joined table references one of the tables already in the query...
+    for fk in join_fks:
+        for name, table in joined.items():
+            if fk["referred_table"] == table:
+                candidates.append(list(zip(
+                    [(join_name, c) for c in fk["constrained_columns"]],
+                    [(name, c) for c in fk["referred_columns"]],
+                )))
+    # ...or one of those tables references the joined table.
+    for name, table in joined.items():
+        try:
+            table_fks = inspector.get_foreign_keys(table)
+        except NoSuchTableError:
+            raise ValueError(f"Unknown table: {table}")
+        for fk in table_fks:
+            if fk["referred_table"] == join_table:
+                candidates.append(list(zip(
+                    [(name, c) for c in fk["constrained_columns"]],
+                    [(join_name, c) for c in fk["referred_columns"]],
+                )))
+
+    if not candidates:
+        raise ValueError(f"No foreign key relationship found to join '{join_table}'. Provide an explicit 'on' condition.")
+    if len(candidates) > 1:
+        raise ValueError(f"Ambiguous foreign key relationships for '{join_table}'. Provide an explicit 'on' condition.")
+
+    return " AND ".join(
+        f'"{lt}"."{lc}" = "{rt}"."{rc}"' for (lt, lc), (rt, rc) in candidates[0]
+    )
+
+def _compile_joins(query, engine: Engine) -> Tuple[str, set]:
+    """
+    Validates the requested joins and returns the compiled JOIN clauses along
+    with the set of names that columns may be qualified with.
+    """
+    # Maps the name used in the query (table or alias) to the real table name.
+    joined = {query.table: query.table}
+    clauses = []
+    for join in query.joins or []:
+        _check_identifier(join.table, "table")
+        join_type = JOIN_TYPES.get(join.type.lower())
+        if not join_type:
+            raise ValueError(f"Invalid join type: {join.type}")
+
+        name = _check_identifier(join.alias, "alias") if join.alias else join.table
+        if name in joined:
+            raise ValueError(f"Table '{name}' is already part of the query. Use an alias.")
+
+        if join.on:
+            conditions = []
+            for left, right in join.on:
+                if "." not in left or "." not in right:
+                    raise ValueError("Join conditions must use qualified columns, e.g. 'orders.customer_id'.")
+                known = set(joined) | {name}
+                conditions.append(f"{_column_ref(left, known)} = {_column_ref(right, known)}")
+            condition = " AND ".join(conditions)
+        else:
+            condition = _infer_join_condition(join.table, name, joined, engine)
+
+        target = f'"{join.table}" AS "{name}"' if join.alias else f'"{join.table}"'
+        clauses.append(f" {join_type} {target} ON {condition}")
+        joined[name] = join.table
+    return "".join(clauses), set(joined)
+
+def _compile_aggregates(aggregates, tables: set) -> dict:
+    """
+    Validates the requested aggregates and returns an ordered mapping of
+    alias -> compiled SQL expression.
+    """
+    compiled = {}
+    for agg in aggregates:
+        function = agg.function.lower()
+        if function not in AGGREGATE_FUNCTIONS:
+            raise ValueError(f"Invalid aggregate function: {agg.function}")
+
+        if agg.column == "*":
+            if function != "count":
+                raise ValueError(f"Aggregate '{function}' requires a column, not '*'.")
+            argument = "*"
+        else:
+            argument = _column_ref(agg.column, tables)
+
+        alias = agg.alias or f"{function}_{'all' if agg.column == '*' else agg.column.replace('.', '_')}"
+        _check_identifier(alias, "alias")
+        if alias in compiled:
+            raise ValueError(f"Duplicate aggregate alias: {alias}")
+        compiled[alias] = AGGREGATE_FUNCTIONS[function].format(argument)
+    return compiled
+
+def build_safe_sql(query, engine: Engine = None) -> Tuple[str, Dict]:
+    """
+    Builds a parameterized SQL query from a StructuredQueryRequest.
+    Every identifier, operator and aggregate function is validated against a
+    whitelist and quoted, so only values are ever passed as parameters.
+    The engine is only needed to infer join conditions from foreign keys.
+    """
+    _check_identifier(query.table, "table")
+
+    params = {}
+    param_count = 1
+
+    join_sql, tables = _compile_joins(query, engine)
+    aggregates = _compile_aggregates(query.aggregates, tables) if query.aggregates else {}
+    group_by = list(query.group_by or [])
+    select = list(query.select or [])
+
+    if aggregates or group_by:
+        # Plain columns next to aggregates must be grouped, or Postgres rejects the query.
+        for col in select:
+            if col not in group_by:
+                raise ValueError(f"Column '{col}' must appear in group_by when aggregating.")
+        if not select:
+            select = list(group_by)
+
+    select_parts = []
+    for col in select:
+        ref = _column_ref(col, tables)
+        # Qualified columns keep their qualified name so joined tables don't collide in the result.
+        select_parts.append(f'{ref} AS "{col}"' if "." in col else ref)
+    select_parts += [f'{expr} AS "{alias}"' for alias, expr in aggregates.items()]
+    columns = ", ".join(select_parts) if select_parts else "*"
+    sql = f'SELECT {columns} FROM "{query.table}"{join_sql}'
+
+    if query.where:
+        where_clauses = []
+        for col, op, val in query.where:
+            ref = _column_ref(col, tables)
+            op = _check_operator(op)
+            param_name = f"p{param_count}"
+            param_count += 1
+            where_clauses.append(f'{ref} {op} :{param_name}')
+            params[param_name] = val
+        sql += " WHERE " + " AND ".join(where_clauses)
+
+    if group_by:
+        sql += " GROUP BY " + ", ".join(_column_ref(c, tables) for c in group_by)
+
+    if query.having:
+        if not aggregates:
+            raise ValueError("'having' requires at least one aggregate.")
+        having_clauses = []
+        for alias, op, val in query.having:
+            if alias not in aggregates:
+                raise ValueError(f"Unknown aggregate in having: {alias}")
+            op = _check_operator(op)
+            param_name = f"p{param_count}"
+            param_count += 1
+            # Postgres does not allow output aliases in HAVING, so repeat the expression.
+            having_clauses.append(f"{aggregates[alias]} {op} :{param_name}")
+            params[param_name] = val
+        sql += " HAVING " + " AND ".join(having_clauses)
+
+    if query.order_by:
+        order_clauses = []
+        for col, direction in query.order_by:
+            if direction.lower() not in ['asc', 'desc']: raise ValueError(f"Invalid order direction: {direction}")
+            # Aggregate aliases and qualified select names sort by their output column.
+            ref = f'"{col}"' if col in aggregates or (col in select and "." in col) else _column_ref(col, tables)
+            order_clauses.append(f'{ref} {direction.upper()}')
+        sql += " ORDER BY " + ", ".join(order_clauses)
+
+    if query.limit is not None:
+        sql += " LIMIT :limit"
+        params["limit"] = query.limit
+    if query.offset is not None:
+        sql += " OFFSET :offset"
+        params["offset"] = query.offset
+
+    return sql, params
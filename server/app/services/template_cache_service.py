@@ -1,46 +1,251 @@
 # app/services/template_cache_service.py
 import hashlib
+import threading
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import text, func
+from sqlalchemy.engine import Engine
 from sqlalchemy.orm import Session
-from typing import List, Tuple
+from typing import Dict, List, Tuple
 
+from app.core.config import settings
+from app.db.session import SessionLocal
+from app.db.snapshot import detached_snapshot
 from app.models.query_template_model import QueryTemplate
 from app.models.user_model import User
+from app.services import history_service, history_writer
 from app.utils.caching_utils import normalize_prompt_template
+from app.utils.sql_templatizer import referenced_tables
+from app.utils.ttl_cache import TTLCache
 
-def _create_template_id(user: User, normalized_prompt: str) -> str:
-    """Creates a consistent, hash-based ID for a template."""
-    return hashlib.sha256(f"{user.user_id}:{normalized_prompt}".encode()).hexdigest()
+# Statements that change a tenant's schema, and so may invalidate cached SQL.
+DDL_KEYWORDS = ('CREATE', 'DROP', 'ALTER', 'TRUNCATE', 'RENAME', 'COMMENT')
 
-def find_template_in_cache(db: Session, *, user: User, prompt_template: str) -> Tuple[QueryTemplate | None, List[str]]:
+# SQLSTATEs meaning cached SQL no longer fits the schema: undefined_table, undefined_column,
+# datatype_mismatch. Any other failure (constraint violations, bad values) is the request's fault.
+SCHEMA_DRIFT_SQLSTATES = {"42P01", "42703", "42804"}
+
+# In-process L1 in front of the template table, keyed on the template ID hash.
+_templates = TTLCache("rapid_cache_templates", ttl_seconds=settings.RAPID_CACHE_L1_TTL_SECONDS, max_entries=settings.RAPID_CACHE_L1_MAX_ENTRIES)
+# Column fingerprints of tenant tables, keyed on (virtual_database_id, tables).
+_fingerprints = TTLCache("schema_fingerprints", ttl_seconds=settings.SCHEMA_FINGERPRINT_TTL_SECONDS, max_entries=settings.RAPID_CACHE_L1_MAX_ENTRIES)
+
+_stats = {"hits": 0, "misses": 0, "stale": 0, "failures": 0, "regenerations": 0, "evicted": 0}
+# Hits are counted in memory and written in batches by the history writer: template_id -> (hits, last used).
+_pending_hits: Dict[str, Tuple[int, datetime]] = {}
+_lock = threading.Lock()
+
+def _count(key: str, n: int = 1):
+    with _lock:
+        _stats[key] += n
+
+def _create_template_id(user: User, virtual_database_id: str, normalized_prompt: str) -> str:
     """
-    Finds a query template using a normalized version of the prompt.
+    Creates a consistent, hash-based ID for a template. The same prompt gets one template per
+    database, since the SQL, its schema fingerprint and its failures depend on that database's schema.
+    """
+    return hashlib.sha256(f"{user.user_id}:{virtual_database_id}:{normalized_prompt}".encode()).hexdigest()
+
+def find_template_in_cache(
+    db: Session, *, user: User, virtual_database_id: str, prompt_template: str
+) -> Tuple[QueryTemplate | None, List[str]]:
+    """
+    Finds a query template for the database using a normalized version of the prompt.
     Returns the template object and the list of original parameter names from the prompt.
     """
     normalized_prompt, original_param_names = normalize_prompt_template(prompt_template)
-    template_id = _create_template_id(user, normalized_prompt)
-    template = db.query(QueryTemplate).filter_by(id=template_id).first()
+    template_id = _create_template_id(user, virtual_database_id, normalized_prompt)
+    template = _templates.get(template_id)
+    if template is None:
+        template = db.query(QueryTemplate).filter_by(id=template_id).first()
+        if template:
+            _templates.set(template_id, detached_snapshot(template))
+    if template is not None and template.failure_count >= settings.TEMPLATE_MAX_FAILURES:
+        # Keeps breaking even after being rebuilt; not worth serving.
+        template = None
+    _count("hits" if template else "misses")
     return template, original_param_names
 
+def schema_fingerprint(engine: Engine, virtual_database_id: str, tables: List[str], *, refresh: bool = False) -> str:
+    """Hash of the columns (name, type, nullability) of `tables` in the tenant database."""
+    key = (virtual_database_id, tuple(tables))
+    fingerprint = None if refresh else _fingerprints.get(key)
+    if fingerprint is None:
+        with engine.connect() as connection:
+            rows = connection.execute(text("""
+                SELECT table_name, column_name, data_type, is_nullable
+                FROM information_schema.columns
+                WHERE table_schema = current_schema() AND table_name = ANY(:tables)
+                ORDER BY table_name, ordinal_position
+            """), {"tables": list(tables)}).all()
+        fingerprint = hashlib.sha256(repr([tuple(row) for row in rows]).encode()).hexdigest()
+        _fingerprints.set(key, fingerprint)
+    return fingerprint
+
+def is_template_stale(template: QueryTemplate, *, engine: Engine, virtual_database_id: str) -> bool:
+    """True if the tables the template touches no longer look like they did when it was built."""
+    if not template.schema_fingerprint:
+        return False
+    stale = schema_fingerprint(engine, virtual_database_id, template.referenced_tables or []) != template.schema_fingerprint
+    if stale:
+        _count("stale")
+    return stale
+
+def record_template_hit(template: QueryTemplate):
+    with _lock:
+        hits, _ = _pending_hits.get(template.id, (0, None))
+        _pending_hits[template.id] = (hits + 1, datetime.now(timezone.utc))
+
+def flush_template_hits():
+    """Writes the buffered hit counts and last-used times in one round trip."""
+    with _lock:
+        pending = list(_pending_hits.items())
+        _pending_hits.clear()
+    if not pending:
+        return
+    db = SessionLocal()
+    try:
+        db.execute(
+            text("UPDATE fastdb_query_templates SET hit_count = hit_count + :hits, last_used_at = :last_used WHERE id = :id"),
+            [{"id": template_id, "hits": hits, "last_used": last_used} for template_id, (hits, last_used) in pending]
+        )
+        db.commit()
+    finally:
+        db.close()
+
+history_writer.register_flush_hook(flush_template_hits)
+
+def is_schema_drift_error(result_dict: dict) -> bool:
+    """True if a failed execution result means the SQL was written against another schema."""
+    return result_dict.get("sqlstate") in SCHEMA_DRIFT_SQLSTATES
+
+def record_template_failure(db: Session, template: QueryTemplate):
+    """
+    Counts a failed execution and marks the template unverified, so its next lookup
+    asks the NLP engine again instead of serving the same SQL; drops it from the L1.
+    """
+    _count("failures")
+    db.query(QueryTemplate).filter(QueryTemplate.id == template.id).update(
+        {QueryTemplate.failure_count: QueryTemplate.failure_count + 1, QueryTemplate.verified: False},
+        synchronize_session=False
+    )
+    db.commit()
+    _templates.invalidate(template.id)
+
+def record_template_success(db: Session, template: QueryTemplate):
+    """Clears the failures of a template that ran fine again, e.g. once its schema is back."""
+    if not template.failure_count:
+        return
+    db.query(QueryTemplate).filter(QueryTemplate.id == template.id).update(
+        {QueryTemplate.failure_count: 0}, synchronize_session=False
+    )
+    db.commit()
+    _templates.invalidate(template.id)
+
+def record_template_regeneration():
+    _count("regenerations")
+
+def _evict_for_user(db: Session, user_id: str):
+    """Drops a user's templates that sat unused past the TTL, then the least recently used beyond the cap."""
+    cutoff = datetime.now(timezone.utc) - timedelta(days=settings.TEMPLATE_IDLE_TTL_DAYS)
+    expired = db.query(QueryTemplate.id).filter(QueryTemplate.user_id == user_id, QueryTemplate.last_used_at < cutoff)
+    overflow = db.query(QueryTemplate.id).filter(QueryTemplate.user_id == user_id) \
+        .order_by(QueryTemplate.last_used_at.desc()).offset(settings.TEMPLATE_MAX_PER_USER)
+    evicted = [row.id for row in expired.union(overflow).all()]
+    if evicted:
+        db.query(QueryTemplate).filter(QueryTemplate.id.in_(evicted)).delete(synchronize_session=False)
+        for template_id in evicted:
+            _templates.invalidate(template_id)
+        _count("evicted", len(evicted))
+
 def save_template_to_cache(
     db: Session,
     *,
     user: User,
     prompt_template: str,
     sql_template: str,
-    param_map: List[str]
+    param_map: List[str],
+    virtual_database_id: str,
+    verified: bool = True,
+    engine: Engine | None = None
 ) -> QueryTemplate:
-    """Saves a new template to the cache."""
+    """
+    Saves a template to the cache, replacing any existing one for the same prompt and database.
+    With `engine`, the template records the schema it was built against.
+    """
     normalized_prompt, _ = normalize_prompt_template(prompt_template)
-    template_id = _create_template_id(user, normalized_prompt)
-    
+    template_id = _create_template_id(user, virtual_database_id, normalized_prompt)
+
+    existing = db.get(QueryTemplate, template_id)
+
+    tables = referenced_tables(sql_template)
+    # Always read the live schema here: the cached fingerprint may predate the change that caused this save.
+    fingerprint = schema_fingerprint(engine, virtual_database_id, tables, refresh=True) if engine is not None else None
+
     new_template = QueryTemplate(
         id=template_id,
         user_id=user.user_id,
         normalized_prompt=normalized_prompt,
         sql_template=sql_template,
-        original_param_map=param_map
+        original_param_map=param_map,
+        verified=verified,
+        referenced_tables=tables,
+        schema_fingerprint=fingerprint,
+        last_used_at=datetime.now(timezone.utc)
     )
-    db.add(new_template)
+    if existing is None or existing.sql_template != sql_template or existing.schema_fingerprint != fingerprint:
+        # Different SQL, or a schema that has changed since, starts with a clean record;
+        # the same SQL against the same schema keeps its failures.
+        new_template.failure_count = 0
+    new_template = db.merge(new_template)
+    db.flush()
+    _evict_for_user(db, user.user_id)
     db.commit()
     db.refresh(new_template)
-    return new_template
\ No newline at end of file
+    _templates.set(template_id, detached_snapshot(new_template))
+    return new_template
+
+def get_template_cache_stats(db: Session, *, user: User) -> dict:
+    """Template cache effectiveness for one user, plus this process's counters."""
+    count, total_hits, total_failures = db.query(
+        func.count(QueryTemplate.id),
+        func.coalesce(func.sum(QueryTemplate.hit_count), 0),
+        func.coalesce(func.sum(QueryTemplate.failure_count), 0)
+    ).filter(QueryTemplate.user_id == user.user_id).one()
+    top = db.query(QueryTemplate).filter(QueryTemplate.user_id == user.user_id) \
+        .order_by(QueryTemplate.hit_count.desc()).limit(10).all()
+    with _lock:
+        process = dict(_stats)
+    lookups = process["hits"] + process["misses"]
+    process["hit_ratio"] = round(process["hits"] / lookups, 4) if lookups else 0.0
+    return {
+        "templates": count,
+        "max_templates": settings.TEMPLATE_MAX_PER_USER,
+        "total_hits": int(total_hits),
+        "total_failures": int(total_failures),
+        "top_templates": [
+            {
+                "prompt": t.normalized_prompt,
+                "hit_count": t.hit_count,
+                "failure_count": t.failure_count,
+                "verified": t.verified,
+                "last_used_at": t.last_used_at,
+            }
+            for t in top
+        ],
+        "process": process,
+        "l1": _templates.stats(),
+    }
+
+def invalidate_cached_templates(*, user_id: str):
+    """Drops a user's templates from the L1 so the next lookup re-reads them."""
+    _templates.invalidate_where(lambda _, template: template.user_id == user_id)
+
+def is_schema_change(sql_commands: List[str]) -> bool:
+    return any(cmd.strip().upper().startswith(DDL_KEYWORDS) for cmd in sql_commands)
+
+def invalidate_for_schema_change(*, user_id: str, virtual_database_id: str):
+    """Drops L1 entries that may hold SQL written against the database's previous schema."""
+    history_service.invalidate_cached_history(virtual_database_id=virtual_database_id)
+    invalidate_cached_templates(user_id=user_id)
+    # Templates on this database are re-checked against a fresh fingerprint on their next hit.
+    _fingerprints.invalidate_where(lambda key, _: key[0] == virtual_database_id)
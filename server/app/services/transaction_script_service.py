@@ -0,0 +1,146 @@
+# server/app/services/transaction_script_service.py
+from typing import Dict, List, Tuple
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+
+from app.core.sql_executor import execute_sql
+from app.schemas.query_schema import QueryResultData, QueryResultMetadata
+from app.schemas.transaction_schema import ScriptRequest, ScriptStep, ScriptStepResult, ScriptResponse
+from app.services import sql_builder
+
+WRITE_KEYWORDS = ('INSERT', 'UPDATE', 'DELETE', 'CREATE', 'DROP', 'ALTER', 'TRUNCATE')
+# run_script owns the transaction and its savepoints; a step must not end or reshape it.
+TRANSACTION_CONTROL_KEYWORDS = ('BEGIN', 'START', 'COMMIT', 'END', 'ROLLBACK', 'ABORT', 'SAVEPOINT', 'RELEASE', 'PREPARE')
+
+def _split_statements(sql: str) -> List[str]:
+    # Splits like the query endpoint does; a ';' inside a literal makes a step look like two statements.
+    return [statement.strip() for statement in sql.split(';') if statement.strip()]
+
+def _step_operations(step: ScriptStep) -> List[str]:
+    return [name for name in ("sql", "select", "insert", "update", "delete") if getattr(step, name) is not None]
+
+def validate_script(script: ScriptRequest):
+    """Rejects malformed scripts before any statement runs. Raises ValueError."""
+    declared = set()
+    for index, step in enumerate(script.steps):
+        if len(_step_operations(step)) > 1:
+            raise ValueError(f"Step {index} has more than one operation.")
+        if step.sql is not None:
+            statements = _split_statements(step.sql)
+            if len(statements) > 1:
+                raise ValueError(f"Step {index} has more than one SQL statement; give each its own step.")
+            if statements and statements[0].split(None, 1)[0].upper() in TRANSACTION_CONTROL_KEYWORDS:
+                raise ValueError(f"Step {index} controls the transaction; use the script's savepoints and commit flag instead.")
+        if step.savepoint is not None:
+            if not step.savepoint.isidentifier():
+                raise ValueError(f"Invalid savepoint name '{step.savepoint}'.")
+            declared.add(step.savepoint)
+        if step.on_error == "rollback_to_savepoint":
+            target = step.rollback_to
+            if target is None and not declared:
+                raise ValueError(f"Step {index} rolls back to a savepoint, but none is set before it.")
+            if target is not None and target not in declared:
+                raise ValueError(f"Step {index} rolls back to unknown savepoint '{target}'.")
+
+def script_writes(script: ScriptRequest) -> bool:
+    for step in script.steps:
+        if step.insert or step.update or step.delete:
+            return True
+        if step.sql and any(statement.upper().startswith(WRITE_KEYWORDS) for statement in _split_statements(step.sql)):
+            return True
+    return False
+
+def _compile_step(step: ScriptStep, engine: Engine) -> Tuple[str, Dict | List]:
+    if step.sql is not None:
+        return step.sql, step.params
+    if step.select is not None:
+        return sql_builder.build_safe_sql(step.select, engine)
+    if step.insert is not None:
+        if not step.insert.data:
+            raise ValueError("No data provided to insert.")
+        return sql_builder.build_insert_sql(step.insert.table_name, step.insert.data, engine)
+    if step.update is not None:
+        if not step.update.conditions:
+            raise ValueError("An update step needs at least one condition.")
+        return sql_builder.build_update_sql(step.update.table_name, step.update.data, step.update.conditions, engine)
+    if step.delete is not None:
+        if not step.delete.conditions:
+            raise ValueError("A delete step needs at least one condition.")
+        return sql_builder.build_delete_sql(step.delete.table_name, step.delete.conditions, engine)
+
+def _to_step_result(index: int, step: ScriptStep, result_dict: dict) -> ScriptStepResult:
+    result = None
+    if result_dict.get("success"):
+        if "data" in result_dict:
+            columns = [str(c) for c in result_dict["data"]["columns"]]
+            result = QueryResultData(columns=columns, data=[dict(zip(columns, row)) for row in result_dict["data"]["rows"]])
+        else:
+            result = QueryResultMetadata(rows_affected=result_dict.get("rowcount", 0))
+    return ScriptStepResult(id=step.id, index=index, success=result_dict["success"], message=result_dict["message"], result=result)
+
+def run_script(engine: Engine, script: ScriptRequest) -> ScriptResponse:
+    """
+    Runs every step of the script inside a single transaction on one connection.
+    Steps run in order; a failing step is handled according to its on_error policy.
+    """
+    quote = lambda name: sql_builder.quote(name, engine)
+    results: List[ScriptStepResult] = []
+    savepoints: List[str] = []
+    aborted = False
+
+    with engine.connect() as connection:
+        transaction = connection.begin()
+        try:
+            for index, step in enumerate(script.steps):
+                if step.savepoint is not None:
+                    connection.execute(text(f"SAVEPOINT {quote(step.savepoint)}"))
+                    # Re-declaring a name moves it, like Postgres does.
+                    if step.savepoint in savepoints:
+                        savepoints.remove(step.savepoint)
+                    savepoints.append(step.savepoint)
+
+                if not _step_operations(step):
+                    message = f"Savepoint '{step.savepoint}' set." if step.savepoint else "Nothing to run."
+                    results.append(ScriptStepResult(id=step.id, index=index, success=True, message=message))
+                    continue
+
+                # "continue" steps run under their own savepoint so a failure undoes just that step.
+                step_savepoint = f"fastdb_step_{index}"
+                if step.on_error == "continue":
+                    connection.execute(text(f"SAVEPOINT {step_savepoint}"))
+
+                try:
+                    sql, params = _compile_step(step, engine)
+                    step_result = _to_step_result(index, step, execute_sql(connection, sql, params=params))
+                except ValueError as e:
+                    step_result = ScriptStepResult(id=step.id, index=index, success=False, message=str(e))
+                results.append(step_result)
+
+                if step.on_error == "continue":
+                    action = "RELEASE" if step_result.success else "ROLLBACK TO"
+                    connection.execute(text(f"{action} SAVEPOINT {step_savepoint}"))
+                if step_result.success or step.on_error == "continue":
+                    continue
+
+                if step.on_error == "rollback_to_savepoint":
+                    target = step.rollback_to or (savepoints[-1] if savepoints else None)
+                    # The target may already be gone if an earlier rollback went past it.
+                    if target in savepoints:
+                        connection.execute(text(f"ROLLBACK TO SAVEPOINT {quote(target)}"))
+                        # Savepoints set after the target no longer exist.
+                        del savepoints[savepoints.index(target) + 1:]
+                        step_result.rolled_back_to = target
+                        continue
+                aborted = True
+                break
+        except Exception:
+            transaction.rollback()
+            raise
+
+        committed = script.commit and not aborted
+        if committed:
+            transaction.commit()
+        else:
+            transaction.rollback()
+
+    return ScriptResponse(success=not aborted and all(r.success for r in results), committed=committed, results=results)
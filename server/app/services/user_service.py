@@ -1,6 +1,6 @@
 # server/app/services/user_service.py
+import logging
 from sqlalchemy.orm import Session
-from sqlalchemy import text
 
 from app.models.user_model import User
 from app.schemas.user import UserCreate
@@ -9,9 +9,11 @@ from app.utils.hashing import get_password_hash
 from app.utils.gen_apikey import generate_api_key
 
 from app.models.virtual_database_model import VirtualDatabase
-from app.db.session import get_superuser_engine
+from app.services import placement_service, provisioning_service
 from app.services.virtual_database_service import generate_physical_name
 
+logger = logging.getLogger(__name__)
+
 def get_user_by_email(db: Session, email: str) -> User | None:
     return db.query(User).filter(User.email == email).first()
 
@@ -34,17 +36,17 @@ def create_user(db: Session, user: UserCreate) -> User:
         default_virtual_name = "fastdb"
         physical_name = generate_physical_name(db_user.user_id, default_virtual_name)
 
-        # 3. Create the physical database using the superuser engine
-        superuser_engine = get_superuser_engine()
-        with superuser_engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
-            conn.execute(text(f'CREATE DATABASE "{physical_name}"'))
-            print(f"Successfully created physical database: {physical_name} for user {db_user.email}")
+        # 3. Pick a server, then claim a spare from its warm pool or create the physical database
+        server_id = placement_service.choose_server(db)
+        provisioning_service.provision_physical_database(physical_name, server_id)
+        logger.info("Created physical database '%s' for user %s.", physical_name, db_user.user_id)
 
         # 4. Create the virtual database metadata record
         default_db = VirtualDatabase(
             user_id=db_user.user_id,
             virtual_name=default_virtual_name,
-            physical_name=physical_name
+            physical_name=physical_name,
+            server_id=server_id
         )
         db.add(default_db)
 
@@ -53,7 +55,7 @@ def create_user(db: Session, user: UserCreate) -> User:
 
     except Exception as e:
         # If anything fails during database creation, roll back the user creation
-        print(f"ERROR: Failed to provision default database for user {user.email}. Rolling back user creation.")
+        logger.error("Failed to provision the default database for a new user; rolling back the signup: %s", e)
         db.rollback()
         # Re-raise the exception so the API endpoint can return a 500 error
         raise e
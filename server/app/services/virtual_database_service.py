@@ -1,32 +1,37 @@
 # server/app/services/virtual_database_service.py
+import logging
 from sqlalchemy.orm import Session
 from sqlalchemy import text, or_
-from typing import List
+from sqlalchemy.exc import DBAPIError
+from typing import List, Tuple
+from datetime import datetime, timezone
+import time
 
 from app.models.virtual_database_model import VirtualDatabase
 from app.models.user_model import User
+from app.models.admin_job_model import AdminJob
 from app.schemas.virtual_database_schema import VirtualDatabaseCreate
+from app.core.config import settings
+from app.db.engine import dispose_engine_for_user_db
 from app.db.session import get_superuser_engine
 from app.utils.gen_physical_name import generate_physical_name
-from app.models.database_collab_model import DatabaseMember
+from app.utils.off_peak import next_off_peak
+from app.models.database_collab_model import DatabaseMember, DBRole
+from app.services import admin_job_service, history_service, placement_service, provisioning_service
+from app.core.authorization import (
+    resolve_tenant_access, invalidate_tenant_access, role_expression, member_join_condition
+)
+
+logger = logging.getLogger(__name__)
 
 def get_accessible_database(db: Session, *, user: User, virtual_name: str) -> VirtualDatabase | None:
     """
     Finds a virtual database by name that a user has access to,
     either as the direct owner or as a collaborator.
     """
-    return db.query(VirtualDatabase).filter(
-        VirtualDatabase.virtual_name == virtual_name,
-        or_(
-            # Condition 1: The user is the direct owner of the database.
-            VirtualDatabase.user_id == user.user_id,
-            
-            # Condition 2: The user is listed as a member in the collaboration table.
-            VirtualDatabase.id.in_(
-                db.query(DatabaseMember.database_id).filter(DatabaseMember.user_id == user.user_id)
-            )
-        )
-    ).first()
+    # Metadata only: looking a database up does not wake it from hibernation.
+    access = resolve_tenant_access(db, user=user, virtual_name=virtual_name, require_awake=False)
+    return access.virtual_db if access else None
 
 def create_virtual_database(db: Session, *, owner: User, db_in: VirtualDatabaseCreate) -> VirtualDatabase:
     """The main function to create a virtual and physical database."""
@@ -34,66 +39,152 @@ def create_virtual_database(db: Session, *, owner: User, db_in: VirtualDatabaseC
     # 1. Generate the unique physical name
     physical_name = generate_physical_name(owner.user_id, db_in.virtual_name)
     
-    # 2. Use the superuser engine to create the actual PostgreSQL database
-    engine = get_superuser_engine()
-    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
-        # Use quotes to handle potential reserved keywords
-        conn.execute(text(f'CREATE DATABASE "{physical_name}"'))
-        
+    # 2. Pick a server, then claim a spare from its warm pool or create the actual PostgreSQL database
+    server_id = placement_service.choose_server(db)
+    provisioning_service.provision_physical_database(physical_name, server_id)
+
     # 3. Create the record in our metadata table
     db_obj = VirtualDatabase(
         user_id=owner.user_id,
         virtual_name=db_in.virtual_name,
-        physical_name=physical_name
+        physical_name=physical_name,
+        server_id=server_id
     )
     db.add(db_obj)
     db.commit()
     db.refresh(db_obj)
+    # A new owned database takes precedence over a shared one with the same name.
+    invalidate_tenant_access(db, user_id=owner.user_id)
     return db_obj
 
-def delete_virtual_database(db: Session, *, db_to_drop: VirtualDatabase):
+class DatabaseBusyError(RuntimeError):
+    """The source database kept running queries past the clone drain timeout."""
+
+def _copy_physical_database(source_name: str, target_name: str, server_id: str):
     """
-    Deletes a physical database and its corresponding metadata record.
+    CREATE DATABASE ... TEMPLATE needs the source to have no other sessions. Idle pooled
+    connections are closed (pools reconnect on demand); running queries and open
+    transactions are waited for, up to CLONE_DRAIN_TIMEOUT_SECONDS.
     """
-    physical_name = db_to_drop.physical_name
-    
-    # 1. Use the superuser engine to drop the actual PostgreSQL database
-    engine = get_superuser_engine()
+    dispose_engine_for_user_db(source_name, server_id)
+    deadline = time.monotonic() + settings.CLONE_DRAIN_TIMEOUT_SECONDS
+    engine = get_superuser_engine(server_id)
     with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
-        # First, terminate any active connections to the database
-        terminate_query = text(f"""
-            SELECT pg_terminate_backend(pid) FROM pg_stat_activity
-            WHERE datname = '{physical_name}' AND pid <> pg_backend_pid();
-        """)
-        conn.execute(terminate_query)
-        
-        # Now, drop the database
-        conn.execute(text(f'DROP DATABASE "{physical_name}"'))
-        
-    # 2. Delete the record from our metadata table
-    db.delete(db_to_drop)
+        while True:
+            busy = conn.execute(text("""
+                SELECT count(*) FROM pg_stat_activity
+                WHERE datname = :name AND pid <> pg_backend_pid() AND state IS DISTINCT FROM 'idle'
+            """), {"name": source_name}).scalar()
+            if not busy:
+                conn.execute(text("""
+                    SELECT pg_terminate_backend(pid) FROM pg_stat_activity
+                    WHERE datname = :name AND pid <> pg_backend_pid() AND state = 'idle'
+                """), {"name": source_name})
+                try:
+                    conn.execute(text(f'CREATE DATABASE "{target_name}" TEMPLATE "{source_name}"'))
+                    return
+                except DBAPIError as e:
+                    # A new connection slipped in between; drain again.
+                    if "is being accessed by other users" not in str(e):
+                        raise
+            if time.monotonic() >= deadline:
+                raise DatabaseBusyError("The database is busy; close open transactions and try again.")
+            time.sleep(0.2)
+
+def clone_virtual_database(db: Session, *, owner: User, source: VirtualDatabase, db_in: VirtualDatabaseCreate) -> VirtualDatabase:
+    """
+    Copies a database's schema and data into a new virtual database owned by `owner`.
+    The copy is made on the source's server, whatever the placement policy.
+    """
+    physical_name = generate_physical_name(owner.user_id, db_in.virtual_name)
+    logger.info("Cloning '%s' into '%s' on server '%s'.", source.physical_name, physical_name, source.server_id)
+    _copy_physical_database(source.physical_name, physical_name, source.server_id)
+
+    db_obj = VirtualDatabase(
+        user_id=owner.user_id,
+        virtual_name=db_in.virtual_name,
+        physical_name=physical_name,
+        server_id=source.server_id
+    )
+    db.add(db_obj)
+    db.commit()
+    db.refresh(db_obj)
+    invalidate_tenant_access(db, user_id=owner.user_id)
+    return db_obj
+
+def delete_virtual_database(db: Session, *, db_to_drop: VirtualDatabase) -> AdminJob:
+    """
+    Soft-deletes a database: it disappears at once and can still be restored until
+    a background job drops the physical database in the next off-peak window.
+    """
+    database_id = db_to_drop.id
+    db_to_drop.deleted_at = datetime.now(timezone.utc)
+    job = admin_job_service.enqueue_job(
+        db,
+        user_id=db_to_drop.user_id,
+        virtual_database_id=database_id,
+        kind=admin_job_service.DROP_DATABASE,
+        payload={"physical_name": db_to_drop.physical_name, "server_id": db_to_drop.server_id},
+        run_after=next_off_peak()
+    )
     db.commit()
-    return
+    invalidate_tenant_access(db, database_id=database_id)
+    history_service.invalidate_cached_history(virtual_database_id=database_id)
+    dispose_engine_for_user_db(db_to_drop.physical_name, db_to_drop.server_id)
+    admin_job_service.wake_worker()
+    return job
+
+def restore_virtual_database(db: Session, *, owner: User, virtual_name: str) -> VirtualDatabase:
+    """Brings back a soft-deleted database whose physical drop has not started yet."""
+    if get_accessible_database(db, user=owner, virtual_name=virtual_name):
+        raise ValueError(f"You already have a database named '{virtual_name}'.")
+    deleted = db.query(VirtualDatabase).filter(
+        VirtualDatabase.user_id == owner.user_id,
+        VirtualDatabase.virtual_name == virtual_name,
+        VirtualDatabase.deleted_at.isnot(None)
+    ).order_by(VirtualDatabase.deleted_at.desc()).all()
+    for db_obj in deleted:
+        if admin_job_service.cancel_pending_job(db, virtual_database_id=db_obj.id, kind=admin_job_service.DROP_DATABASE):
+            db_obj.deleted_at = None
+            db.commit()
+            db.refresh(db_obj)
+            invalidate_tenant_access(db, user_id=owner.user_id)
+            return db_obj
+    raise ValueError(f"No restorable database named '{virtual_name}'.")
+
+def _annotate_roles(rows) -> List[VirtualDatabase]:
+    """Copies the role computed by the query onto each database for the API response."""
+    dbs = []
+    for db_obj, role_name in rows:
+        db_obj.current_user_role = DBRole(role_name)
+        dbs.append(db_obj)
+    return dbs
 
 def get_all_dbs_for_user(db: Session, *, user: User) -> List[VirtualDatabase]:
-    owned_dbs = db.query(VirtualDatabase).filter(VirtualDatabase.user_id == user.user_id)
-    
-    # Query for DBs the user is a member of
-    member_dbs = db.query(VirtualDatabase).join(DatabaseMember).filter(DatabaseMember.user_id == user.user_id)
-    
-    # Combine, remove duplicates, and return
-    all_dbs = owned_dbs.union(member_dbs).all()
-    return all_dbs
+    """
+    Returns every virtual database the user owns or collaborates on, each annotated
+    with `current_user_role`. Served by a single query regardless of the count.
+    """
+    rows = db.query(VirtualDatabase, role_expression(user.user_id)).outerjoin(
+        DatabaseMember, member_join_condition(user.user_id)
+    ).filter(
+        or_(VirtualDatabase.user_id == user.user_id, DatabaseMember.user_id.isnot(None)),
+        VirtualDatabase.deleted_at.is_(None)
+    ).order_by(VirtualDatabase.created_at).all()
+    return _annotate_roles(rows)
 
 def get_collaborated_dbs_for_user(db: Session, *, user: User) -> List[VirtualDatabase]:
     """
     Returns a list of all virtual databases that the given user is a collaborator on
-    (i.e., they are a member but not the direct owner).
+    (i.e., they are a member but not the direct owner), annotated with their role.
     """
-    return db.query(VirtualDatabase).join(DatabaseMember).filter(
-        DatabaseMember.user_id == user.user_id,
-        VirtualDatabase.user_id != user.user_id 
-    ).all()
+    rows = db.query(VirtualDatabase, role_expression(user.user_id)).join(
+        DatabaseMember, member_join_condition(user.user_id)
+    ).filter(
+        VirtualDatabase.user_id != user.user_id,
+        VirtualDatabase.deleted_at.is_(None)
+    ).order_by(VirtualDatabase.created_at).all()
+    return _annotate_roles(rows)
 
 def get_owned_and_shared_dbs(db: Session, *, user: User) -> List[VirtualDatabase]:
     """
@@ -102,13 +193,14 @@ def get_owned_and_shared_dbs(db: Session, *, user: User) -> List[VirtualDatabase
     """
     return db.query(VirtualDatabase).join(DatabaseMember).filter(
         # Condition 1: The user must be the owner of the database
-        VirtualDatabase.user_id == user.user_id
+        VirtualDatabase.user_id == user.user_id,
+        VirtualDatabase.deleted_at.is_(None)
     ).distinct().all()
 
-def rename_virtual_database(db: Session, *, owner: User, old_virtual_name: str, new_virtual_name: str) -> VirtualDatabase:
+def rename_virtual_database(db: Session, *, owner: User, old_virtual_name: str, new_virtual_name: str) -> Tuple[VirtualDatabase, AdminJob]:
     """
-    Renames a user's virtual database. This involves renaming the physical
-    database and updating the metadata record.
+    Renames a user's virtual database. The metadata record is renamed at once and
+    a background job renames the physical database to match in the next off-peak window.
     """
     db_to_rename = get_accessible_database(db, user=owner, virtual_name=old_virtual_name)
     if not db_to_rename:
@@ -120,24 +212,19 @@ def rename_virtual_database(db: Session, *, owner: User, old_virtual_name: str,
     if get_accessible_database(db, user=owner, virtual_name=new_virtual_name):
         raise ValueError(f"You already have a database named '{new_virtual_name}'.")
     
-    old_physical_name = db_to_rename.physical_name
-    new_physical_name = generate_physical_name(owner.user_id, new_virtual_name)
-    
-    engine = get_superuser_engine()
-    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
-        print(f"Terminating any active connections to '{old_physical_name}'...")    
-        terminate_query = text(f"""
-            SELECT pg_terminate_backend(pid) FROM pg_stat_activity
-            WHERE datname = '{old_physical_name}' AND pid <> pg_backend_pid();
-        """)
-        conn.execute(terminate_query)
-        print("Connections terminated.")
-        print(f"Renaming physical database from '{old_physical_name}' to '{new_physical_name}'...")
-        conn.execute(text(f'ALTER DATABASE "{old_physical_name}" RENAME TO "{new_physical_name}";'))
-        
+    # The name users see changes now. The physical name is only cosmetic, and renaming it
+    # cuts off live connections, so the physical database follows off-peak.
     db_to_rename.virtual_name = new_virtual_name
-    db_to_rename.physical_name = new_physical_name
-    
+    job = admin_job_service.enqueue_job(
+        db,
+        user_id=owner.user_id,
+        virtual_database_id=db_to_rename.id,
+        kind=admin_job_service.RENAME_DATABASE,
+        payload={"old_virtual_name": old_virtual_name, "new_virtual_name": new_virtual_name},
+        run_after=next_off_peak()
+    )
     db.commit()
     db.refresh(db_to_rename)
-    return db_to_rename
\ No newline at end of file
+    invalidate_tenant_access(db, database_id=db_to_rename.id)
+    admin_job_service.wake_worker()
+    return db_to_rename, job
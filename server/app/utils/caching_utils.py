@@ -1,7 +1,23 @@
 # app/core/utils.py
 import re
+import hashlib
 from typing import Tuple, List, Dict, Any
 
+from app.utils.sql_templatizer import templatize
+
+# A quoted string literal, or a run of whitespace outside of one.
+_WHITESPACE_OUTSIDE_LITERALS = re.compile(r"('(?:[^']|'')*')|\s+")
+
+def normalize_for_lookup(text: str) -> str:
+    """Trims and collapses whitespace (outside string literals) so equivalent commands hash alike."""
+    return _WHITESPACE_OUTSIDE_LITERALS.sub(lambda m: m.group(1) or " ", text.strip())
+
+def lookup_hash(text: str | None) -> str | None:
+    """SHA-256 hex digest of the normalized text, used as an indexed lookup key."""
+    if text is None:
+        return None
+    return hashlib.sha256(normalize_for_lookup(text).encode()).hexdigest()
+
 def normalize_prompt_template(prompt: str) -> Tuple[str, List[str]]:
     """
     Normalizes a prompt by replacing named placeholders like {name} with
@@ -15,6 +31,49 @@ def normalize_prompt_template(prompt: str) -> Tuple[str, List[str]]:
         
     return normalized_prompt, original_param_names
 
+# Literals a user typed into a natural-language prompt: quoted strings, ISO dates and numbers.
+_PROMPT_LITERAL = re.compile(
+    r"'(?P<single>[^']*)'"
+    r'|"(?P<double>[^"]*)"'
+    r"|(?<![\w.-])(?P<date>\d{4}-\d{2}-\d{2})(?![\w.])"
+    r"|(?<![\w.])(?P<number>\d+(?:\.\d+)?)(?![\w.])"
+)
+
+def extract_literals(prompt: str) -> Tuple[str, Dict[str, Any]]:
+    """
+    Lifts literals out of a natural-language prompt so prompts that differ only
+    in their values share a template, e.g. "orders over 100" -> "orders over {lit_0}".
+    Returns the templated prompt and the extracted values keyed by placeholder name.
+    """
+    if "{" in prompt or "}" in prompt:
+        # The prompt already uses (or could be confused with) explicit placeholders.
+        return prompt, {}
+
+    values: Dict[str, Any] = {}
+
+    def lift(match) -> str:
+        name = f"lit_{len(values)}"
+        if match.group("number") is not None:
+            number = match.group("number")
+            values[name] = float(number) if "." in number else int(number)
+        else:
+            values[name] = next(v for v in (match.group("single"), match.group("double"), match.group("date")) if v is not None)
+        return f"{{{name}}}"
+
+    return _PROMPT_LITERAL.sub(lift, prompt), values
+
+_SQL_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+
+def template_binds_all_params(sql_template: str, param_count: int) -> bool:
+    """
+    True if every :param_i is bound outside of string literals, i.e. the template
+    does not still hard-code one of the values it was built from.
+    """
+    if any(":param_" in literal for literal in _SQL_STRING_LITERAL.findall(sql_template)):
+        return False
+    without_literals = _SQL_STRING_LITERAL.sub("''", sql_template)
+    return all(re.search(rf":param_{i}\b", without_literals) for i in range(param_count))
+
 def deconstruct_sql(
     llm_response: Dict[str, Any], 
     original_params: Dict[str, Any],
@@ -25,46 +84,9 @@ def deconstruct_sql(
     Returns the SQL template and the original parameter map (for storage).
     """
     sql = llm_response.get('sql', '')
-    
-    # Create a mapping from the literal value back to its generic placeholder name
-    placeholder_to_value_map = {
-        f":param_{i}": original_params.get(key)
-        for i, key in enumerate(original_param_names_in_order)
-        if original_params.get(key) is not None
-    }
-
-    sql_template = sql
-    sorted_items = sorted(
-        placeholder_to_value_map.items(),
-        key=lambda item: len(str(item[1])),
-        reverse=True
-    )
 
-    for placeholder, value in sorted_items:
-        str_value = str(value)
-        escaped_value = re.escape(str_value)
-
-        # Regex with named groups for clarity
-        pattern = re.compile(
-            # LIKE/ILIKE pattern with wildcards
-            f"'(?P<leading>[%_]*){escaped_value}(?P<trailing>[%_]*)'|"
-            # Exact quoted string
-            f"'(?P<quoted>{escaped_value})'|"
-            # Standalone numeric/boolean/word
-            f"\\b(?P<bare>{escaped_value})\\b"
-        )
-
-        def replacer(match):
-            if match.group("leading") is not None or match.group("trailing") is not None:
-                leading = match.group("leading") or ""
-                trailing = match.group("trailing") or ""
-                return f"'{leading}' || {placeholder} || '{trailing}'"
-            elif match.group("quoted") is not None:
-                return placeholder
-            elif match.group("bare") is not None:
-                return placeholder
-            return match.group(0)  # fallback, shouldn't hit
-
-        sql_template = pattern.sub(replacer, sql_template)
-    
-    return sql_template, original_param_names_in_order
\ No newline at end of file
+    placeholders = [
+        (f":param_{i}", original_params.get(key))
+        for i, key in enumerate(original_param_names_in_order)
+    ]
+    return templatize(sql, placeholders), original_param_names_in_order
@@ -3,8 +3,11 @@ import secrets
 import base64
 import re
 
+# Every API key starts with this prefix, which lets auth skip the JWT path for them.
+API_KEY_PREFIX = "fdb"
+
 def generate_api_key() -> str:
     random_bytes = secrets.token_bytes(24)
     safe_string = base64.urlsafe_b64encode(random_bytes).decode('utf-8')
     encoded = re.sub(r'[-_]', '', safe_string)
-    return f"fdb{encoded}"
\ No newline at end of file
+    return f"{API_KEY_PREFIX}{encoded}"
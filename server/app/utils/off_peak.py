@@ -0,0 +1,20 @@
+# app/utils/off_peak.py
+from datetime import datetime, timedelta, timezone
+
+from app.core.config import settings
+
+def next_off_peak(now: datetime | None = None) -> datetime:
+    """Start of the next ADMIN_JOB_OFF_PEAK_HOURS window (UTC, "start-end"), or now if inside one or unset."""
+    now = now or datetime.now(timezone.utc)
+    if not settings.ADMIN_JOB_OFF_PEAK_HOURS:
+        return now
+    start, end = (int(hour) for hour in settings.ADMIN_JOB_OFF_PEAK_HOURS.split("-"))
+    in_window = start <= now.hour < end if start < end else (now.hour >= start or now.hour < end)
+    if in_window:
+        return now
+    candidate = now.replace(hour=start, minute=0, second=0, microsecond=0)
+    return candidate if candidate > now else candidate + timedelta(days=1)
+
+def is_off_peak(now: datetime | None = None) -> bool:
+    now = now or datetime.now(timezone.utc)
+    return next_off_peak(now) <= now
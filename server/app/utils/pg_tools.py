@@ -0,0 +1,18 @@
+# app/utils/pg_tools.py
+import os
+import subprocess
+
+from app.core.config import settings
+from app.db.engine import get_server_address
+
+def pg_tool_path(name: str) -> str:
+    return os.path.join(settings.POSTGRES_BIN_DIR, name) if settings.POSTGRES_BIN_DIR else name
+
+def run_pg_tool(name: str, server_id: str, *args: str):
+    """Runs pg_dump / pg_restore as the superuser against one database server. Raises CalledProcessError on failure."""
+    host, port = get_server_address(server_id)
+    env = {**os.environ, "PGPASSWORD": settings.POSTGRES_SUPERUSER_PASSWORD}
+    subprocess.run(
+        [pg_tool_path(name), "-h", host, "-p", str(port), "-U", settings.POSTGRES_SUPERUSER, *args],
+        env=env, check=True, capture_output=True, text=True
+    )
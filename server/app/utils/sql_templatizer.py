@@ -0,0 +1,144 @@
+# app/utils/sql_templatizer.py
+"""
+Turns generated SQL into a named-parameter template in a single pass.
+
+The SQL is lexed once; only literal tokens (strings, numbers and TRUE/FALSE)
+are compared against the parameter values, so identifiers, comments and
+text inside other literals are never rewritten.
+"""
+import re
+from decimal import Decimal, InvalidOperation
+from typing import Any, Dict, Iterator, List, Tuple
+
+# Order matters: comments and quoted tokens must win over the generic patterns.
+_TOKEN = re.compile(r"""
+      (?P<comment>--[^\n]*|/\*.*?\*/)
+    | (?P<string>[Ee]?'(?:[^']|'')*')
+    | (?P<ident>"(?:[^"]|"")*")
+    | (?P<dollar>\$(?P<tag>\w*)\$.*?\$(?P=tag)\$)
+    | (?P<bind>(?<!:):\w+)
+    | (?P<number>(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?)
+    | (?P<word>\w+)
+    | (?P<space>\s+)
+    | (?P<other>::|.)
+""", re.VERBOSE | re.DOTALL)
+
+Token = Tuple[str, str]
+
+# Tokens after which a "-" is a sign rather than subtraction.
+_SIGN_CONTEXT = {"(", ",", "=", "<", ">", "<=", ">=", "<>", "!=", "+", "-", "*", "/"}
+_SIGN_KEYWORDS = {"SELECT", "WHERE", "AND", "OR", "NOT", "BETWEEN", "IN", "THEN", "ELSE", "WHEN",
+                  "VALUES", "LIMIT", "OFFSET", "SET", "RETURN", "IS", "LIKE", "ILIKE", "CASE", "ON", "HAVING"}
+
+def tokenize(sql: str) -> Iterator[Token]:
+    """Yields (kind, text) tokens covering the whole input."""
+    for match in _TOKEN.finditer(sql):
+        yield match.lastgroup, match.group(0)
+
+def _number_key(text: str) -> Decimal | None:
+    try:
+        return Decimal(text)
+    except InvalidOperation:
+        return None
+
+class _ValueIndex:
+    """Looks literal tokens up against the parameter values. The first parameter wins on ties."""
+
+    def __init__(self, placeholders: List[Tuple[str, Any]]):
+        self.strings: Dict[str, str] = {}
+        self.numbers: Dict[Decimal, str] = {}
+        self.booleans: Dict[bool, str] = {}
+        for placeholder, value in placeholders:
+            if isinstance(value, bool):
+                self.booleans.setdefault(value, placeholder)
+                self.strings.setdefault(str(value).lower(), placeholder)
+                continue
+            text = str(value)
+            self.strings.setdefault(text, placeholder)
+            if isinstance(value, (int, float, Decimal)) or re.fullmatch(r"-?\d+(?:\.\d+)?", text):
+                number = _number_key(text)
+                if number is not None:
+                    self.numbers.setdefault(number, placeholder)
+
+    def string_literal(self, body: str) -> str | None:
+        """Template for the body of a quoted literal, or None if it holds no parameter."""
+        placeholder = self.strings.get(body)
+        if placeholder:
+            return placeholder
+        # LIKE patterns: the value wrapped in % / _ wildcards.
+        core = body.strip("%_")
+        if core and core != body:
+            placeholder = self.strings.get(core)
+            if placeholder:
+                start = body.index(core)
+                leading, trailing = body[:start], body[start + len(core):]
+                return f"'{leading}' || {placeholder} || '{trailing}'"
+        return None
+
+    def number(self, text: str) -> str | None:
+        placeholder = self.strings.get(text)
+        if placeholder:
+            return placeholder
+        number = _number_key(text)
+        return self.numbers.get(number) if number is not None else None
+
+def templatize(sql: str, placeholders: List[Tuple[str, Any]]) -> str:
+    """
+    Replaces literals in `sql` that equal one of the (placeholder, value) pairs
+    with the placeholder, e.g. [(":param_0", 100)] turns "total > 100" into
+    "total > :param_0". Everything else is emitted unchanged.
+    """
+    index = _ValueIndex([(p, v) for p, v in placeholders if v is not None])
+    out: List[str] = []
+    # Last significant token, to tell a sign from a minus.
+    previous = ""
+
+    tokens = list(tokenize(sql))
+    i = 0
+    while i < len(tokens):
+        kind, text = tokens[i]
+        replacement = None
+
+        if kind == "string" and text[0] not in "Ee":
+            replacement = index.string_literal(text[1:-1].replace("''", "'"))
+        elif kind == "number":
+            replacement = index.number(text)
+        elif kind == "word" and text.upper() in ("TRUE", "FALSE"):
+            replacement = index.booleans.get(text.upper() == "TRUE")
+        elif kind == "other" and text == "-" and (previous in _SIGN_CONTEXT or previous.upper() in _SIGN_KEYWORDS or not previous):
+            # A signed number: match "-5" as a whole.
+            if i + 1 < len(tokens) and tokens[i + 1][0] == "number":
+                replacement = index.number("-" + tokens[i + 1][1])
+                if replacement:
+                    i += 1
+
+        out.append(replacement or text)
+        if kind not in ("space", "comment"):
+            previous = text
+        i += 1
+    return "".join(out)
+
+# Keywords that are followed by a table name.
+_TABLE_KEYWORDS = {"FROM", "JOIN", "UPDATE", "INTO", "TABLE"}
+
+def referenced_tables(sql: str) -> List[str]:
+    """Best-effort list of the tables a statement reads or writes, lower-cased and sorted."""
+    significant = [(kind, text) for kind, text in tokenize(sql) if kind not in ("space", "comment")]
+    tables = set()
+    for i, (kind, text) in enumerate(significant[:-1]):
+        if kind != "word" or text.upper() not in _TABLE_KEYWORDS:
+            continue
+        j = i + 1
+        # Skip modifiers such as "TABLE IF EXISTS" or "FROM ONLY".
+        while j < len(significant) and significant[j][1].upper() in ("IF", "NOT", "EXISTS", "ONLY", "LATERAL"):
+            j += 1
+        # Take the last part of a schema-qualified name.
+        while j + 2 < len(significant) and significant[j + 1][1] == "." and significant[j + 2][0] in ("word", "ident"):
+            j += 2
+        if j < len(significant):
+            next_kind, name = significant[j]
+            if next_kind == "word" and not name[0].isdigit():
+                tables.add(name.lower())
+            elif next_kind == "ident":
+                tables.add(name[1:-1].replace('""', '"'))
+    return sorted(tables)
@@ -0,0 +1,135 @@
+# benchmarks/templatizer.py
+"""
+Correctness corpus and benchmark for the SQL templatizer behind deconstruct_sql.
+
+    cd server && python -m benchmarks.templatizer
+
+Every corpus case is checked first (the script exits non-zero on a mismatch),
+then the single-pass templatizer is timed against the previous per-value
+regex implementation on short and long generated statements.
+"""
+import re
+import sys
+import timeit
+
+from app.utils.caching_utils import deconstruct_sql
+
+# (sql, params in prompt order, expected template)
+CORPUS = [
+    # Plain numbers and strings
+    ("SELECT * FROM orders WHERE total > 100",
+     {"min": 100}, "SELECT * FROM orders WHERE total > :param_0"),
+    ("SELECT * FROM users WHERE name = 'Alice'",
+     {"name": "Alice"}, "SELECT * FROM users WHERE name = :param_0"),
+    ("SELECT * FROM orders WHERE total BETWEEN 10 AND 250.5",
+     {"lo": 10, "hi": 250.5}, "SELECT * FROM orders WHERE total BETWEEN :param_0 AND :param_1"),
+    # Numbers written differently from the prompt
+    ("SELECT * FROM orders WHERE total > 100.00",
+     {"min": 100}, "SELECT * FROM orders WHERE total > :param_0"),
+    ("SELECT * FROM t WHERE x = -5",
+     {"x": -5}, "SELECT * FROM t WHERE x = :param_0"),
+    # LIKE patterns
+    ("SELECT * FROM users WHERE name ILIKE '%ali%'",
+     {"q": "ali"}, "SELECT * FROM users WHERE name ILIKE '%' || :param_0 || '%'"),
+    ("SELECT * FROM users WHERE code LIKE 'AB_'",
+     {"q": "AB"}, "SELECT * FROM users WHERE code LIKE '' || :param_0 || '_'"),
+    # Dates are plain string literals
+    ("SELECT * FROM orders WHERE created_at >= '2024-01-05'",
+     {"since": "2024-01-05"}, "SELECT * FROM orders WHERE created_at >= :param_0"),
+    # Identifiers that contain the value are left alone
+    ("SELECT col100, t100.x FROM t100 WHERE col100 > 100",
+     {"n": 100}, "SELECT col100, t100.x FROM t100 WHERE col100 > :param_0"),
+    ("SELECT name FROM users WHERE name = 'name'",
+     {"n": "name"}, "SELECT name FROM users WHERE name = :param_0"),
+    ('SELECT "Alice" FROM t WHERE c = \'Alice\'',
+     {"n": "Alice"}, 'SELECT "Alice" FROM t WHERE c = :param_0'),
+    # Values inside longer literals or comments are left alone
+    ("SELECT * FROM t WHERE note = 'paid 100 dollars' AND amount = 100 -- 100",
+     {"n": 100}, "SELECT * FROM t WHERE note = 'paid 100 dollars' AND amount = :param_0 -- 100"),
+    ("SELECT * FROM t WHERE created_at > now() - INTERVAL '7 days'",
+     {"d": 7}, "SELECT * FROM t WHERE created_at > now() - INTERVAL '7 days'"),
+    # Overlapping values: each literal maps to its own parameter
+    ("SELECT * FROM t WHERE a = 1 AND b = 10 AND c = 100",
+     {"a": 1, "b": 10, "c": 100}, "SELECT * FROM t WHERE a = :param_0 AND b = :param_1 AND c = :param_2"),
+    ("SELECT * FROM t WHERE a = 'Ann' AND b = 'Anna'",
+     {"a": "Ann", "b": "Anna"}, "SELECT * FROM t WHERE a = :param_0 AND b = :param_1"),
+    # Repeated value maps to the first parameter that carries it
+    ("SELECT * FROM t WHERE a = 3 OR b = 3",
+     {"x": 3, "y": 3}, "SELECT * FROM t WHERE a = :param_0 OR b = :param_0"),
+    # Booleans, escaped quotes, casts and existing binds
+    ("SELECT * FROM t WHERE active = TRUE",
+     {"active": True}, "SELECT * FROM t WHERE active = :param_0"),
+    ("SELECT * FROM t WHERE name = 'O''Brien'",
+     {"n": "O'Brien"}, "SELECT * FROM t WHERE name = :param_0"),
+    ("SELECT 5::int, :limit FROM t WHERE x = 5",
+     {"n": 5}, "SELECT :param_0::int, :limit FROM t WHERE x = :param_0"),
+    # Missing params are ignored
+    ("SELECT * FROM t WHERE a = 1",
+     {"a": None}, "SELECT * FROM t WHERE a = 1"),
+]
+
+def _legacy_deconstruct(llm_response, original_params, original_param_names_in_order):
+    """The per-value regex implementation deconstruct_sql used before, kept for comparison."""
+    sql = llm_response.get('sql', '')
+    placeholder_to_value_map = {
+        f":param_{i}": original_params.get(key)
+        for i, key in enumerate(original_param_names_in_order)
+        if original_params.get(key) is not None
+    }
+    sql_template = sql
+    for placeholder, value in sorted(placeholder_to_value_map.items(), key=lambda item: len(str(item[1])), reverse=True):
+        escaped_value = re.escape(str(value))
+        pattern = re.compile(
+            f"'(?P<leading>[%_]*){escaped_value}(?P<trailing>[%_]*)'|"
+            f"'(?P<quoted>{escaped_value})'|"
+            f"\\b(?P<bare>{escaped_value})\\b"
+        )
+
+        def replacer(match):
+            if match.group("leading") is not None or match.group("trailing") is not None:
+                return f"'{match.group('leading') or ''}' || {placeholder} || '{match.group('trailing') or ''}'"
+            return placeholder
+
+        sql_template = pattern.sub(replacer, sql_template)
+    return sql_template, original_param_names_in_order
+
+def check_corpus() -> int:
+    failures = 0
+    for sql, params, expected in CORPUS:
+        template, _ = deconstruct_sql({"sql": sql}, params, list(params))
+        legacy, _ = _legacy_deconstruct({"sql": sql}, params, list(params))
+        if template != expected:
+            failures += 1
+            print(f"FAIL  {sql}\n      expected: {expected}\n      got:      {template}")
+        elif legacy != expected:
+            print(f"fixed {sql}\n      legacy:   {legacy}")
+    print(f"{len(CORPUS) - failures}/{len(CORPUS)} corpus cases pass.")
+    return failures
+
+def _long_statement(columns: int):
+    conditions = " AND ".join(f"c{i} = {i * 7}" for i in range(columns))
+    likes = " OR ".join(f"name{i} ILIKE '%v{i}%'" for i in range(columns))
+    sql = f"SELECT {', '.join(f'c{i}' for i in range(columns))} FROM wide WHERE {conditions} AND ({likes})"
+    params = {f"n{i}": i * 7 for i in range(columns)}
+    params.update({f"s{i}": f"v{i}" for i in range(columns)})
+    return sql, params
+
+def benchmark():
+    short_sql, short_params, _ = CORPUS[2]
+    cases = [("short, 2 params", short_sql, short_params)]
+    for columns in (10, 50):
+        sql, params = _long_statement(columns)
+        cases.append((f"{len(sql)} chars, {len(params)} params", sql, params))
+
+    print(f"{'case':<28}{'legacy (ms)':>14}{'single-pass (ms)':>20}{'speedup':>10}")
+    for name, sql, params in cases:
+        names = list(params)
+        number = max(1, 2000 // len(names))
+        legacy = timeit.timeit(lambda: _legacy_deconstruct({"sql": sql}, params, names), number=number) / number
+        current = timeit.timeit(lambda: deconstruct_sql({"sql": sql}, params, names), number=number) / number
+        print(f"{name:<28}{legacy * 1000:>14.3f}{current * 1000:>20.3f}{legacy / current:>9.1f}x")
+
+if __name__ == "__main__":
+    if check_corpus():
+        sys.exit(1)
+    benchmark()
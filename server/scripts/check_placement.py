@@ -0,0 +1,130 @@
+# scripts/check_placement.py
+"""
+End-to-end check of tenant database placement across two Postgres servers.
+
+    cd server && DATABASE_SERVERS=pg2=localhost:5433 python -m scripts.check_placement
+
+Needs the API's usual environment (POSTGRES_*, etc.) plus a second Postgres
+instance, with the same roles, listed in DATABASE_SERVERS; the first entry is
+used. Runs the app in-process and checks that:
+
+- both servers get registered at startup;
+- the "pinned" policy places a new database on each server, and its physical
+  database exists only there;
+- queries, schema changes and transactions go to the database's own server;
+- dropping a database on the non-default server removes it from that server.
+
+Exits non-zero on the first failed check.
+"""
+import sys
+import time
+import uuid
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.pool import NullPool
+
+from app.core.config import settings
+
+JOB_TIMEOUT_SECONDS = 60
+
+def _check(condition: bool, what: str):
+    if not condition:
+        raise AssertionError(what)
+    print(f"ok  {what}")
+
+def _second_server_id() -> str:
+    for entry in settings.DATABASE_SERVERS.split(","):
+        server_id = entry.strip().partition("=")[0].strip()
+        if server_id:
+            return server_id
+    raise SystemExit("Set DATABASE_SERVERS to a second server, e.g. DATABASE_SERVERS=pg2=localhost:5433.")
+
+def _run_checks(client, second: str):
+    from app.db.engine import DEFAULT_SERVER_ID
+    from app.db.session import SessionLocal, get_superuser_engine
+    from app.models.virtual_database_model import VirtualDatabase
+    from app.services import admin_job_service
+
+    def exists_on(server_id: str, physical_name: str) -> bool:
+        with get_superuser_engine(server_id).connect() as conn:
+            return conn.execute(
+                text("SELECT 1 FROM pg_database WHERE datname = :name"), {"name": physical_name}
+            ).scalar() is not None
+
+    def table_on(server_id: str, physical_name: str, table: str) -> bool:
+        url = get_superuser_engine(server_id).url.set(database=physical_name)
+        tenant = create_engine(url, poolclass=NullPool)
+        try:
+            with tenant.connect() as conn:
+                return conn.execute(text("SELECT to_regclass(:table)"), {"table": table}).scalar() is not None
+        finally:
+            tenant.dispose()
+
+    placement = client.get("/health/placement").json()
+    registered = {server["id"] for server in placement["servers"]}
+    _check({DEFAULT_SERVER_ID, second} <= registered, f"servers registered: {sorted(registered)}")
+
+    email = f"placement-{uuid.uuid4().hex[:8]}@example.com"
+    r = client.post("/auth/signup", json={"email": email, "name": "placement check", "password": "placement-1"})
+    _check(r.status_code == 201, f"signup ({r.status_code})")
+    user_id = r.json()["user_id"]
+    auth = {"Authorization": f"Bearer {r.json()['api_key']}"}
+
+    settings.DATABASE_PLACEMENT_POLICY = "pinned"
+    placed = {}
+    for server_id in (DEFAULT_SERVER_ID, second):
+        settings.DATABASE_PINNED_SERVER = server_id
+        name = f"placed_{server_id}"
+        r = client.post("/api/databases/", headers=auth, json={"virtual_name": name})
+        _check(r.status_code in (200, 201), f"create '{name}' pinned to '{server_id}' ({r.status_code})")
+        db = SessionLocal()
+        try:
+            virtual_db = db.query(VirtualDatabase).filter_by(user_id=user_id, virtual_name=name).one()
+            placed[server_id] = (name, virtual_db.physical_name, virtual_db.server_id)
+        finally:
+            db.close()
+
+    for server_id, (name, physical_name, recorded) in placed.items():
+        other = second if server_id == DEFAULT_SERVER_ID else DEFAULT_SERVER_ID
+        _check(recorded == server_id, f"'{name}' is recorded on '{server_id}'")
+        _check(exists_on(server_id, physical_name) and not exists_on(other, physical_name),
+               f"'{name}' exists on '{server_id}' only")
+
+        headers = {**auth, "X-Target-Database": name}
+        query = lambda command, extra={}: client.post("/api/query/", headers={**headers, **extra}, json={"command": command})
+        _check(query("CREATE TABLE placed (id int);").status_code == 200, f"create a table in '{name}'")
+        _check(table_on(server_id, physical_name, "placed"), f"the table was created on '{server_id}'")
+        tx_id = client.post("/api/transaction/begin", headers=headers).json()["transaction_id"]
+        query("INSERT INTO placed VALUES (1), (2);", {"X-Transaction-ID": tx_id})
+        client.post("/api/transaction/commit", headers={**headers, "X-Transaction-ID": tx_id})
+        r = query("SELECT count(*) AS n FROM placed;")
+        _check(r.status_code == 200 and r.json()["result"]["data"][0]["n"] == 2,
+               f"a transaction and a query in '{name}' see the same rows")
+        r = client.get("/api/schema/tables", headers=headers)
+        _check(r.status_code == 200 and "placed" in str(r.json()), f"schema of '{name}' is read from '{server_id}'")
+
+    name, physical_name, _ = placed[second]
+    settings.ADMIN_JOB_OFF_PEAK_HOURS = ""
+    r = client.post("/api/query/", headers={**auth, "X-Target-Database": name}, json={"command": f"DROP DATABASE {name};"})
+    _check(r.status_code == 200, f"drop '{name}' ({r.status_code})")
+    deadline = time.monotonic() + JOB_TIMEOUT_SECONDS
+    while exists_on(second, physical_name) and time.monotonic() < deadline:
+        admin_job_service.run_due_jobs()
+        time.sleep(0.5)
+    _check(not exists_on(second, physical_name), f"'{name}' was dropped from '{second}'")
+
+def main() -> int:
+    second = _second_server_id()
+    from fastapi.testclient import TestClient
+    from app.main import app
+    try:
+        with TestClient(app) as client:
+            _run_checks(client, second)
+    except AssertionError as e:
+        print(f"FAIL {e}")
+        return 1
+    print("All placement checks passed.")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,125 @@
+# scripts/check_transaction_routing.py
+"""
+End-to-end check that interactive transactions work across API workers.
+
+    cd server && python -m scripts.check_transaction_routing
+
+Starts one transaction broker and two single-worker uvicorn instances on free
+local ports (all sharing TRANSACTION_BROKERS), so consecutive requests are
+guaranteed to land on different processes. It then opens transactions on one
+worker and uses, commits and rolls them back on the other, and exits non-zero
+if any step fails, e.g. with the 404 a worker returns for a transaction it
+cannot reach. Needs the API's usual environment (POSTGRES_*, etc.).
+"""
+import os
+import socket
+import subprocess
+import sys
+import time
+import uuid
+
+import httpx
+
+STARTUP_TIMEOUT_SECONDS = 60
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def _wait_for_port(port: int, proc: subprocess.Popen):
+    deadline = time.monotonic() + STARTUP_TIMEOUT_SECONDS
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"Process on port {port} exited with code {proc.returncode}.")
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.5):
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"Nothing listening on port {port} after {STARTUP_TIMEOUT_SECONDS}s.")
+
+def _check(condition: bool, what: str):
+    if not condition:
+        raise AssertionError(what)
+    print(f"ok  {what}")
+
+def _run_checks(worker_a: httpx.Client, worker_b: httpx.Client):
+    email = f"txcheck-{uuid.uuid4().hex[:8]}@example.com"
+    r = worker_a.post("/auth/signup", json={"email": email, "name": "tx check", "password": "tx-check-1"})
+    _check(r.status_code == 201, f"signup on worker A ({r.status_code})")
+    headers = {"Authorization": f"Bearer {r.json()['api_key']}", "X-Target-Database": "fastdb"}
+    table = f"tx_check_{uuid.uuid4().hex[:8]}"
+
+    def query(client: httpx.Client, command: str, tx_id: str | None = None) -> httpx.Response:
+        extra = {"X-Transaction-ID": tx_id} if tx_id else {}
+        return client.post("/api/query/", json={"command": command}, headers={**headers, **extra})
+
+    def count(client: httpx.Client) -> int:
+        r = query(client, f"SELECT count(*) AS n FROM {table};")
+        return r.json()["result"]["data"][0]["n"]
+
+    _check(query(worker_a, f"CREATE TABLE {table} (id int);").status_code == 200, "create table on worker A")
+
+    # BEGIN on A, statements and COMMIT on B.
+    r = worker_a.post("/api/transaction/begin", headers=headers)
+    _check(r.status_code == 201, f"begin on worker A ({r.status_code})")
+    tx_id = r.json()["transaction_id"]
+    for i in range(3):
+        r = query(worker_b, f"INSERT INTO {table} VALUES ({i});", tx_id)
+        _check(r.status_code == 200, f"insert {i} inside the transaction on worker B ({r.status_code})")
+    _check(count(worker_a) == 0, "uncommitted rows are invisible outside the transaction")
+    r = worker_b.post("/api/transaction/commit", headers={**headers, "X-Transaction-ID": tx_id})
+    _check(r.status_code == 200, f"commit on worker B ({r.status_code})")
+    _check(count(worker_a) == 3, "committed rows are visible on worker A")
+    r = worker_a.post("/api/transaction/commit", headers={**headers, "X-Transaction-ID": tx_id})
+    _check(r.status_code == 404, f"a finished transaction is gone on every worker ({r.status_code})")
+
+    # BEGIN on B, statements on A, ROLLBACK on A.
+    tx_id = worker_b.post("/api/transaction/begin", headers=headers).json()["transaction_id"]
+    r = query(worker_a, f"INSERT INTO {table} VALUES (99);", tx_id)
+    _check(r.status_code == 200, f"insert inside a transaction begun on worker B, on worker A ({r.status_code})")
+    r = worker_a.post("/api/transaction/rollback", headers={**headers, "X-Transaction-ID": tx_id})
+    _check(r.status_code == 200, f"rollback on worker A ({r.status_code})")
+    _check(count(worker_b) == 3, "rolled back rows were discarded")
+
+    query(worker_a, f"DROP TABLE {table};")
+
+def main() -> int:
+    broker_port, port_a, port_b = _free_port(), _free_port(), _free_port()
+    env = {**os.environ, "TRANSACTION_BROKERS": f"127.0.0.1:{broker_port}"}
+    procs = []
+    try:
+        broker = subprocess.Popen(
+            [sys.executable, "-m", "app.core.transaction_broker", "--port", str(broker_port)],
+            env=env, stdout=subprocess.DEVNULL,
+        )
+        procs.append(broker)
+        _wait_for_port(broker_port, broker)
+        for port in (port_a, port_b):
+            worker = subprocess.Popen(
+                [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--workers", "1"],
+                env=env, stdout=subprocess.DEVNULL,
+            )
+            procs.append(worker)
+            _wait_for_port(port, worker)
+
+        with httpx.Client(base_url=f"http://127.0.0.1:{port_a}", timeout=30) as worker_a, \
+             httpx.Client(base_url=f"http://127.0.0.1:{port_b}", timeout=30) as worker_b:
+            _run_checks(worker_a, worker_b)
+    except (AssertionError, RuntimeError, httpx.HTTPError) as e:
+        print(f"FAIL {e}")
+        return 1
+    finally:
+        for proc in procs:
+            proc.terminate()
+        for proc in procs:
+            try:
+                proc.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+    print("All transaction routing checks passed.")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())